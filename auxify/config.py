@@ -1,18 +1,44 @@
 from __future__ import annotations
 
 import rapidjson
-from typing import Tuple
+from typing import Tuple, Dict, List, Optional, TypeVar
+from contextlib import asynccontextmanager
 from jsonschema import validate
 from jwcrypto import jwk
-from os import getenv
+from os import getenv, cpu_count
 import logging
 from aiosqlite import Connection, connect, Row
 import aiohttp
 
-from auxify.utils import jwt
+from auxify.utils import jwt, log, metrics
+from auxify.utils.profiling import RequestProfiler
+from auxify.external import spotify_api
 from auxify.external.spotify_api import SpotifyApi
+from auxify.external.circuit_breaker import CircuitBreaker
+from auxify.models.shards import RoomShards, ShardConnections, RoomWriteOp
+from auxify.models.write_coalescer import WriteCoalescer, WriteOp
 
 ENV_LOG_LEVEL = "LOG_LEVEL"
+T = TypeVar("T")
+# environment variables overriding the server section, e.g. AUXIFY_WORKERS=4
+ENV_SERVER_PREFIX = "AUXIFY_"
+
+rate_limit_schema = {
+    "type": "object",
+    "properties": {
+        "rate": {"type": "number", "exclusiveMinimum": 0}, # tokens added per second
+        "burst": {"type": "number", "minimum": 1} # bucket capacity
+    },
+    "required": ["rate", "burst"]
+}
+
+route_rate_limits_schema = {
+    "type": "object",
+    "properties": {
+        "user": rate_limit_schema,
+        "room": rate_limit_schema
+    }
+}
 
 config_schema = {
     "type": "object",
@@ -36,13 +62,397 @@ config_schema = {
         "db": {
             "type": "object",
             "properties": {
-                "location": {"type": "string"}
+                "location": {"type": "string"},
+                # database files to split rooms and their members across, by room_id
+                "room_shards": {"type": "array", "items": {"type": "string"}, "minItems": 1}
             },
             "required": ["location"]
+        },
+        "maintenance": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "quiet_seconds": {"type": "number", "minimum": 0},
+                "max_wait_seconds": {"type": "number", "minimum": 0},
+                "full_analyze": {"type": "boolean"},
+                "analysis_limit": {"type": ["integer", "null"], "minimum": 0},
+                "checkpoint_mode": {"enum": ["PASSIVE", "FULL", "RESTART", "TRUNCATE"]},
+                "vacuum_pages": {"type": "integer", "minimum": 0}
+            }
+        },
+        "archive": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "inactive_days": {"type": "number", "minimum": 0},
+                "batch_size": {"type": "integer", "minimum": 1},
+                "batch_pause_seconds": {"type": "number", "minimum": 0},
+                "max_batches_per_run": {"type": "integer", "minimum": 1}
+            }
+        },
+        "room_expiry": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "ttl_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "batch_size": {"type": "integer", "minimum": 1}
+            }
+        },
+        "invites": {
+            "type": "object",
+            "properties": {
+                "duration_seconds": {"type": "number", "exclusiveMinimum": 0}
+            }
+        },
+        "room_cache": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "inactive_rooms_maxsize": {"type": "integer", "minimum": 1},
+                # missing rooms, owners without an active room and users without a Spotify token
+                "negative_maxsize": {"type": "integer", "minimum": 1},
+                "negative_ttl_seconds": {"type": "number", "exclusiveMinimum": 0}
+            }
+        },
+        "search_cache": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "maxsize": {"type": "integer", "minimum": 1},
+                "ttl_seconds": {"type": "number", "minimum": 0},
+                "min_results": {"type": "integer", "minimum": 1},
+                "debounce_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "track_store": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "batch_size": {"type": "integer", "minimum": 1},
+                "max_pending": {"type": "integer", "minimum": 0}
+            }
+        },
+        "now_playing": {
+            "type": "object",
+            "properties": {
+                "min_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "playing_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "paused_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "idle_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "error_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "track_end_margin_seconds": {"type": "number", "minimum": 0},
+                "idle_timeout_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "first_poll_timeout_seconds": {"type": "number", "exclusiveMinimum": 0}
+            }
+        },
+        "enqueue_dedup": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "maxsize": {"type": "integer", "minimum": 1},
+                "idempotency_ttl_seconds": {"type": "number", "minimum": 0},
+                "duplicate_window_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "admin": {
+            "type": "object",
+            "properties": {
+                "api_key": {"type": "string", "minLength": 16}
+            }
+        },
+        "rate_limits": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "max_buckets": {"type": "integer", "minimum": 1},
+                # peer addresses of reverse proxies whose X-Forwarded-For header gives the client address
+                "trusted_proxies": {"type": "array", "items": {"type": "string"}},
+                # keyed by canonical route, e.g. /rooms/{room_id}/search
+                "routes": {"type": "object", "additionalProperties": route_rate_limits_schema},
+                "default": route_rate_limits_schema
+            }
+        },
+        "logging": {
+            "type": "object",
+            "properties": {
+                "format": {"enum": ["text", "json"]},
+                # at most repeat_burst identical messages per repeat_window_seconds; 0 disables the limit
+                "repeat_window_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "repeat_burst": {"type": "integer", "minimum": 0},
+                # records waiting for the listener thread; more are dropped
+                "max_queued": {"type": "integer", "minimum": 1}
+            }
+        },
+        "admission": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "retry_after_seconds": {"type": "number", "minimum": 0},
+                # keyed by canonical route, e.g. /rooms/{room_id}/search
+                "routes": {"type": "object", "additionalProperties": {
+                    "type": "object",
+                    "properties": {
+                        "concurrency": {"type": "integer", "minimum": 1},
+                        "max_queue": {"type": "integer", "minimum": 0},
+                        "queue_timeout_seconds": {"type": "number", "minimum": 0}
+                    },
+                    "required": ["concurrency", "max_queue", "queue_timeout_seconds"]
+                }}
+            }
+        },
+        "circuit_breaker": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "failure_threshold": {"type": "integer", "minimum": 1},
+                "reset_timeout_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "profile_cache": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "maxsize": {"type": "integer", "minimum": 1},
+                "ttl_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "room_snapshots": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "maxsize": {"type": "integer", "minimum": 1},
+                "ttl_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "server": {
+            "type": "object",
+            "properties": {
+                "host": {"type": "string"},
+                "port": {"type": "integer", "minimum": 0, "maximum": 65535},
+                "workers": {"type": "integer", "minimum": 0}, # 0 for one per CPU
+                "uvloop": {"type": "boolean"},
+                "reuse_port": {"type": "boolean"},
+                "backlog": {"type": "integer", "minimum": 1},
+                "keepalive_timeout_seconds": {"type": "number", "minimum": 0},
+                "max_requests": {"type": "integer", "minimum": 0}, # 0 never recycles workers
+                "max_requests_jitter": {"type": "integer", "minimum": 0},
+                "graceful_timeout_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "loop_monitor": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "sample_interval_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "window": {"type": "integer", "minimum": 1},
+                # debug mode: log the stack and route of callbacks blocking the loop
+                "detect_blocking": {"type": "boolean"},
+                "blocking_threshold_seconds": {"type": "number", "exclusiveMinimum": 0},
+                "check_interval_seconds": {"type": "number", "exclusiveMinimum": 0}
+            }
+        },
+        "write_coalescing": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                "max_batch": {"type": "integer", "minimum": 1},
+                # how long the writer waits for more writes after the first of a batch
+                "max_delay_seconds": {"type": "number", "minimum": 0}
+            }
+        },
+        "profiling": {
+            "type": "object",
+            "properties": {
+                "enabled": {"type": "boolean"},
+                # fraction of requests to the routes below profiled without asking
+                "sample_rate": {"type": "number", "minimum": 0, "maximum": 1},
+                # canonical routes, e.g. /rooms/{room_id}; empty for every route
+                "routes": {"type": "array", "items": {"type": "string"}},
+                "directory": {"type": "string"},
+                "max_profiles": {"type": "integer", "minimum": 1},
+                "sample_interval_seconds": {"type": "number", "exclusiveMinimum": 0}
+            }
         }
     }
 }
 
+MAINTENANCE_DEFAULTS = {
+    "enabled": True,
+    "interval_seconds": 6 * 60 * 60,
+    "quiet_seconds": 30,
+    "max_wait_seconds": 30 * 60,
+    "full_analyze": False,
+    "analysis_limit": 1000,
+    "checkpoint_mode": "PASSIVE",
+    "vacuum_pages": 2000
+}
+
+ARCHIVE_DEFAULTS = {
+    "enabled": True,
+    "interval_seconds": 60 * 60,
+    "inactive_days": 7,
+    "batch_size": 200,
+    "batch_pause_seconds": 0.05,
+    "max_batches_per_run": 500
+}
+
+ROOM_EXPIRY_DEFAULTS = {
+    "enabled": True,
+    "interval_seconds": 60,
+    "ttl_seconds": 12 * 60 * 60,
+    "batch_size": 500
+}
+
+INVITE_DEFAULTS = {
+    "duration_seconds": 12 * 60 * 60
+}
+
+ROOM_CACHE_DEFAULTS = {
+    "enabled": True,
+    "inactive_rooms_maxsize": 100_000,
+    "negative_maxsize": 100_000,
+    # bounds how long another worker can miss a new room or Spotify token
+    "negative_ttl_seconds": 15
+}
+
+SEARCH_CACHE_DEFAULTS = {
+    "enabled": True,
+    "maxsize": 5000,
+    "ttl_seconds": 10 * 60,
+    "min_results": 5,
+    "debounce_seconds": 0
+}
+
+TRACK_STORE_DEFAULTS = {
+    "enabled": True,
+    "interval_seconds": 5,
+    "batch_size": 500,
+    "max_pending": 50_000
+}
+
+NOW_PLAYING_DEFAULTS = {
+    "min_interval_seconds": 1,
+    "playing_interval_seconds": 10,
+    "paused_interval_seconds": 15,
+    "idle_interval_seconds": 30,
+    "error_interval_seconds": 30,
+    "track_end_margin_seconds": 0.5,
+    "idle_timeout_seconds": 60,
+    "first_poll_timeout_seconds": 5
+}
+
+RATE_LIMIT_DEFAULTS = {
+    "enabled": True,
+    "max_buckets": 100_000,
+    "trusted_proxies": ["127.0.0.1", "::1"],
+    "routes": {
+        "/rooms/{room_id}/search": {
+            "user": {"rate": 5, "burst": 20},
+            "room": {"rate": 20, "burst": 60}
+        },
+        "/rooms/{room_id}/queue": {
+            "user": {"rate": 1, "burst": 5},
+            "room": {"rate": 5, "burst": 20}
+        },
+        "/rooms/{room_id}/join": {
+            "user": {"rate": 1, "burst": 10}
+        },
+        "/login": {
+            "user": {"rate": 0.5, "burst": 10}
+        },
+        "/register": {
+            "user": {"rate": 0.2, "burst": 5}
+        }
+    },
+    "default": {}
+}
+
+ENQUEUE_DEDUP_DEFAULTS = {
+    "enabled": True,
+    "maxsize": 20_000,
+    "idempotency_ttl_seconds": 10 * 60,
+    "duplicate_window_seconds": 30
+}
+
+LOGGING_DEFAULTS = {
+    "format": "text",
+    "repeat_window_seconds": 60,
+    "repeat_burst": 10,
+    "max_queued": 10_000
+}
+
+ADMISSION_DEFAULTS = {
+    "enabled": True,
+    "retry_after_seconds": 2,
+    # the routes waiting on Spotify
+    "routes": {
+        "/rooms/{room_id}/search": {"concurrency": 64, "max_queue": 128, "queue_timeout_seconds": 5},
+        "/rooms/{room_id}/queue": {"concurrency": 32, "max_queue": 64, "queue_timeout_seconds": 5}
+    }
+}
+
+CIRCUIT_BREAKER_DEFAULTS = {
+    "enabled": True,
+    "failure_threshold": 5,
+    "reset_timeout_seconds": 30
+}
+
+PROFILE_CACHE_DEFAULTS = {
+    "enabled": True,
+    "maxsize": 50_000,
+    # bounds staleness across worker processes, which do not see each other's invalidations
+    "ttl_seconds": 60
+}
+
+ROOM_SNAPSHOT_DEFAULTS = {
+    "enabled": True,
+    "maxsize": 10_000,
+    # bounds how long membership changes made through other workers take to show;
+    # whether the room is active is read from the database on every request
+    "ttl_seconds": 30
+}
+
+SERVER_DEFAULTS = {
+    "host": "0.0.0.0",
+    "port": 8080,
+    "workers": 0,
+    "uvloop": True,
+    "reuse_port": True,
+    "backlog": 1024,
+    "keepalive_timeout_seconds": 75,
+    "max_requests": 0,
+    "max_requests_jitter": 0,
+    "graceful_timeout_seconds": 30
+}
+
+LOOP_MONITOR_DEFAULTS = {
+    "enabled": False,
+    "sample_interval_seconds": 0.25,
+    "window": 2400,
+    "detect_blocking": False,
+    "blocking_threshold_seconds": 0.1,
+    "check_interval_seconds": 0.02
+}
+
+WRITE_COALESCING_DEFAULTS = {
+    "enabled": True,
+    "max_batch": 200,
+    "max_delay_seconds": 0.002
+}
+
+PROFILING_DEFAULTS = {
+    "enabled": True,
+    "sample_rate": 0.0,
+    "routes": [],
+    "directory": "profiles",
+    "max_profiles": 50,
+    "sample_interval_seconds": 0.005
+}
+
 
 class Config:
     _config = None
@@ -63,41 +473,217 @@ class Config:
             validate(schema=config_schema, instance=self.data)
 
         self.jwk = jwt.key_from_secret(self.data["jwt"]["secret"])
-        self.session = aiohttp.ClientSession()
+        # created on first use, in the process and event loop that use it
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._spotify_breakers: Optional[Dict[str, CircuitBreaker]] = None
+        # by database location
+        self._write_coalescers: Dict[str, WriteCoalescer] = {}
+        shard_locations = self.data["db"].get("room_shards")
+        self._room_shards = RoomShards(shard_locations) if shard_locations else None
+        self._request_profiler: Optional[RequestProfiler] = None
+        # every request asks for the profiler, so whether there is one is only worked out once
+        self._request_profiler_resolved = False
 
     def database_location(self) -> str:
         return self.data["db"]["location"]
 
+    def room_shards(self)-> Optional[RoomShards]:
+        """The database files rooms are split across, or None when rooms are kept in the main database"""
+        return self._room_shards
+
+    def room_database_locations(self)-> List[str]:
+        """The database files holding rooms: the room shards, or the main database"""
+        return self._room_shards.locations if self._room_shards is not None else [self.database_location()]
+
     def jwt_key(self) -> jwk.JWK:
         return self.jwk
 
-    @staticmethod
-    def configure_logging():
+    def _settings(self, section: str, defaults: Dict)-> Dict:
+        """Settings for an optional config section, falling back to defaults for missing keys"""
+        return {**defaults, **self.data.get(section, {})}
+
+    def maintenance_settings(self)-> Dict:
+        return self._settings("maintenance", MAINTENANCE_DEFAULTS)
+
+    def archive_settings(self)-> Dict:
+        return self._settings("archive", ARCHIVE_DEFAULTS)
+
+    def room_expiry_settings(self)-> Dict:
+        return self._settings("room_expiry", ROOM_EXPIRY_DEFAULTS)
+
+    def invite_settings(self)-> Dict:
+        return self._settings("invites", INVITE_DEFAULTS)
+
+    def room_cache_settings(self)-> Dict:
+        return self._settings("room_cache", ROOM_CACHE_DEFAULTS)
+
+    def search_cache_settings(self)-> Dict:
+        return self._settings("search_cache", SEARCH_CACHE_DEFAULTS)
+
+    def track_store_settings(self)-> Dict:
+        return self._settings("track_store", TRACK_STORE_DEFAULTS)
+
+    def now_playing_settings(self)-> Dict:
+        return self._settings("now_playing", NOW_PLAYING_DEFAULTS)
+
+    def enqueue_dedup_settings(self)-> Dict:
+        return self._settings("enqueue_dedup", ENQUEUE_DEDUP_DEFAULTS)
+
+    def rate_limit_settings(self)-> Dict:
+        return self._settings("rate_limits", RATE_LIMIT_DEFAULTS)
+
+    def admin_api_key(self)-> Optional[str]:
+        """Key required by admin endpoints; they are disabled when it is not configured"""
+        return self.data.get("admin", {}).get("api_key")
+
+    def logging_settings(self)-> Dict:
+        return self._settings("logging", LOGGING_DEFAULTS)
+
+    def admission_settings(self)-> Dict:
+        return self._settings("admission", ADMISSION_DEFAULTS)
+
+    def circuit_breaker_settings(self)-> Dict:
+        return self._settings("circuit_breaker", CIRCUIT_BREAKER_DEFAULTS)
+
+    def spotify_breakers(self)-> Dict[str, CircuitBreaker]:
+        """One circuit breaker per Spotify endpoint family, shared by every SpotifyApi"""
+        if self._spotify_breakers is None:
+            settings = self.circuit_breaker_settings()
+            self._spotify_breakers = {}
+            if settings["enabled"]:
+                self._spotify_breakers = {
+                    family: CircuitBreaker(f"spotify {family}", settings["failure_threshold"], settings["reset_timeout_seconds"])
+                    for family in spotify_api.FAMILIES
+                }
+            breakers = self._spotify_breakers
+            metrics.register_gauge("spotify_circuits", lambda: {family: breaker.stats() for family, breaker in breakers.items()})
+        return self._spotify_breakers
+
+    def profile_cache_settings(self)-> Dict:
+        return self._settings("profile_cache", PROFILE_CACHE_DEFAULTS)
+
+    def room_snapshot_settings(self)-> Dict:
+        return self._settings("room_snapshots", ROOM_SNAPSHOT_DEFAULTS)
+
+    def server_settings(self)-> Dict:
+        """Settings for the production server, from the server section overridden by the environment"""
+        settings = self._settings("server", SERVER_DEFAULTS)
+        for key, default in SERVER_DEFAULTS.items():
+            value = getenv(ENV_SERVER_PREFIX + key.upper())
+            if value is None:
+                continue
+            if isinstance(default, bool):
+                settings[key] = value.lower() in ("1", "true", "yes")
+            else:
+                settings[key] = type(default)(value)
+        if not settings["workers"]:
+            settings["workers"] = cpu_count() or 1
+        return settings
+
+    def loop_monitor_settings(self)-> Dict:
+        return self._settings("loop_monitor", LOOP_MONITOR_DEFAULTS)
+
+    def write_coalescing_settings(self)-> Dict:
+        return self._settings("write_coalescing", WRITE_COALESCING_DEFAULTS)
+
+    def write_coalescer(self, location: Optional[str] = None)-> Optional[WriteCoalescer]:
+        """The write coalescer for a database file, the main database by default; each file has its own writer"""
+        settings = self.write_coalescing_settings()
+        location = location or self.database_location()
+        coalescer = self._write_coalescers.get(location)
+        if coalescer is None and settings["enabled"]:
+            coalescer = WriteCoalescer(location, settings["max_batch"], settings["max_delay_seconds"])
+            self._write_coalescers[location] = coalescer
+            name = "write_coalescer" if location == self.database_location() else f"write_coalescer {location}"
+            metrics.register_gauge(name, coalescer.stats)
+        return coalescer
+
+    def profiling_settings(self)-> Dict:
+        return self._settings("profiling", PROFILING_DEFAULTS)
+
+    def request_profiler(self)-> Optional[RequestProfiler]:
+        """Profiles requests when profiling is enabled and admin endpoints are configured to read them"""
+        if not self._request_profiler_resolved:
+            settings = self.profiling_settings()
+            if settings["enabled"] and self.admin_api_key():
+                self._request_profiler = RequestProfiler(
+                    settings["directory"], settings["max_profiles"], settings["sample_rate"], settings["routes"],
+                    settings["sample_interval_seconds"])
+                metrics.register_gauge("request_profiler", self._request_profiler.stats)
+            self._request_profiler_resolved = True
+        return self._request_profiler
+
+    @classmethod
+    def configure_logging(cls, queued: bool = True):
+        """
+        Log through the queue listener, or straight to the stream when not queued, as the
+        supervisor does so that its workers are not forked with the listener thread running
+        """
         try:
             loglevel_str = getenv(ENV_LOG_LEVEL, "INFO")
             loglevel = getattr(logging, loglevel_str)
         except:
             loglevel = logging.INFO
-        
-        logging.basicConfig(level=loglevel)
 
-    def get_database_connection(self)-> Connection:
+        settings = cls.get_config().logging_settings()
+        if not queued:
+            log.configure_stream_logging(loglevel, json_format=settings["format"] == "json")
+            return
+        log.configure_queue_logging(
+            loglevel,
+            json_format=settings["format"] == "json",
+            repeat_window_seconds=settings["repeat_window_seconds"],
+            repeat_burst=settings["repeat_burst"],
+            max_queued=settings["max_queued"]
+        )
+
+    def get_database_connection(self, location: Optional[str] = None)-> Connection:
         
         def set_row_factory(conn):
             conn.row_factory = Row
         
-        return DbConnectionWrapper(connect(self.database_location()), set_row_factory)
+        return DbConnectionWrapper(connect(location or self.database_location()), set_row_factory)
+
+    def get_room_database(self, db: Optional[Connection] = None):
+        """
+        What RoomPersistence reads and writes rooms through, as an async context manager:
+        connections to the room shards, opened as they are used, or a connection to the
+        main database when rooms are not sharded, which may be db if one is already open
+        """
+        if self._room_shards is not None:
+            return self._room_shards.connect()
+        if db is not None:
+            return _already_open(db)
+        return self.get_database_connection()
+
+    async def write(self, op: WriteOp[T], location: Optional[str] = None)-> T:
+        """Run a write op, committed in a batch with other requests' writes when write coalescing is enabled"""
+        coalescer = self.write_coalescer(location)
+        if coalescer is None:
+            async with self.get_database_connection(location) as db:
+                return await op(db)
+        return await coalescer.write(op)
+
+    async def write_room(self, room_id: int, op: RoomWriteOp[T])-> T:
+        """Run a write op against the database holding the room, as write does against the main database"""
+        if self._room_shards is None:
+            return await self.write(op)
+        shards = self._room_shards
+        shard = shards.of_room(room_id)
+        return await self.write(lambda db: op(ShardConnections.single(db, shard, shards.count)), shards.locations[shard])
 
     def get_session(self)-> aiohttp.ClientSession:
-        if self.session.closed:
+        if self.session is None or self.session.closed:
             self.session = aiohttp.ClientSession()
         return self.session
 
     def get_spotify_api(self)-> SpotifyApi:
-        return SpotifyApi(self.get_session(), self.spotify_client_id(), self.spotify_secret())
+        return SpotifyApi(self.get_session(), self.spotify_client_id(), self.spotify_secret(), self.spotify_breakers())
 
     async def deferred_cleanup(self, _app):
         yield
+        for coalescer in self._write_coalescers.values():
+            await coalescer.close()
         if self.session and not self.session.closed:
             await self.session.close()
 
@@ -111,6 +697,12 @@ class Config:
         return self.data["spotify"]["redirect_url"]
 
 
+@asynccontextmanager
+async def _already_open(db: Connection):
+    """db as an async context manager that leaves it open; contextlib.nullcontext is only async from 3.10"""
+    yield db
+
+
 class DbConnectionWrapper(Connection):
     """A wrapper around the aiosqlite.Connection that calls an 
     arbitrary function on __aenter__"""
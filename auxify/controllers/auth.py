@@ -2,16 +2,18 @@ import logging
 from typing import Dict
 from sqlite3 import IntegrityError
 import bcrypt
-import asyncio
+from aiohttp.web_exceptions import HTTPException
 
 from auxify.config import Config
 from auxify.utils import jwt
 from auxify.models import users, rooms
-from auxify.controllers import err, spotify
+from auxify.controllers import err, spotify, profile_cache
 
 
 logger = logging.getLogger(__name__)
 
+TOKEN_STATE_KEYS = ("has_token", "has_access_token", "has_refresh_token", "token_created_at", "token_duration_seconds")
+
 async def login(email: str, password: str, config: Config)-> Dict:
     """
     Get user from DB, check password hash matches and return a JWT token if so
@@ -43,10 +45,8 @@ async def register_user(first_name: str, last_name: str, email: str, password: s
 
     password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
     try:
-        async with config.get_database_connection() as db:
-            user_persistence = users.UsersPersistence(db)
-            created_user_id = await user_persistence.create_user(first_name, last_name, email, password_hash)
-            user = await user_persistence.get_user_by_id(created_user_id)
+        created_user_id = await config.write(
+            lambda db: users.UsersPersistence(db).create_user(first_name, last_name, email, password_hash))
     except IntegrityError as e:
         logger.debug("IntegrityError registering user with email %s: %s", email, e)
         raise err.bad_request("Email address is already in use")
@@ -55,25 +55,62 @@ async def register_user(first_name: str, last_name: str, email: str, password: s
         raise err.internal_server_error()    
 
     return {
-        "token": jwt.generate_jwt(user["user_id"], jwt.Aud.AUTH, config.jwt_key())
+        "token": jwt.generate_jwt(created_user_id, jwt.Aud.AUTH, config.jwt_key())
     }
 
 
+def has_usable_token(token_state: Dict)-> bool:
+    """
+    Whether the user's Spotify token can be used as is or refreshed, judged without
+    refreshing it: a refresh that then fails is only discovered when the token is used
+    """
+    if not token_state.get("has_token"):
+        return False
+    if token_state["has_refresh_token"]:
+        return True
+    return bool(token_state["has_access_token"]) and not spotify.is_token_expired({
+        "user_id": token_state["user_id"],
+        "created_at": token_state["token_created_at"],
+        "duration_seconds": token_state["token_duration_seconds"]
+    })
+
+
+async def get_profile(user_id: int, config: Config)-> Dict:
+    """The user, their rooms and their token state, read in one pass over one connection"""
+    cache = profile_cache.get_profile_cache(config)
+    profile = cache.get(user_id) if cache is not None else None
+    if profile is not None:
+        return profile
+
+    async with config.get_database_connection() as db:
+        user = await users.UsersPersistence(db).get_user_with_token_state(user_id)
+        if not user:
+            raise err.not_found(f"No user with id {user_id}")
+        async with config.get_room_database(db) as room_db:
+            joined_rooms = await rooms.RoomPersistence(room_db).get_joined_rooms_by_user(user_id)
+
+    token_state = {key: user[key] for key in TOKEN_STATE_KEYS}
+    user = {key: value for key, value in user.items() if key not in TOKEN_STATE_KEYS}
+    token_state["user_id"] = user_id
+    profile = {"user": user, "rooms": joined_rooms, "token_state": token_state}
+    if cache is not None:
+        cache.set(user_id, profile)
+    return profile
+
+
 async def me(user_id: int, config: Config)-> Dict:
     try:
-        async with config.get_database_connection() as db:
-            get_user = users.UsersPersistence(db).get_user_by_id(user_id)
-            get_joined_rooms = rooms.RoomPersistence(db).get_joined_rooms_by_user(user_id)
-            get_token = spotify.get_valid_token_for_user(user_id, config)
-            (user, joined_rooms, token) = await asyncio.gather(get_user, get_joined_rooms,
-                                                               get_token, return_exceptions=False)
+        profile = await get_profile(user_id, config)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Failed to get user(id=%s) from db: %s", user_id, e)
         raise err.internal_server_error()
-    del user["password_hash"]
-    user["rooms"] = joined_rooms
-    user["authed_with_spotify"] = isinstance(token, str)
-    return user
+    return {
+        **profile["user"],
+        "rooms": profile["rooms"],
+        "authed_with_spotify": has_usable_token(profile["token_state"])
+    }
 
 
 def check_password(password: str) -> bool:
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from auxify.utils import metrics
+from auxify.utils.cache import TTLCache
+
+
+class EnqueueDeduplicator:
+    """
+    Answers repeated enqueue requests without calling Spotify or the database:
+    - a retry carrying an Idempotency-Key already seen gets the original response
+    - a URI already enqueued in the room within duplicate_window_seconds is not enqueued again
+    - a request identical to one still in flight waits for, and shares, that request's response;
+      a failure is only shared with the same user's requests, and other users try on their own
+    Both records are bounded and expire, so memory use is capped. Callers must check that
+    the user may enqueue to the room first, as the responses are shared within the room
+    """
+
+    def __init__(self, maxsize: int, idempotency_ttl_seconds: float, duplicate_window_seconds: float):
+        self.responses = TTLCache(maxsize, idempotency_ttl_seconds)
+        self.recent_uris = TTLCache(maxsize, duplicate_window_seconds)
+        # (room_id, track_uri) -> the enqueue in flight, and the user who made it
+        self._in_flight: Dict[Hashable, Tuple[asyncio.Future, int]] = {}
+
+    async def run(self, user_id: int, room_id: int, track_uri: str, idempotency_key: Optional[str],
+                  enqueue: Callable[[], Awaitable[Dict]])-> Dict:
+        response_key = (user_id, room_id, idempotency_key) if idempotency_key else None
+        if response_key is not None:
+            response = self.responses.get(response_key)
+            if response is not None:
+                metrics.increment("enqueue.idempotent_replays")
+                return response
+
+        uri_key = (room_id, track_uri)
+        if uri_key in self.recent_uris:
+            metrics.increment("enqueue.duplicates_suppressed")
+            return {"success": True, "duplicate": True}
+
+        in_flight = self._in_flight.get(uri_key)
+        if in_flight is not None:
+            future, in_flight_user_id = in_flight
+            try:
+                response = await asyncio.shield(future)
+            except Exception:
+                if in_flight_user_id == user_id:
+                    raise
+            else:
+                metrics.increment("enqueue.duplicates_suppressed")
+                return response
+
+        future = asyncio.ensure_future(enqueue())
+        self._in_flight[uri_key] = (future, user_id)
+        # record the outcome even if this request is cancelled while Spotify is still being called
+        future.add_done_callback(lambda done: self._record(uri_key, response_key, done))
+        return await asyncio.shield(future)
+
+    def _record(self, uri_key: Hashable, response_key: Optional[Hashable], done: asyncio.Future):
+        if self._in_flight.get(uri_key, (None, None))[0] is done:
+            del self._in_flight[uri_key]
+        if done.cancelled() or done.exception() is not None:
+            return
+        self.recent_uris.set(uri_key, True)
+        if response_key is not None:
+            self.responses.set(response_key, done.result())
+
+    def stats(self)-> Dict:
+        return {
+            "idempotency_keys": len(self.responses),
+            "recent_uris": len(self.recent_uris),
+            "in_flight": len(self._in_flight)
+        }
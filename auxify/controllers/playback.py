@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from aiohttp.client_exceptions import ClientResponseError
+
+from auxify.config import Config
+from auxify.controllers import spotify, tracks
+from auxify.external.circuit_breaker import CircuitOpen
+from auxify.utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_from_playback_state(state: Optional[Dict])-> Dict:
+    """The parts of Spotify's playback state shown to room members"""
+    if not state or not state.get("item"):
+        return {"available": True, "is_playing": False, "track": None, "progress_ms": None, "duration_ms": None}
+    return {
+        "available": True,
+        "is_playing": bool(state.get("is_playing")),
+        "track": tracks.track_metadata(state["item"]),
+        "progress_ms": state.get("progress_ms"),
+        "duration_ms": state["item"].get("duration_ms")
+    }
+
+
+def next_poll_interval(snapshot: Dict, settings: Dict)-> float:
+    """Poll slowly while nothing is playing or playback is paused, and just after the current track ends"""
+    if not snapshot.get("available"):
+        return settings["error_interval_seconds"]
+    if not snapshot.get("track"):
+        return settings["idle_interval_seconds"]
+    if not snapshot.get("is_playing"):
+        return settings["paused_interval_seconds"]
+
+    interval = settings["playing_interval_seconds"]
+    if snapshot.get("duration_ms") is not None and snapshot.get("progress_ms") is not None:
+        remaining_seconds = (snapshot["duration_ms"] - snapshot["progress_ms"]) / 1000
+        interval = min(interval, remaining_seconds + settings["track_end_margin_seconds"])
+    return max(settings["min_interval_seconds"], interval)
+
+
+class OwnerPoller:
+    """The latest playback state of one room owner, refreshed by a single poll loop"""
+
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        self.snapshot: Optional[Dict] = None
+        self.fetched_at = 0.0
+        self.last_read = time.monotonic()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Future] = None
+
+
+class PlaybackPoller:
+    """
+    Shares the playback state of each room owner between any number of readers.
+    A poll loop is started for an owner when their state is first read, and stops
+    once nobody has read it for idle_timeout_seconds, so Spotify is called once
+    per active room rather than once per member
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.settings = config.now_playing_settings()
+        self._pollers: Dict[int, OwnerPoller] = {}
+
+    async def _poll_once(self, poller: OwnerPoller)-> float:
+        token = await spotify.get_valid_token_for_user(poller.owner_id, self.config)
+        if not isinstance(token, str):
+            snapshot = {"available": False, "reason": token.value}
+        else:
+            try:
+                state = await self.config.get_spotify_api().playback_state(token)
+                snapshot = snapshot_from_playback_state(state)
+            except CircuitOpen as e:
+                snapshot = {"available": False, "reason": "Playback state is unavailable"}
+                poller.snapshot, poller.fetched_at = snapshot, time.monotonic()
+                return max(self.settings["error_interval_seconds"], e.retry_after)
+            except ClientResponseError as e:
+                logger.warning("Failed to get playback state of user(id=%s): %s", poller.owner_id, e)
+                snapshot = {"available": False, "reason": "Playback state is unavailable"}
+                if e.status == 429 and e.headers and e.headers.get("Retry-After", "").isdigit():
+                    poller.snapshot, poller.fetched_at = snapshot, time.monotonic()
+                    return max(self.settings["error_interval_seconds"], float(e.headers["Retry-After"]))
+
+        poller.snapshot, poller.fetched_at = snapshot, time.monotonic()
+        return next_poll_interval(snapshot, self.settings)
+
+    async def _poll_loop(self, poller: OwnerPoller):
+        try:
+            while time.monotonic() - poller.last_read < self.settings["idle_timeout_seconds"]:
+                try:
+                    interval = await self._poll_once(poller)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception("Polling playback state of user(id=%s) failed: %s", poller.owner_id, e)
+                    poller.snapshot = {"available": False, "reason": "Playback state is unavailable"}
+                    interval = self.settings["error_interval_seconds"]
+                poller.ready.set()
+                await asyncio.sleep(interval)
+            logger.debug("Stopped polling playback state of user(id=%s): no readers", poller.owner_id)
+        finally:
+            if self._pollers.get(poller.owner_id) is poller:
+                del self._pollers[poller.owner_id]
+
+    async def get_snapshot(self, owner_id: int)-> Dict:
+        poller = self._pollers.get(owner_id)
+        if poller is None:
+            poller = OwnerPoller(owner_id)
+            self._pollers[owner_id] = poller
+            poller.task = asyncio.ensure_future(self._poll_loop(poller))
+        poller.last_read = time.monotonic()
+
+        if poller.snapshot is None:
+            try:
+                await asyncio.wait_for(poller.ready.wait(), self.settings["first_poll_timeout_seconds"])
+            except asyncio.TimeoutError:
+                return {"available": False, "reason": "Playback state is not yet available"}
+
+        snapshot = dict(poller.snapshot) # type: ignore
+        snapshot["fetched_at"] = datetime.utcnow().timestamp() - (time.monotonic() - poller.fetched_at)
+        if snapshot.get("is_playing") and snapshot.get("progress_ms") is not None and snapshot.get("duration_ms"):
+            # extrapolate progress since the last poll rather than polling more often
+            elapsed_ms = int((time.monotonic() - poller.fetched_at) * 1000)
+            snapshot["progress_ms"] = min(snapshot["progress_ms"] + elapsed_ms, snapshot["duration_ms"])
+        return snapshot
+
+    def active_pollers(self)-> int:
+        return len(self._pollers)
+
+    async def stop_all(self):
+        tasks = [poller.task for poller in self._pollers.values() if poller.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_playback_poller: Optional[PlaybackPoller] = None
+
+
+def get_playback_poller(config: Config)-> PlaybackPoller:
+    global _playback_poller
+    if _playback_poller is None:
+        _playback_poller = PlaybackPoller(config)
+    return _playback_poller
+
+
+metrics.register_gauge("now_playing_pollers", lambda: _playback_poller.active_pollers() if _playback_poller else 0)
+
+
+async def playback_poller_cleanup(_app):
+    """Cleanup context stopping every poll loop when the app stops"""
+    yield
+    if _playback_poller is not None:
+        await _playback_poller.stop_all()
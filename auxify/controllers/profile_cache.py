@@ -0,0 +1,82 @@
+from typing import Dict, Iterable, Optional, Set
+
+from auxify.config import Config
+from auxify.utils import metrics
+from auxify.utils.cache import TTLCache
+
+
+class ProfileCache:
+    """
+    Profile snapshots served by /me, per user. The rooms in each snapshot are indexed
+    by room and by room owner, so a change to a room invalidates the snapshot of every
+    member who has one cached
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.profiles = TTLCache(maxsize, ttl_seconds)
+        self._room_users: Dict[int, Set[int]] = {}
+        self._owner_rooms: Dict[int, Set[int]] = {}
+
+    def get(self, user_id: int)-> Optional[Dict]:
+        return self.profiles.get(user_id)
+
+    def set(self, user_id: int, profile: Dict):
+        self.profiles.set(user_id, profile)
+        for room in profile["rooms"]:
+            self._room_users.setdefault(room["room_id"], set()).add(user_id)
+            self._owner_rooms.setdefault(room["owner_id"], set()).add(room["room_id"])
+        if len(self._room_users) > self.profiles.maxsize:
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Drop index entries left behind by snapshots that were evicted or expired"""
+        self._room_users, self._owner_rooms = {}, {}
+        for user_id, profile in self.profiles.items():
+            for room in profile["rooms"]:
+                self._room_users.setdefault(room["room_id"], set()).add(user_id)
+                self._owner_rooms.setdefault(room["owner_id"], set()).add(room["room_id"])
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            self.profiles.pop(user_id)
+
+    def invalidate_rooms(self, room_ids: Iterable[int]):
+        for room_id in room_ids:
+            self.invalidate_users(self._room_users.pop(room_id, ()))
+
+    def invalidate_owned_rooms(self, owner_id: int):
+        self.invalidate_users([owner_id])
+        self.invalidate_rooms(self._owner_rooms.pop(owner_id, ()))
+
+    def stats(self)-> Dict:
+        return {**self.profiles.stats(), "indexed_rooms": len(self._room_users)}
+
+
+_profile_cache: Optional[ProfileCache] = None
+
+
+def get_profile_cache(config: Config)-> Optional[ProfileCache]:
+    global _profile_cache
+    settings = config.profile_cache_settings()
+    if _profile_cache is None and settings["enabled"]:
+        _profile_cache = ProfileCache(settings["maxsize"], settings["ttl_seconds"])
+    return _profile_cache
+
+
+metrics.register_gauge("profile_cache", lambda: _profile_cache.stats() if _profile_cache else None)
+
+
+def invalidate_users(user_ids: Iterable[int]):
+    if _profile_cache is not None:
+        _profile_cache.invalidate_users(user_ids)
+
+
+def invalidate_rooms(room_ids: Iterable[int]):
+    if _profile_cache is not None:
+        _profile_cache.invalidate_rooms(room_ids)
+
+
+def invalidate_owned_rooms(owner_id: int):
+    """Invalidate the owner and the members of their rooms, e.g. when creating a room deactivates the last one"""
+    if _profile_cache is not None:
+        _profile_cache.invalidate_owned_rooms(owner_id)
@@ -0,0 +1,29 @@
+import time
+from typing import Dict
+
+
+class RoomActivityTracker:
+    """
+    In-memory record of when each room was last used. Requests only update this map;
+    the room expiry job flushes it to the database in bulk
+    """
+
+    def __init__(self):
+        self._last_active: Dict[int, float] = {}
+
+    def touch(self, room_id: int):
+        self._last_active[room_id] = time.time()
+
+    def drain(self)-> Dict[int, float]:
+        """Take all activity recorded since the last drain"""
+        pending, self._last_active = self._last_active, {}
+        return pending
+
+    def restore(self, pending: Dict[int, float]):
+        """Put back activity that could not be flushed, without losing newer activity"""
+        for room_id, timestamp in pending.items():
+            if self._last_active.get(room_id, 0) < timestamp:
+                self._last_active[room_id] = timestamp
+
+
+room_activity = RoomActivityTracker()
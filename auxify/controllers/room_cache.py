@@ -0,0 +1,62 @@
+from typing import Dict, Iterable, Optional
+
+from auxify.config import ROOM_CACHE_DEFAULTS
+from auxify.utils.cache import TTLCache
+
+
+# rooms are never reactivated, so a room seen inactive can be remembered until evicted
+inactive_rooms = TTLCache(ROOM_CACHE_DEFAULTS["inactive_rooms_maxsize"])
+# a missing room or an owner without one may appear at any time (possibly in another
+# worker process), so those are only remembered briefly
+missing_rooms = TTLCache(ROOM_CACHE_DEFAULTS["negative_maxsize"], ROOM_CACHE_DEFAULTS["negative_ttl_seconds"])
+owners_without_room = TTLCache(ROOM_CACHE_DEFAULTS["negative_maxsize"], ROOM_CACHE_DEFAULTS["negative_ttl_seconds"])
+
+
+def configure(settings: Dict):
+    """Size the caches from Config's room_cache section; when it is disabled, nothing is remembered"""
+    enabled = settings["enabled"]
+    inactive_rooms.resize(settings["inactive_rooms_maxsize"] if enabled else 0)
+    for cache in (missing_rooms, owners_without_room):
+        cache.resize(settings["negative_maxsize"] if enabled else 0, settings["negative_ttl_seconds"])
+
+
+def mark_inactive(room_ids: Iterable[int]):
+    for room_id in room_ids:
+        inactive_rooms.set(room_id, True)
+
+
+def is_known_inactive(room_id: int)-> bool:
+    return room_id in inactive_rooms
+
+
+def is_known_missing(room_id: int)-> bool:
+    return room_id in missing_rooms
+
+
+def is_known_unavailable(room_id: int)-> bool:
+    """Whether the room is known not to exist or to be inactive, so need not be loaded"""
+    return is_known_missing(room_id) or is_known_inactive(room_id)
+
+
+def is_known_without_room(owner_id: int)-> bool:
+    return owner_id in owners_without_room
+
+
+def observe_room(room: Dict, room_id: Optional[int] = None):
+    """Remember the room if it was loaded and found to be inactive, or if no room with room_id was found"""
+    if not room:
+        if room_id is not None:
+            missing_rooms.set(room_id, True)
+    elif not room.get("active"):
+        inactive_rooms.set(room["room_id"], True)
+
+
+def observe_owned_room(room: Dict, owner_id: int):
+    """Remember an owner found to have no active room"""
+    if not room or not room.get("active"):
+        owners_without_room.set(owner_id, True)
+
+
+def room_created(room_id: int, owner_id: int):
+    missing_rooms.pop(room_id)
+    owners_without_room.pop(owner_id)
@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, Optional
+
+from auxify.config import Config
+from auxify.utils import json_dumps_with_default, metrics
+from auxify.utils.cache import TTLCache
+
+
+def room_document(room: Dict, member_ids: Iterable[int])-> Dict:
+    """The room as GET /rooms/{room_id} shows it, whether or not it is served from a snapshot"""
+    return {
+        **room,
+        "member_count": len(set(member_ids) | {room["owner_id"]})
+    }
+
+
+class RoomSnapshot:
+    """
+    A room as GET /rooms/{room_id} shows it, serialized once and kept until it changes,
+    with the ids of its members so that access can be checked without the database
+    """
+    __slots__ = ("room", "member_ids", "_body")
+
+    def __init__(self, room: Dict, member_ids: Iterable[int]):
+        self.room = room
+        self.member_ids = set(member_ids)
+        self._body: Optional[bytes] = None
+
+    def has_member(self, user_id: int)-> bool:
+        return user_id == self.room["owner_id"] or user_id in self.member_ids
+
+    def add_member(self, user_id: int):
+        if user_id not in self.member_ids:
+            self.member_ids.add(user_id)
+            self.changed()
+
+    def changed(self):
+        self._body = None
+
+    def body(self)-> bytes:
+        if self._body is None:
+            self._body = json_dumps_with_default(room_document(self.room, self.member_ids)).encode()
+        return self._body
+
+
+class RoomSnapshotStore:
+    """
+    Snapshots of active rooms, updated in place as members join through this process.
+    Changes made through other workers are picked up when the snapshot expires after
+    ttl_seconds, or sooner for joins, since a user missing from a snapshot is checked
+    against the database. Whether the room is still active is not kept here: callers
+    read that from the database before serving a snapshot
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.snapshots = TTLCache(maxsize, ttl_seconds)
+        # each owner has at most one active room, which creating another deactivates
+        self.owner_rooms = TTLCache(maxsize, ttl_seconds)
+
+    def get(self, room_id: int)-> Optional[RoomSnapshot]:
+        return self.snapshots.get(room_id)
+
+    def load(self, room: Dict, member_ids: Iterable[int])-> RoomSnapshot:
+        snapshot = RoomSnapshot(room, member_ids)
+        self.snapshots.set(room["room_id"], snapshot)
+        self.owner_rooms.set(room["owner_id"], room["room_id"])
+        return snapshot
+
+    def member_joined(self, room_id: int, user_id: int):
+        snapshot = self.snapshots.get(room_id)
+        if snapshot is not None:
+            snapshot.add_member(user_id)
+
+    def deactivated(self, room_ids: Iterable[int]):
+        for room_id in room_ids:
+            snapshot = self.snapshots.pop(room_id)
+            if snapshot is not None:
+                self.owner_rooms.pop(snapshot.room["owner_id"])
+
+    def owner_rooms_deactivated(self, owner_id: int):
+        room_id = self.owner_rooms.pop(owner_id)
+        if room_id is not None:
+            self.deactivated([room_id])
+
+    def stats(self)-> Dict:
+        return self.snapshots.stats()
+
+
+_room_snapshots: Optional[RoomSnapshotStore] = None
+
+
+def get_room_snapshots(config: Config)-> Optional[RoomSnapshotStore]:
+    global _room_snapshots
+    settings = config.room_snapshot_settings()
+    if _room_snapshots is None and settings["enabled"]:
+        _room_snapshots = RoomSnapshotStore(settings["maxsize"], settings["ttl_seconds"])
+    return _room_snapshots
+
+
+metrics.register_gauge("room_snapshots", lambda: _room_snapshots.stats() if _room_snapshots else None)
+
+
+def member_joined(room_id: int, user_id: int):
+    if _room_snapshots is not None:
+        _room_snapshots.member_joined(room_id, user_id)
+
+
+def deactivated(room_ids: Iterable[int]):
+    if _room_snapshots is not None:
+        _room_snapshots.deactivated(room_ids)
+
+
+def owner_rooms_deactivated(owner_id: int):
+    """Drop the owner's active room, e.g. when creating another deactivates it"""
+    if _room_snapshots is not None:
+        _room_snapshots.owner_rooms_deactivated(owner_id)
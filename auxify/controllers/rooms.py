@@ -1,17 +1,54 @@
-from typing import Optional, cast, Dict, Union
+from typing import Optional, cast, Dict, List, Union
+from datetime import timedelta
 import logging
 from aiohttp.web_exceptions import HTTPException
 from aiohttp.client_exceptions import ClientResponseError
-from aiosqlite import Connection
 
 from auxify.models import rooms
+from auxify.models.shards import RoomDatabase
 from auxify.config import Config
-from auxify.controllers import spotify, err
+from auxify.controllers import spotify, err, room_cache, tracks, playback, profile_cache, room_snapshots
+from auxify.utils import jwt
 from auxify.controllers.spotify import GetTokenError
+from auxify.controllers.room_activity import room_activity
+from auxify.controllers.search_cache import PrefixSearchCache, SearchDebouncer, Superseded
+from auxify.controllers.enqueue_dedup import EnqueueDeduplicator
+from auxify.external.circuit_breaker import CircuitOpen
+from auxify.utils import metrics
 
 
 logger = logging.getLogger(__name__)
 
+_search_cache: Optional[PrefixSearchCache] = None
+search_debouncer = SearchDebouncer()
+
+
+def get_search_cache(config: Config)-> PrefixSearchCache:
+    global _search_cache
+    if _search_cache is None:
+        settings = config.search_cache_settings()
+        _search_cache = PrefixSearchCache(settings["maxsize"], settings["ttl_seconds"], settings["min_results"])
+    return _search_cache
+
+
+_enqueue_deduplicator: Optional[EnqueueDeduplicator] = None
+
+
+def get_enqueue_deduplicator(config: Config)-> EnqueueDeduplicator:
+    global _enqueue_deduplicator
+    if _enqueue_deduplicator is None:
+        settings = config.enqueue_dedup_settings()
+        _enqueue_deduplicator = EnqueueDeduplicator(
+            settings["maxsize"], settings["idempotency_ttl_seconds"], settings["duplicate_window_seconds"])
+    return _enqueue_deduplicator
+
+
+metrics.register_gauge("search_cache", lambda: _search_cache.stats() if _search_cache else None)
+metrics.register_gauge("enqueue_dedup", lambda: _enqueue_deduplicator.stats() if _enqueue_deduplicator else None)
+metrics.register_gauge("inactive_rooms_cache", room_cache.inactive_rooms.stats)
+metrics.register_gauge("missing_rooms_cache", room_cache.missing_rooms.stats)
+metrics.register_gauge("owners_without_room_cache", room_cache.owners_without_room.stats)
+
 
 def _handle_token_result(token_result: Union[str, GetTokenError])-> str:
     if isinstance(token_result, GetTokenError):
@@ -19,6 +56,8 @@ def _handle_token_result(token_result: Union[str, GetTokenError])-> str:
             raise err.failed_dependency("Spotify token has expired")
         elif token_result == GetTokenError.NOT_AUTHED:
             raise err.failed_dependency("User must be authorized with Spotify to perform this operation")
+        elif token_result == GetTokenError.UNAVAILABLE:
+            raise err.failed_dependency(token_result.value)
         elif token_result == GetTokenError.API_ERROR:
             raise err.internal_server_error(token_result.value)
         else:
@@ -26,19 +65,52 @@ def _handle_token_result(token_result: Union[str, GetTokenError])-> str:
     return token_result
 
 
-async def get_room_by_id(room_id: int, user_id: int, config: Config)-> Dict:
+async def get_room_by_id(room_id: int, user_id: int, config: Config)-> Union[Dict, bytes]:
     """
-    Delegates to the get_room_for_user_assertive method
+    The room, with its member count, as serialized JSON from its snapshot. Falls back
+    to get_room_for_user_assertive when there is no snapshot, or the user is not in it
     """
+    snapshots = room_snapshots.get_room_snapshots(config)
+    snapshot = snapshots.get(room_id) if snapshots is not None else None
     try:
-        async with config.get_database_connection() as db:
-            return await get_room_for_user_assertive(room_id, user_id, db)
+        async with config.get_room_database() as db:
+            if snapshot is not None and snapshot.has_member(user_id):
+                await get_active_room(room_id, db)
+                return snapshot.body()
+
+            room = await get_room_for_user_assertive(room_id, user_id, db)
+            if snapshots is None:
+                member_ids = await rooms.RoomPersistence(db).get_member_ids(room_id)
+                return room_snapshots.room_document(room, member_ids)
+
+            snapshot = snapshots.get(room_id)
+            if snapshot is None:
+                member_ids = await rooms.RoomPersistence(db).get_member_ids(room_id)
+                snapshot = snapshots.load(room, member_ids)
+            elif not snapshot.has_member(user_id):
+                # joined through another worker
+                snapshot.add_member(user_id)
+            return snapshot.body()
     except Exception as e:
         logger.exception("Failed to retrieve room %s for user %s: %s", room_id, user_id, e)
         raise e
 
 
-async def is_user_in_room(user_id: int, room_id: int, db: Connection, *, room: Optional[Dict]=None):
+async def get_active_room(room_id: int, db: RoomDatabase)-> Dict:
+    """
+    The room, read by primary key, if it is active; raises not found otherwise. Snapshots
+    are per worker, so whether a room is active is not taken from them: the room may have
+    been deactivated or expired through another worker
+    """
+    room = await rooms.RoomPersistence(db).get_room(room_id)
+    room_cache.observe_room(room, room_id)
+    if not room or not room.get("active"):
+        room_snapshots.deactivated([room_id])
+        raise err.not_found(f"No active room with id {room_id}")
+    return room
+
+
+async def is_user_in_room(user_id: int, room_id: int, db: RoomDatabase, *, room: Optional[Dict]=None):
     """
     Check if a user is in a room: the user is a room member or is the owner
     """
@@ -54,32 +126,73 @@ async def get_room_by_id_minimal(room_id: int, user_id: int, config: Config)-> D
     """
     Get data for a room by id, redacting secret information like the room code
     """
+    if room_cache.is_known_unavailable(room_id):
+        raise err.not_found(f"No active room with id {room_id}")
+
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room = await room_persistence.get_room(room_id)
+            room_cache.observe_room(room, room_id)
             if not room or not room.get("active"):
                 raise err.not_found(f"No active room with id {room_id}")
             user_in_room = await is_user_in_room(user_id, room_id, db, room=room)
-            return {
-                "room_id": room.get("room_id"),
-                "owner_id": room.get("owner_id"),
-                "room_name": room.get("room_name"),
-                "has_code": bool(room.get("room_code")),
-                "user_in_room": user_in_room
-            }
+            return _minimal_room(room, user_in_room)
     except Exception as e:
         logger.exception("Failed to retrieve minimal data for room %s: %s", room_id, e)
         raise e
 
 
-async def get_room_for_user_assertive(room_id: int, user_id: int, db: Connection):
+def _minimal_room(room: Dict, user_in_room: bool)-> Dict:
+    return {
+        "room_id": room.get("room_id"),
+        "owner_id": room.get("owner_id"),
+        "room_name": room.get("room_name"),
+        "has_code": bool(room.get("room_code")),
+        "user_in_room": user_in_room
+    }
+
+
+async def get_rooms_minimal(room_ids: List[int], user_id: int, config: Config)-> Dict:
+    """
+    Minimal data for many rooms at once, as get_room_by_id_minimal gives for one,
+    using one query for the rooms and one for the user's memberships. Rooms that do
+    not exist or are inactive are listed under not_found
+    """
+    room_ids = list(dict.fromkeys(room_ids))
+    unknown_ids = [room_id for room_id in room_ids if not room_cache.is_known_unavailable(room_id)]
+    try:
+        async with config.get_room_database() as db:
+            room_persistence = rooms.RoomPersistence(db)
+            found = {room["room_id"]: room for room in await room_persistence.get_rooms(unknown_ids)}
+            for room_id in unknown_ids:
+                room_cache.observe_room(found.get(room_id, {}), room_id)
+            active = [room_id for room_id in unknown_ids if found.get(room_id, {}).get("active")]
+            joined = await room_persistence.get_joined_room_ids(user_id, active)
+    except Exception as e:
+        logger.exception("Failed to retrieve minimal data for rooms %s: %s", room_ids, e)
+        raise e
+
+    return {
+        "rooms": [
+            _minimal_room(found[room_id], found[room_id]["owner_id"] == user_id or room_id in joined)
+            for room_id in active
+        ],
+        "not_found": [room_id for room_id in room_ids if room_id not in active]
+    }
+
+
+async def get_room_for_user_assertive(room_id: int, user_id: int, db: RoomDatabase):
     """
     helper method to get a room if the room exists, is active, and the user is a member of it
     raises HTTPException if any condition fails
     """
+    if room_cache.is_known_missing(room_id):
+        raise err.not_found(f"No room with id {room_id}")
+
     room_persistence = rooms.RoomPersistence(db)
     room = await room_persistence.get_room(room_id)
+    room_cache.observe_room(room, room_id)
     if not room:
         raise err.not_found(f"No room with id {room_id}")
 
@@ -99,9 +212,12 @@ async def create_room(user_id: int, room_code: Optional[str], room_name: str, co
         token_result = await spotify.get_valid_token_for_user(user_id, config)
         token = _handle_token_result(token_result)
 
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room_id = await room_persistence.create_room(user_id, room_code, room_name)
+            room_cache.room_created(room_id, user_id)
+            room_snapshots.owner_rooms_deactivated(user_id)
+            profile_cache.invalidate_owned_rooms(user_id)
             logger.debug("Created room(id=%s) for user(id=%s)",
                          room_id, user_id)
             created_room = await room_persistence.get_room(room_id)
@@ -113,7 +229,7 @@ async def create_room(user_id: int, room_code: Optional[str], room_name: str, co
 
 async def get_owned_room_for_user(user_id: int, config: Config) -> Dict:
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room = await room_persistence.get_room_by_owner(user_id)
             return room
@@ -125,7 +241,7 @@ async def get_owned_room_for_user(user_id: int, config: Config) -> Dict:
 async def get_joined_rooms_for_user(user_id: int, config: Config)-> Dict:
     """Get rooms which the user is a member of"""
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             joined_rooms = await room_persistence.get_joined_rooms_by_user(user_id)
             return {"rooms": joined_rooms}
@@ -134,14 +250,51 @@ async def get_joined_rooms_for_user(user_id: int, config: Config)-> Dict:
         raise e
 
 
-async def enqueue_song(user_id: int, room_id: int, track_uri: str, config: Config) -> Dict:
+async def get_room_for_member(room_id: int, user_id: int, config: Config)-> Dict:
+    """
+    The room if it is active and the user is in it, as get_room_for_user_assertive checks it,
+    but taking membership from the room's snapshot when the user is in that
+    """
+    snapshots = room_snapshots.get_room_snapshots(config)
+    snapshot = snapshots.get(room_id) if snapshots is not None else None
+    async with config.get_room_database() as db:
+        if snapshot is not None and snapshot.has_member(user_id):
+            return await get_active_room(room_id, db)
+        return await get_room_for_user_assertive(room_id, user_id, db)
+
+
+async def enqueue_song(user_id: int, room_id: int, track_uri: str, config: Config,
+                       idempotency_key: Optional[str] = None) -> Dict:
+    """Enqueue a track, answering retries and double-taps without calling Spotify again"""
+    # authorized before the deduplicator is asked, so that its answers only reach room members
     try:
-        async with config.get_database_connection() as db:
-            room = await get_room_for_user_assertive(room_id, user_id, db)
-            token_result = await spotify.get_valid_token_for_user(room["owner_id"], config, requested_by=user_id)
-            token = _handle_token_result(token_result)
+        room = await get_room_for_member(room_id, user_id, config)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to get room %s to enqueue a track for user %s: %s", room_id, user_id, e)
+        raise
+
+    if not config.enqueue_dedup_settings()["enabled"]:
+        return await _enqueue_song(user_id, room, track_uri, config)
+    return await get_enqueue_deduplicator(config).run(
+        user_id, room_id, track_uri, idempotency_key,
+        lambda: _enqueue_song(user_id, room, track_uri, config))
+
 
-        await config.get_spotify_api().enqueue_song(track_uri, token)
+async def _enqueue_song(user_id: int, room: Dict, track_uri: str, config: Config) -> Dict:
+    room_id = room["room_id"]
+    try:
+        token_result = await spotify.get_valid_token_for_user(room["owner_id"], config, requested_by=user_id)
+        token = _handle_token_result(token_result)
+
+        room_activity.touch(room_id)
+        try:
+            await config.get_spotify_api().enqueue_song(track_uri, token)
+        except CircuitOpen:
+            raise err.failed_dependency(GetTokenError.UNAVAILABLE.value)
+        if config.track_store_settings()["enabled"]:
+            tracks.get_track_buffer(config).request_backfill(room["owner_id"], [track_uri])
 
         return {"success": True}
 
@@ -160,19 +313,54 @@ async def enqueue_song(user_id: int, room_id: int, track_uri: str, config: Confi
         raise
 
 
+def _stale_search_results(market_scope: int, query: str, config: Config)-> Dict:
+    """Answer a search while Spotify is unavailable from expired cache entries, if there are any"""
+    results = None
+    if config.search_cache_settings()["enabled"]:
+        results = get_search_cache(config).lookup(market_scope, query, allow_stale=True)
+    if results is None:
+        raise err.failed_dependency(GetTokenError.UNAVAILABLE.value)
+    return {"results": results, "stale": True}
+
+
 async def search(user_id: int, room_id: int, query: str, config: Config)-> Dict:
     if not query:
         raise err.bad_request("No query string supplied to search for")
     
+    settings = config.search_cache_settings()
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room = await get_room_for_user_assertive(room_id, user_id, db)
+            room_activity.touch(room_id)
+
+            # results depend on the market of the owner's token, so they are cached per owner
+            market_scope = room["owner_id"]
+            if settings["enabled"]:
+                cached_results = get_search_cache(config).lookup(market_scope, query)
+                if cached_results is not None:
+                    return {"results": cached_results}
+
             token_result = await spotify.get_valid_token_for_user(room["owner_id"], config, requested_by=user_id)
+            if token_result == GetTokenError.UNAVAILABLE:
+                return _stale_search_results(market_scope, query, config)
             token = _handle_token_result(token_result)
 
-        search_results = await config.get_spotify_api().search(query, token)
+        async def search_spotify()-> List[Dict]:
+            results = await config.get_spotify_api().search_tracks(query, token)
+            if settings["enabled"]:
+                get_search_cache(config).store(market_scope, query, results)
+            if config.track_store_settings()["enabled"]:
+                tracks.get_track_buffer(config).add_tracks(results)
+            return results
+
+        try:
+            results = await search_debouncer.run((user_id, room_id), search_spotify, settings["debounce_seconds"])
+        except Superseded:
+            return {"results": [], "superseded": True}
+        except CircuitOpen:
+            return _stale_search_results(market_scope, query, config)
         return {
-            "results": extract_relevant_data_from_search_results(search_results)
+            "results": results
         }
     except HTTPException:
         raise
@@ -189,36 +377,109 @@ async def search(user_id: int, room_id: int, query: str, config: Config)-> Dict:
         raise
 
 
+async def now_playing(user_id: int, room_id: int, config: Config)-> Dict:
+    """What the room owner is currently playing, shared between all members of the room"""
+    try:
+        async with config.get_room_database() as db:
+            room = await get_room_for_user_assertive(room_id, user_id, db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to get now playing in room(id=%s) for user(id=%s): %s", room_id, user_id, e)
+        raise
+
+    return await playback.get_playback_poller(config).get_snapshot(room["owner_id"])
+
+
 def extract_relevant_data_from_search_results(search_results: Dict):
-    tracks = [
+    playable_tracks = [
         track for track in search_results.get("tracks", {}).get("items", [])
         if track.get("is_playable") and "uri" in track
     ]
-    return [{
-        "name": track.get("name"),
-        "artists": [{"name": artist.get("name")} for artist in track.get("artists", [])],
-        "uri": track.get("uri"),
-        "images": track.get("album", {}).get("images", [])
-    } for track in tracks]
+    return [tracks.track_metadata(track) for track in playable_tracks]
+
+
+async def create_invite(user_id: int, room_id: int, config: Config)-> Dict:
+    """Create a signed invite to a room, which lets its holder join without the room code"""
+    try:
+        async with config.get_room_database() as db:
+            await get_room_for_user_assertive(room_id, user_id, db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to create invite to room %s for user %s: %s", room_id, user_id, e)
+        raise e
+
+    duration_seconds = config.invite_settings()["duration_seconds"]
+    return {
+        "room_id": room_id,
+        "invite": jwt.generate_invite_jwt(room_id, config.jwt_key(), timedelta(seconds=duration_seconds)),
+        "expires_in": duration_seconds
+    }
 
 
-async def join_room(user_id: int, room_id: int, room_code: Optional[str], config: Config)-> Dict:
+def is_valid_invite(invite: str, room_id: int, config: Config)-> bool:
+    try:
+        claims = jwt.get_claims_from_jwt(invite, config.jwt_key(), jwt.Aud.INVITE)
+        return int(claims["sub"]) == room_id
+    except Exception as e:
+        logger.debug("Rejecting invite to room %s: %s", room_id, e)
+        return False
+
+
+async def join_room_with_invite(user_id: int, room_id: int, invite: str, config: Config)-> Dict:
+    """
+    Join a room using a signed invite. The signature authorizes the join, so the
+    room code is never checked; the room is only joined if it is still active, as
+    invites outlive deactivation and archival
+    """
+    if not is_valid_invite(invite, room_id, config):
+        return {"success": False, "message": "Invalid or expired invite"}
+
+    try:
+        joined = await config.write_room(
+            room_id, lambda db: rooms.RoomPersistence(db).add_user_to_active_room(room_id, user_id))
+    except Exception as e:
+        logger.exception("Failed to add user %s to room %s with invite: %s", user_id, room_id, e)
+        raise e
+    if not joined:
+        raise err.not_found(f"Active room with id {room_id} not found")
+
+    room_activity.touch(room_id)
+    profile_cache.invalidate_users([user_id])
+    room_snapshots.member_joined(room_id, user_id)
+    return {"success": True, "message": "Successfully joined the room"}
+
+
+async def join_room(user_id: int, room_id: int, room_code: Optional[str], config: Config,
+                    invite: Optional[str] = None)-> Dict:
     """Process a request from a user to join a room"""
+    if room_cache.is_known_unavailable(room_id):
+        raise err.not_found(f"Active room with id {room_id} not found")
+
+    if invite:
+        return await join_room_with_invite(user_id, room_id, invite, config)
+
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room = await room_persistence.get_room(room_id)
+            room_cache.observe_room(room, room_id)
             if not room or not room.get("active"):
                 raise err.not_found(f"Active room with id {room_id} not found")
             
             if await is_user_in_room(user_id, room_id, db, room=room):
+                room_activity.touch(room_id)
                 return {"success": True, "message": "User is already in room"}
             
             if room.get("room_code"):
                 if room["room_code"] != room_code:
                     return {"success": False, "message": "Invalid room code"}
             
-            await room_persistence.add_user_to_room(room_id, user_id)
+            await config.write_room(room_id, lambda db: rooms.RoomPersistence(db).add_user_to_room(room_id, user_id))
+            room_activity.touch(room_id)
+            profile_cache.invalidate_users([user_id])
+            room_snapshots.member_joined(room_id, user_id)
 
             return {"success": True, "message": "Successfully joined the room"}
     except HTTPException:
@@ -231,7 +492,7 @@ async def join_room(user_id: int, room_id: int, room_code: Optional[str], config
 async def deactivate_room(user_id: int, room_id: int, config: Config)-> Dict:
     """Process a request from an owner to deactivate an owned room"""
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room = await room_persistence.get_room(room_id)
             if not room or not room.get("active"):
@@ -240,7 +501,10 @@ async def deactivate_room(user_id: int, room_id: int, config: Config)-> Dict:
             if room["owner_id"] != user_id:
                 raise err.forbidden("User is not permitted to deactivate this room")
             
-            await room_persistence.deactivate_room(room_id)
+            await config.write_room(room_id, lambda db: rooms.RoomPersistence(db).deactivate_room(room_id))
+            room_cache.mark_inactive([room_id])
+            profile_cache.invalidate_rooms([room_id])
+            room_snapshots.deactivated([room_id])
 
             return {"success": True, "message": "Successfully deactivated the room"}
     except HTTPException:
@@ -269,10 +533,21 @@ async def find_room(query: Dict, config: Config)-> Dict:
     except ValueError:
         raise err.bad_request(f"'{query[resource_name]}' is not a valid {resource_name}")
 
+    if resource_name == "owner_id":
+        known_unavailable = room_cache.is_known_without_room(resource_id)
+    else:
+        known_unavailable = room_cache.is_known_unavailable(resource_id)
+    if known_unavailable:
+        raise err.not_found(f"No active rooms found for {resource_name} {resource_id}")
+
     try:
-        async with config.get_database_connection() as db:
+        async with config.get_room_database() as db:
             room_persistence = rooms.RoomPersistence(db)
             room = await query_method(room_persistence, resource_id)
+            if resource_name == "owner_id":
+                room_cache.observe_owned_room(room, resource_id)
+            else:
+                room_cache.observe_room(room, resource_id)
             if not room or not room.get("active"):
                 raise err.not_found(f"No active rooms found for {resource_name} {resource_id}")
             else:
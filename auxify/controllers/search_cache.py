@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import time
+
+from auxify.utils.cache import TTLCache
+
+
+def normalize_query(query: str)-> str:
+    return " ".join(query.lower().split())
+
+
+def track_matches(track: Dict, terms: List[str])-> bool:
+    """Check that every term of a query appears in the track name or its artists' names"""
+    haystack = " ".join([track.get("name") or ""] + [artist.get("name") or "" for artist in track.get("artists", [])]).lower()
+    return all(term in haystack for term in terms)
+
+
+class PrefixSearchCache:
+    """
+    Recent search results, indexed by normalized query per market scope.
+    Type-ahead refinements ("daf" -> "daft") are answered by filtering the results
+    of a cached broader query, when those still contain at least min_results matches
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float, min_results: int):
+        self.ttl_seconds = ttl_seconds
+        self.min_results = min_results
+        # entries are kept until evicted rather than expiring after ttl_seconds, so that
+        # stale results can still be served while Spotify is unavailable
+        self._results = TTLCache(maxsize)
+        # counted here rather than by the TTLCache, which cannot tell fresh entries from stale ones
+        self.hits = 0
+        self.stale_hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+    def store(self, scope: Hashable, query: str, results: List[Dict]):
+        self._results.set((scope, normalize_query(query)), (time.monotonic(), results))
+
+    def _is_fresh(self, entry: Tuple[float, List[Dict]])-> bool:
+        return time.monotonic() - entry[0] <= self.ttl_seconds
+
+    def lookup(self, scope: Hashable, query: str, allow_stale: bool = False)-> Optional[List[Dict]]:
+        """
+        Get results for query from the cache, or None if Spotify must be asked.
+        With allow_stale, expired entries are used too; they are kept until evicted
+        """
+        query = normalize_query(query)
+
+        entry = self._results.get((scope, query))
+        if entry is not None:
+            if self._is_fresh(entry):
+                self.hits += 1
+                return entry[1]
+            if allow_stale:
+                self.stale_hits += 1
+                return entry[1]
+
+        terms = query.split()
+        for end in range(len(query) - 1, 0, -1):
+            # broader queries are only looked at, so that their order is left as it is
+            broader = self._results.peek((scope, query[:end].rstrip()))
+            if broader is None:
+                continue
+            fresh = self._is_fresh(broader)
+            if not fresh and not allow_stale:
+                continue
+            refined = [track for track in broader[1] if track_matches(track, terms)]
+            if len(refined) >= self.min_results:
+                if fresh:
+                    self.prefix_hits += 1
+                else:
+                    self.stale_hits += 1
+                return refined
+
+        self.misses += 1
+        return None
+
+    def stats(self)-> Dict:
+        """
+        hits count fresh results for exact queries and prefix_hits fresh refinements;
+        stale_hits count either, served past ttl_seconds because Spotify was unavailable
+        """
+        return {
+            **self._results.stats(),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses
+        }
+
+
+class Superseded(Exception):
+    """Raised to a search that was replaced by a newer search from the same user"""
+
+
+class SearchDebouncer:
+    """
+    Runs at most one search per key (e.g. user and room) at a time: a new search
+    cancels the one in flight, whose caller gets Superseded. Searches wait delay_seconds
+    before starting, so bursts of keystrokes only reach Spotify once
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    @staticmethod
+    async def _delayed(search: Callable[[], Awaitable], delay_seconds: float)-> Any:
+        if delay_seconds > 0:
+            await asyncio.sleep(delay_seconds)
+        return await search()
+
+    async def run(self, key: Hashable, search: Callable[[], Awaitable], delay_seconds: float = 0)-> Any:
+        previous = self._in_flight.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+
+        task = asyncio.ensure_future(self._delayed(search, delay_seconds))
+        self._in_flight[key] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self._in_flight.get(key) is not task:
+                raise Superseded()
+            raise
+        finally:
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+
+    def in_flight(self)-> int:
+        return len(self._in_flight)
@@ -7,14 +7,31 @@ import aiohttp.client_exceptions
 from sqlite3 import DatabaseError
 
 from auxify.models import spotify_token
-from auxify.controllers import err
-from auxify.config import Config
-from auxify.utils import jwt
+from auxify.external.circuit_breaker import CircuitOpen
+from auxify.controllers import err, profile_cache
+from auxify.config import Config, ROOM_CACHE_DEFAULTS
+from auxify.utils import jwt, metrics
+from auxify.utils.cache import TTLCache
 
 
 logger = logging.getLogger(__name__)
 
-REQUIRED_SCOPES = "user-read-private user-read-email user-modify-playback-state"
+# users found to have no Spotify token, briefly remembered; a token stored in another worker process is seen once this expires
+unauthed_users = TTLCache(ROOM_CACHE_DEFAULTS["negative_maxsize"], ROOM_CACHE_DEFAULTS["negative_ttl_seconds"])
+metrics.register_gauge("unauthed_users_cache", unauthed_users.stats)
+
+
+def configure_unauthed_users(settings: Dict):
+    """Size the cache of users without a token from Config's room_cache section, as room_cache.configure does"""
+    unauthed_users.resize(settings["negative_maxsize"] if settings["enabled"] else 0, settings["negative_ttl_seconds"])
+
+
+def token_stored(user_id: int):
+    """Forget anything cached about the user's token state, after storing a token for them"""
+    unauthed_users.pop(user_id)
+    profile_cache.invalidate_users([user_id])
+
+REQUIRED_SCOPES = "user-read-private user-read-email user-modify-playback-state user-read-playback-state"
 PRE_EXPIRY_REFRESH_WINDOW = timedelta(minutes=1)
 
 async def spotify_auth(user_id: int, config: Config):
@@ -32,7 +49,7 @@ async def spotify_auth(user_id: int, config: Config):
     query_string = urlencode(query_parameters)
     redirect = f"https://accounts.spotify.com/authorize?{query_string}"
 
-    logger.info("Redirecting user to %s", redirect)
+    logger.debug("Redirecting user(id=%s) to Spotify for authorization", user_id)
     return {
         "url": redirect
     }
@@ -77,21 +94,24 @@ async def handle_spotify_callback(query_params: Dict, config: Config):
 
         spotify_user_data = await config.get_spotify_api().spotify_user_data(access_token)
         spotify_user_id = spotify_user_data["id"]
+    except CircuitOpen as e:
+        logger.debug("Not authorizing user(id=%s): %s", user_id, e)
+        raise err.failed_dependency(GetTokenError.UNAVAILABLE.value)
     except Exception as e:
         logger.exception("Failed to authorize user(id=%s): %s", user_id, e)
         raise err.internal_server_error(
             "Something went wrong logging in with Spotify")
 
     try:
-        async with config.get_database_connection() as db:
-            await spotify_token.SpotifyTokenPersistence(db).upsert_token(
-                user_id,
-                spotify_user_id,
-                access_token,
-                refresh_token,
-                created_at,
-                expires_in
-            )
+        await config.write(lambda db: spotify_token.SpotifyTokenPersistence(db).upsert_token(
+            user_id,
+            spotify_user_id,
+            access_token,
+            refresh_token,
+            created_at,
+            expires_in
+        ))
+        token_stored(user_id)
     except Exception as e:
         logger.exception(
             "Failed to upsert Spotify token for user(id=%s): %s", user_id, e)
@@ -114,10 +134,14 @@ class GetTokenError(Enum):
     NOT_AUTHED = "User has not authorized with Spotify"
     EXPIRED = "Auxify session with Spotify has expired; reauthorization with Spotify required"
     API_ERROR = "Something went wrong communicating with the Spotify API"
+    UNAVAILABLE = "Spotify is unavailable at the moment; please try again shortly"
     DB_ERROR = "Something went wrong"
 
 
 async def get_valid_token_for_user(user_id: int, config: Config, requested_by=None)-> Union[str, GetTokenError]:
+    if user_id in unauthed_users:
+        return GetTokenError.NOT_AUTHED
+
     try:
         async with config.get_database_connection() as db:
             token_persistence = spotify_token.SpotifyTokenPersistence(db)
@@ -125,6 +149,7 @@ async def get_valid_token_for_user(user_id: int, config: Config, requested_by=No
             
             if not stored_token:
                 # the user never auth'd
+                unauthed_users.set(user_id, True)
                 return GetTokenError.NOT_AUTHED
             
             if not stored_token.get("access_token") and not stored_token.get("refresh_token"):
@@ -147,18 +172,22 @@ async def get_valid_token_for_user(user_id: int, config: Config, requested_by=No
             if not "access_token" in response:
                 return GetTokenError.NOT_AUTHED
 
-            await token_persistence.upsert_token(
+            await config.write(lambda db: spotify_token.SpotifyTokenPersistence(db).upsert_token(
                 user_id,
                 stored_token["spotify_user_id"],
                 response["access_token"],
                 response.get("refresh_token", stored_token["refresh_token"]),
                 created_at, 
                 response["expires_in"]
-            )
+            ))
+            token_stored(user_id)
             return response["access_token"]
     except aiohttp.client_exceptions.ClientResponseError as e:
         logger.exception("Something went wrong when refreshing tokens for user %s: %s", user_id, e)
         return GetTokenError.API_ERROR
+    except CircuitOpen as e:
+        logger.debug("Not refreshing tokens for user %s: %s", user_id, e)
+        return GetTokenError.UNAVAILABLE
     except DatabaseError as e:
         logger.exception("Something went wrong retrieving or storing tokens for user %s: %s", user_id, e)
         return GetTokenError.DB_ERROR
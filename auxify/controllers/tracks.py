@@ -0,0 +1,176 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from auxify.config import Config
+from auxify.controllers import err, spotify
+from auxify.external.spotify_api import MAX_TRACKS_PER_REQUEST
+from auxify.models.tracks import TrackPersistence
+from auxify.utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+TRACK_URI_PREFIX = "spotify:track:"
+MAX_LOOKUP_URIS = 100
+
+
+def track_metadata(track: Dict)-> Dict:
+    """The parts of a Spotify track object that we show and store"""
+    return {
+        "name": track.get("name"),
+        "artists": [{"name": artist.get("name")} for artist in track.get("artists", [])],
+        "uri": track.get("uri"),
+        "images": track.get("album", {}).get("images", [])
+    }
+
+
+class TrackWriteBuffer:
+    """
+    Tracks waiting to be written to the track store, and enqueued URIs whose metadata may need
+    to be fetched from Spotify. Requests only add to this buffer; the track store job writes it
+    out in batches, off the request path. Once max_pending tracks, or max_pending URIs to look up,
+    are waiting, new ones are dropped
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending: Dict[str, Dict] = {}
+        self.backfill: Dict[int, Set[str]] = {}
+        self.backfill_size = 0
+        self.dropped = 0
+
+    def add_tracks(self, tracks: Iterable[Dict]):
+        for track in tracks:
+            if not track.get("uri"):
+                continue
+            if track["uri"] in self.pending or len(self.pending) < self.max_pending:
+                self.pending[track["uri"]] = track
+            else:
+                self.dropped += 1
+
+    def restore_tracks(self, tracks: Iterable[Dict]):
+        """Put back drained tracks that could not be written, unless a newer copy is already waiting"""
+        self.add_tracks(track for track in tracks if track.get("uri") not in self.pending)
+
+    def request_backfill(self, owner_id: int, uris: Iterable[str]):
+        """Queue URIs for a metadata lookup using the token of the given room owner"""
+        owner_uris = self.backfill.get(owner_id, set())
+        for uri in uris:
+            if not uri.startswith(TRACK_URI_PREFIX) or uri in self.pending or uri in owner_uris:
+                continue
+            if self.backfill_size < self.max_pending:
+                owner_uris.add(uri)
+                self.backfill_size += 1
+            else:
+                self.dropped += 1
+        if owner_uris:
+            self.backfill[owner_id] = owner_uris
+
+    def drain_tracks(self)-> List[Dict]:
+        tracks, self.pending = list(self.pending.values()), {}
+        return tracks
+
+    def drain_backfill(self)-> Dict[int, Set[str]]:
+        backfill, self.backfill = self.backfill, {}
+        self.backfill_size = 0
+        return backfill
+
+
+_track_buffer: Optional[TrackWriteBuffer] = None
+
+
+def get_track_buffer(config: Config)-> TrackWriteBuffer:
+    global _track_buffer
+    if _track_buffer is None:
+        _track_buffer = TrackWriteBuffer(config.track_store_settings()["max_pending"])
+    return _track_buffer
+
+
+metrics.register_gauge("track_buffer", lambda: {
+    "pending": len(_track_buffer.pending),
+    "backfill_owners": len(_track_buffer.backfill),
+    "backfill_uris": _track_buffer.backfill_size,
+    "dropped": _track_buffer.dropped
+} if _track_buffer else None)
+
+
+async def flush_tracks(config: Config)-> int:
+    """Write buffered tracks to the track store in batches. Returns the number of tracks written"""
+    buffer = get_track_buffer(config)
+    tracks = buffer.drain_tracks()
+    if not tracks:
+        return 0
+
+    batch_size = config.track_store_settings()["batch_size"]
+    written = 0
+    try:
+        async with config.get_database_connection() as db:
+            track_persistence = TrackPersistence(db)
+            for start in range(0, len(tracks), batch_size):
+                await track_persistence.upsert_tracks(tracks[start:start + batch_size])
+                written = start + batch_size
+    except BaseException:
+        # e.g. the database was locked, or the job was cancelled at shutdown; the
+        # tracks not yet written are retried by the next flush
+        buffer.restore_tracks(tracks[written:])
+        raise
+    return len(tracks)
+
+
+async def backfill_missing_tracks(owner_id: int, uris: Iterable[str], config: Config)-> int:
+    """
+    Fetch metadata from Spotify for any of the given URIs not in the track store,
+    in one call per MAX_TRACKS_PER_REQUEST tracks. Returns the number of tracks stored
+    """
+    async with config.get_database_connection() as db:
+        missing = await TrackPersistence(db).get_missing_uris(list(uris))
+    if not missing:
+        return 0
+
+    token = await spotify.get_valid_token_for_user(owner_id, config)
+    if not isinstance(token, str):
+        logger.debug("Not backfilling %s tracks: no usable token for user(id=%s): %s", len(missing), owner_id, token)
+        return 0
+
+    api = config.get_spotify_api()
+    fetched: List[Dict] = []
+    for start in range(0, len(missing), MAX_TRACKS_PER_REQUEST):
+        track_ids = [uri[len(TRACK_URI_PREFIX):] for uri in missing[start:start + MAX_TRACKS_PER_REQUEST]]
+        response = await api.tracks(track_ids, token)
+        fetched.extend(track_metadata(track) for track in response.get("tracks", []) if track and track.get("uri"))
+
+    async with config.get_database_connection() as db:
+        await TrackPersistence(db).upsert_tracks(fetched)
+    return len(fetched)
+
+
+async def process_track_buffer(config: Config):
+    """Flush buffered tracks, then backfill metadata for enqueued tracks we have never seen"""
+    written = await flush_tracks(config)
+    backfilled = 0
+    for owner_id, uris in get_track_buffer(config).drain_backfill().items():
+        try:
+            backfilled += await backfill_missing_tracks(owner_id, uris, config)
+        except Exception as e:
+            logger.warning("Failed to backfill %s tracks with the token of user(id=%s): %s", len(uris), owner_id, e)
+    if written or backfilled:
+        logger.debug("Stored %s tracks from search results and %s backfilled tracks", written, backfilled)
+
+
+async def get_tracks(uris: List[str], config: Config)-> Dict:
+    """Look up stored track metadata, in the order requested. Unknown URIs are left out"""
+    if not uris:
+        raise err.bad_request("Supply the track URIs to look up")
+    if len(uris) > MAX_LOOKUP_URIS:
+        raise err.bad_request(f"At most {MAX_LOOKUP_URIS} tracks may be looked up at once")
+
+    try:
+        async with config.get_database_connection() as db:
+            tracks = await TrackPersistence(db).get_tracks_by_uri(uris)
+    except Exception as e:
+        logger.exception("Failed to look up %s tracks: %s", len(uris), e)
+        raise err.internal_server_error()
+
+    return {
+        "tracks": [tracks[uri] for uri in dict.fromkeys(uris) if uri in tracks]
+    }
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, TypeVar
+from aiohttp import ClientError, ClientResponseError
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency that has been failing"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_dependency_failure(e: BaseException)-> bool:
+    """Errors meaning the dependency is unwell, as opposed to it rejecting a particular request"""
+    if isinstance(e, ClientResponseError):
+        return e.status >= 500 or e.status == 429
+    return isinstance(e, (ClientError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive dependency failures, refusing calls
+    for reset_timeout_seconds. Then a single probe call is let through: the circuit
+    closes if it succeeds, and opens again if it fails
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def _before_call(self)-> bool:
+        """Raises CircuitOpen if the call may not go ahead. Returns whether it is the probe"""
+        if self.state == CLOSED:
+            return False
+        retry_after = self.opened_at + self.reset_timeout_seconds - time.monotonic()
+        if self.state == OPEN and retry_after <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        raise CircuitOpen(self.name, max(0.0, retry_after))
+
+    def _open(self):
+        if self.state != OPEN:
+            self.times_opened += 1
+            logger.warning("Opening circuit '%s' after %s failures", self.name, self.failures)
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Closing circuit '%s'", self.name)
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    async def call(self, request: Callable[[], Awaitable[T]])-> T:
+        probe = self._before_call()
+        try:
+            result = await request()
+        except Exception as e:
+            if is_dependency_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        finally:
+            if probe:
+                self._probing = False
+        self.record_success()
+        return result
+
+    def stats(self)-> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
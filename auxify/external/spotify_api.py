@@ -1,17 +1,45 @@
 import aiohttp
-from typing import Dict
+from typing import Dict, List, Optional
 import rapidjson
 import logging
 import base64
+import functools
+
+from auxify.external.circuit_breaker import CircuitBreaker
+from auxify.external.projection import project_search_response
 
 
 logger = logging.getLogger(__name__)
 
+MAX_TRACKS_PER_REQUEST = 50
+
+# endpoint families, each with its own circuit breaker
+ACCOUNTS = "accounts"
+SEARCH = "search"
+PLAYER = "player"
+FAMILIES = (ACCOUNTS, SEARCH, PLAYER)
+
+
+def guarded(family: str):
+    """Route calls to the method through the circuit breaker of its endpoint family, if there is one"""
+    def wrapper(method):
+        @functools.wraps(method)
+        async def inner(self, *a, **k):
+            breaker = self.breakers.get(family)
+            if breaker is None:
+                return await method(self, *a, **k)
+            return await breaker.call(lambda: method(self, *a, **k))
+        return inner
+    return wrapper
+
+
 class SpotifyApi:
-    def __init__(self, session: aiohttp.ClientSession, client_id: str, client_secret: str):
+    def __init__(self, session: aiohttp.ClientSession, client_id: str, client_secret: str,
+                 breakers: Optional[Dict[str, CircuitBreaker]] = None):
         self.session = session
         self.client_id = client_id
         self.client_secret = client_secret
+        self.breakers = breakers or {}
         self.encoded_client_details = self._base64_encoded_client_details()
 
     def _base64_encoded_client_details(self)-> str:
@@ -27,16 +55,19 @@ class SpotifyApi:
             "Authorization": f"Bearer {token}"
         }
 
+    @guarded(ACCOUNTS)
     async def request_tokens(self, body: Dict)-> Dict:
         async with self.session.post("https://accounts.spotify.com/api/token", data=body) as resp:
             resp.raise_for_status()
             return await resp.json(loads=rapidjson.loads)
 
+    @guarded(ACCOUNTS)
     async def spotify_user_data(self, token: str)-> Dict:
         async with self.session.get("https://api.spotify.com/v1/me", headers=self.user_auth_header(token)) as resp:
             resp.raise_for_status()
             return await resp.json(loads=rapidjson.loads)
 
+    @guarded(ACCOUNTS)
     async def refresh_tokens(self, refresh_token: str)-> Dict:
         request = {
             "grant_type": "refresh_token",
@@ -50,6 +81,7 @@ class SpotifyApi:
             resp.raise_for_status()
             return await resp.json(loads=rapidjson.loads)
 
+    @guarded(PLAYER)
     async def enqueue_song(self, track_uri: str, token: str):
         request = {
             "uri": track_uri
@@ -65,6 +97,7 @@ class SpotifyApi:
             resp.raise_for_status()
 
 
+    @guarded(SEARCH)
     async def search(self, query: str, token: str):
         headers = self.user_auth_header(token)
         params = {"q": query, "type": "track", "market": "from_token", "limit": 20}
@@ -75,3 +108,46 @@ class SpotifyApi:
         ) as resp:
             resp.raise_for_status()
             return await resp.json(loads=rapidjson.loads)
+
+    @guarded(SEARCH)
+    async def search_tracks(self, query: str, token: str)-> List[Dict]:
+        """Search for tracks, decoding only the metadata of the playable tracks found"""
+        headers = self.user_auth_header(token)
+        params = {"q": query, "type": "track", "market": "from_token", "limit": 20}
+        async with self.session.get(
+            "https://api.spotify.com/v1/search",
+            params=params,
+            headers=headers
+        ) as resp:
+            resp.raise_for_status()
+            return project_search_response(await resp.read())
+
+    @guarded(SEARCH)
+    async def tracks(self, track_ids: List[str], token: str)-> Dict:
+        """Get several tracks by id in one call; Spotify accepts at most MAX_TRACKS_PER_REQUEST ids"""
+        if len(track_ids) > MAX_TRACKS_PER_REQUEST:
+            raise ValueError(f"At most {MAX_TRACKS_PER_REQUEST} tracks may be requested at once")
+        headers = self.user_auth_header(token)
+        params = {"ids": ",".join(track_ids), "market": "from_token"}
+        async with self.session.get(
+            "https://api.spotify.com/v1/tracks",
+            params=params,
+            headers=headers
+        ) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=rapidjson.loads)
+
+    @guarded(PLAYER)
+    async def playback_state(self, token: str)-> Optional[Dict]:
+        """Get what the user is currently playing; None if nothing is playing on any device"""
+        headers = self.user_auth_header(token)
+        params = {"market": "from_token"}
+        async with self.session.get(
+            "https://api.spotify.com/v1/me/player",
+            params=params,
+            headers=headers
+        ) as resp:
+            resp.raise_for_status()
+            if resp.status == 204:
+                return None
+            return await resp.json(loads=rapidjson.loads)
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_periodically(name: str, interval_seconds: float, job: Callable[[], Awaitable]):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Background job '%s' failed: %s", name, e)
+
+
+def periodic(name: str, interval_seconds: float, job: Callable[[], Awaitable], enabled: bool = True,
+             on_shutdown: Optional[Callable[[], Awaitable]] = None):
+    """
+    Build an aiohttp cleanup context that calls job every interval_seconds
+    for as long as the app is running, and on_shutdown once when the app stops
+    """
+    async def cleanup_ctx(_app):
+        task = None
+        if enabled:
+            logger.debug("Starting background job '%s' every %ss", name, interval_seconds)
+            task = asyncio.ensure_future(_run_periodically(name, interval_seconds, job))
+        yield
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if enabled and on_shutdown is not None:
+            try:
+                await on_shutdown()
+            except Exception as e:
+                logger.exception("Shutdown of background job '%s' failed: %s", name, e)
+
+    return cleanup_ctx
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import time
+
+from auxify.config import Config
+from auxify.jobs import periodic
+from auxify.models.room_archive import RoomArchivePersistence
+
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_inactive_rooms(config: Config)-> int:
+    """
+    Move rooms inactive for longer than the configured number of days, and their members,
+    into the archive tables. Work is done in small batches, each in its own short transaction,
+    with a pause between batches so that request writes are never blocked for long.
+    Returns the number of rooms archived
+    """
+    settings = config.archive_settings()
+    archived = 0
+    started = time.perf_counter()
+    # each room shard archives its own rooms
+    for location in config.room_database_locations():
+        for _ in range(settings["max_batches_per_run"]):
+            async with config.get_database_connection(location) as db:
+                archive_persistence = RoomArchivePersistence(db)
+                room_ids = await archive_persistence.get_archivable_room_ids(
+                    settings["inactive_days"], settings["batch_size"])
+                archived += await archive_persistence.archive_rooms(room_ids)
+
+            if len(room_ids) < settings["batch_size"]:
+                break
+            await asyncio.sleep(settings["batch_pause_seconds"])
+
+    if archived:
+        logger.info("Archived %s inactive rooms in %.3fs", archived, time.perf_counter() - started)
+    return archived
+
+
+def archival_job(config: Config):
+    """Cleanup context running room archival on the interval given in Config"""
+    settings = config.archive_settings()
+    return periodic(
+        "room archival",
+        settings["interval_seconds"],
+        lambda: archive_inactive_rooms(config),
+        enabled=settings["enabled"])
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from auxify.config import Config
+from auxify.jobs import periodic
+from auxify.middlewares.activity import activity
+from auxify.models.maintenance import MaintenancePersistence, AUTO_VACUUM_INCREMENTAL
+
+
+logger = logging.getLogger(__name__)
+
+
+async def wait_for_quiet_period(quiet_seconds: float, max_wait_seconds: float, poll_seconds: float = 1.0)-> bool:
+    """Wait until no requests have been served for quiet_seconds.
+    Returns False if the server did not go quiet within max_wait_seconds"""
+    deadline = time.monotonic() + max_wait_seconds
+    while not activity.is_quiet(quiet_seconds):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(poll_seconds)
+    return True
+
+
+async def run_maintenance(config: Config, *, wait_for_quiet: bool = True)-> Optional[Dict]:
+    """
+    Refresh planner statistics, checkpoint the WAL and return free pages to the filesystem.
+    Returns a report of what was done, or None if the server never went quiet
+    """
+    settings = config.maintenance_settings()
+    if wait_for_quiet and not await wait_for_quiet_period(settings["quiet_seconds"], settings["max_wait_seconds"]):
+        logger.info("Skipping database maintenance: no quiet period within %ss", settings["max_wait_seconds"])
+        return None
+
+    report = await maintain_database(config, settings, config.database_location())
+    shards = config.room_shards()
+    if shards is not None:
+        report["room_shards"] = {
+            location: await maintain_database(config, settings, location) for location in shards.locations
+        }
+    return report
+
+
+async def maintain_database(config: Config, settings: Dict, location: str)-> Dict:
+    """Maintenance of one database file, the main database or a room shard"""
+    timings = {}
+    report: Dict = {"timings": timings}
+    started = time.perf_counter()
+    async with config.get_database_connection(location) as db:
+        maintenance = MaintenancePersistence(db)
+        report["before"] = await maintenance.page_stats()
+
+        step_started = time.perf_counter()
+        if settings["full_analyze"]:
+            await maintenance.analyze()
+        else:
+            await maintenance.optimize(settings["analysis_limit"])
+        timings["analyze"] = time.perf_counter() - step_started
+
+        if await maintenance.journal_mode() == "wal":
+            step_started = time.perf_counter()
+            report["checkpoint"] = await maintenance.wal_checkpoint(settings["checkpoint_mode"])
+            timings["checkpoint"] = time.perf_counter() - step_started
+
+        if await maintenance.auto_vacuum_mode() == AUTO_VACUUM_INCREMENTAL:
+            step_started = time.perf_counter()
+            report["pages_vacuumed"] = await maintenance.incremental_vacuum(settings["vacuum_pages"])
+            timings["vacuum"] = time.perf_counter() - step_started
+        else:
+            logger.debug("Database was not created with auto_vacuum = INCREMENTAL; skipping incremental vacuum")
+
+        report["after"] = await maintenance.page_stats()
+    timings["total"] = time.perf_counter() - started
+
+    logger.info(
+        "Database maintenance of %s finished in %.3fs: pages %s -> %s, free pages %s -> %s, timings %s",
+        location, timings["total"],
+        report["before"]["page_count"], report["after"]["page_count"],
+        report["before"]["freelist_count"], report["after"]["freelist_count"],
+        {step: round(seconds, 4) for step, seconds in timings.items()}
+    )
+    return report
+
+
+def maintenance_job(config: Config):
+    """Cleanup context running database maintenance on the interval given in Config"""
+    settings = config.maintenance_settings()
+    return periodic(
+        "sqlite maintenance",
+        settings["interval_seconds"],
+        lambda: run_maintenance(config),
+        enabled=settings["enabled"])
@@ -0,0 +1,75 @@
+import logging
+from itertools import islice
+from typing import Dict, List
+
+from auxify.config import Config
+from auxify.jobs import periodic
+from auxify.models.rooms import RoomPersistence
+from auxify.controllers.room_activity import room_activity
+from auxify.controllers import room_cache, profile_cache, room_snapshots
+
+
+logger = logging.getLogger(__name__)
+
+
+def _batches(last_active: Dict[int, float], batch_size: int):
+    items = iter(last_active.items())
+    while True:
+        batch = dict(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+async def flush_room_activity(config: Config):
+    """Write the in-memory last-activity times to the database in batches"""
+    pending = room_activity.drain()
+    if not pending:
+        return
+    settings = config.room_expiry_settings()
+    try:
+        async with config.get_room_database() as db:
+            room_persistence = RoomPersistence(db)
+            for batch in _batches(pending, settings["batch_size"]):
+                await room_persistence.touch_rooms(batch)
+    except Exception:
+        room_activity.restore(pending)
+        raise
+    logger.debug("Flushed activity for %s rooms", len(pending))
+
+
+async def expire_stale_rooms(config: Config)-> List[int]:
+    """
+    Flush recent room activity, then deactivate active rooms with no activity within the TTL.
+    Returns the ids of the rooms that were deactivated
+    """
+    settings = config.room_expiry_settings()
+    await flush_room_activity(config)
+
+    expired: List[int] = []
+    async with config.get_room_database() as db:
+        room_persistence = RoomPersistence(db)
+        while True:
+            room_ids = await room_persistence.get_stale_room_ids(settings["ttl_seconds"], settings["batch_size"])
+            await room_persistence.deactivate_rooms(room_ids)
+            room_cache.mark_inactive(room_ids)
+            profile_cache.invalidate_rooms(room_ids)
+            room_snapshots.deactivated(room_ids)
+            expired.extend(room_ids)
+            if len(room_ids) < settings["batch_size"]:
+                break
+
+    if expired:
+        logger.info("Deactivated %s rooms with no activity in the last %ss", len(expired), settings["ttl_seconds"])
+    return expired
+
+
+def room_expiry_job(config: Config):
+    """Cleanup context flushing room activity and expiring stale rooms on the interval given in Config"""
+    settings = config.room_expiry_settings()
+    return periodic(
+        "room expiry",
+        settings["interval_seconds"],
+        lambda: expire_stale_rooms(config),
+        enabled=settings["enabled"],
+        on_shutdown=lambda: flush_room_activity(config))
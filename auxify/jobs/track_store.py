@@ -0,0 +1,14 @@
+from auxify.config import Config
+from auxify.jobs import periodic
+from auxify.controllers.tracks import process_track_buffer, flush_tracks
+
+
+def track_store_job(config: Config):
+    """Cleanup context writing buffered track metadata to the track store on the interval given in Config"""
+    settings = config.track_store_settings()
+    return periodic(
+        "track store",
+        settings["interval_seconds"],
+        lambda: process_track_buffer(config),
+        enabled=settings["enabled"],
+        on_shutdown=lambda: flush_tracks(config))
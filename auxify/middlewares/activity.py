@@ -0,0 +1,32 @@
+from aiohttp import web
+from aiohttp.web import Request
+import time
+
+
+class RequestActivity:
+    """Tracks how busy the server is, so that background work can wait for quiet periods"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.last_request_at = time.monotonic()
+
+    def seconds_idle(self)-> float:
+        if self.in_flight:
+            return 0.0
+        return time.monotonic() - self.last_request_at
+
+    def is_quiet(self, quiet_seconds: float)-> bool:
+        return self.in_flight == 0 and self.seconds_idle() >= quiet_seconds
+
+
+activity = RequestActivity()
+
+
+@web.middleware
+async def activity_middleware(request: Request, handler):
+    activity.in_flight += 1
+    try:
+        return await handler(request)
+    finally:
+        activity.in_flight -= 1
+        activity.last_request_at = time.monotonic()
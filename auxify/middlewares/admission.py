@@ -0,0 +1,125 @@
+from aiohttp import web
+from aiohttp.web import Request, json_response
+from typing import Dict, Optional
+import asyncio
+import logging
+import math
+
+from auxify.config import Config
+from auxify.utils import json_dumps_with_default, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Lets at most concurrency requests run at once, with up to max_queue more waiting
+    for up to queue_timeout_seconds. Requests beyond those are refused immediately,
+    so a slow dependency cannot pile up unbounded requests in flight
+    """
+
+    def __init__(self, concurrency: int, max_queue: int, queue_timeout_seconds: float):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        # created on first use, so that it belongs to the loop serving requests
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    async def acquire(self)-> bool:
+        """Wait for a slot. Returns False if the request should be shed instead"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            self.in_flight += 1
+            return True
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            return False
+
+        # not asyncio.wait_for: before Python 3.9.1 a slot acquired just as the waiting request
+        # is cancelled, e.g. when its client disconnects, is never released (bpo-42130)
+        self.queued += 1
+        acquiring = asyncio.ensure_future(self._slots.acquire())
+        try:
+            done, _ = await asyncio.wait({acquiring}, timeout=self.queue_timeout_seconds)
+        except asyncio.CancelledError:
+            self._abandon(acquiring)
+            raise
+        finally:
+            self.queued -= 1
+        if not done:
+            self._abandon(acquiring)
+            self.timed_out += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def _abandon(self, acquiring: asyncio.Future):
+        """Stop waiting for a slot, releasing it if it was acquired anyway"""
+        def release_acquired(acquired: asyncio.Future):
+            if not acquired.cancelled() and acquired.exception() is None:
+                self._slots.release() # type: ignore
+
+        if acquiring.done():
+            release_acquired(acquiring)
+        else:
+            acquiring.cancel()
+            acquiring.add_done_callback(release_acquired)
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release() # type: ignore
+
+    def stats(self)-> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out
+        }
+
+
+def service_unavailable(retry_after: float)-> web.Response:
+    return json_response({
+        "error": True,
+        "status": 503,
+        "message": "The server is too busy to handle this request; please try again in a little while"
+    }, status=503, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}, dumps=json_dumps_with_default)
+
+
+def admission_middleware(config: Config):
+    """
+    Middleware applying the per-route admission limits from Config, e.g. to routes
+    that wait on Spotify. Other routes are not limited, so they stay responsive
+    while those wait
+    """
+    settings = config.admission_settings()
+    controllers = {
+        route: AdmissionController(limits["concurrency"], limits["max_queue"], limits["queue_timeout_seconds"])
+        for route, limits in settings["routes"].items()
+    }
+    metrics.register_gauge("admission", lambda: {route: controller.stats() for route, controller in controllers.items()})
+
+    @web.middleware
+    async def middleware(request: Request, handler):
+        resource = request.match_info.route.resource
+        controller = controllers.get(resource.canonical) if resource is not None else None
+        if controller is None:
+            return await handler(request)
+
+        if not await controller.acquire():
+            metrics.increment(f"shed {resource.canonical}")
+            logger.debug("Shed a request to %s: %s", resource.canonical, controller.stats())
+            return service_unavailable(settings["retry_after_seconds"])
+        try:
+            return await handler(request)
+        finally:
+            controller.release()
+
+    return middleware
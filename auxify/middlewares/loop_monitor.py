@@ -0,0 +1,166 @@
+from aiohttp import web
+from aiohttp.web import Request
+from collections import deque
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+
+from auxify.config import Config
+from auxify.utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(ordered: List[float], fraction: float)-> float:
+    """Nearest-rank percentile of an already sorted, non-empty list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class LoopLagSampler:
+    """
+    Measures event loop lag: how much later than requested a sleep of interval_seconds
+    wakes up. Keeps the last window samples, from which percentiles are reported
+    """
+
+    def __init__(self, interval_seconds: float, window: int):
+        self.interval_seconds = interval_seconds
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, lag_seconds: float):
+        self.samples.append(max(0.0, lag_seconds))
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.record(time.monotonic() - expected)
+
+    def stats(self)-> Optional[Dict]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(percentile(ordered, 0.5) * 1000, 2),
+            "p90_ms": round(percentile(ordered, 0.9) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2)
+        }
+
+
+class BlockingCallDetector:
+    """
+    Reports callbacks that hold the event loop for longer than threshold_seconds.
+    The loop schedules a heartbeat every check_interval_seconds; a watchdog thread
+    that sees the heartbeat go stale captures the loop thread's stack, and the route
+    of the request whose task is running, while the loop is still blocked
+    """
+
+    def __init__(self, threshold_seconds: float, check_interval_seconds: float):
+        self.threshold_seconds = threshold_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.routes: Dict[asyncio.Task, str] = {}
+        self.reported = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        self._heartbeat = self._loop.call_later(self.check_interval_seconds, self._beat) # type: ignore
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    def current_route(self)-> Optional[str]:
+        try:
+            task = asyncio.current_task(self._loop)
+        except Exception:
+            return None
+        return self.routes.get(task) if task is not None else None # type: ignore
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.check_interval_seconds):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold_seconds or beat == reported_beat:
+                continue
+            # report each stall once, while it is still in progress
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id) # type: ignore
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unavailable)"
+            route = self.current_route() or "(no request)"
+            self.reported += 1
+            metrics.increment(f"slow_callbacks {route}")
+            logger.warning("Event loop blocked for over %.0fms in %s:\n%s", blocked_for * 1000, route, stack)
+
+    def middleware(self):
+        """Middleware recording the route handled by each request task, for reports"""
+        @web.middleware
+        async def middleware(request: Request, handler):
+            task = asyncio.current_task()
+            if task is None:
+                return await handler(request)
+            resource = request.match_info.route.resource
+            self.routes[task] = f"{request.method} {resource.canonical if resource is not None else request.path}"
+            try:
+                return await handler(request)
+            finally:
+                self.routes.pop(task, None)
+
+        return middleware
+
+
+class LoopMonitor:
+    """The lag sampler and, in debug mode, the blocking call detector configured in Config"""
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        self.sampler = LoopLagSampler(settings["sample_interval_seconds"], settings["window"])
+        self.detector = None
+        if settings["detect_blocking"]:
+            self.detector = BlockingCallDetector(settings["blocking_threshold_seconds"], settings["check_interval_seconds"])
+
+    def middlewares(self)-> List:
+        return [self.detector.middleware()] if self.detector is not None else []
+
+    async def cleanup_ctx(self, _app):
+        metrics.register_gauge("loop_lag", self.sampler.stats)
+        task = asyncio.ensure_future(self.sampler.run())
+        if self.detector is not None:
+            self.detector.start(asyncio.get_event_loop())
+        yield
+        if self.detector is not None:
+            self.detector.stop()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def loop_monitor(config: Config)-> Optional[LoopMonitor]:
+    settings = config.loop_monitor_settings()
+    return LoopMonitor(settings) if settings["enabled"] else None
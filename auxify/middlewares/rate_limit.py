@@ -0,0 +1,184 @@
+from aiohttp import web
+from aiohttp.web import Request, json_response
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+import logging
+import math
+import time
+
+from auxify.config import Config
+from auxify.utils import jwt, json_dumps_with_default, metrics
+
+
+logger = logging.getLogger(__name__)
+
+CLAIMS_KEY = "claims"
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets refilling at rate tokens per second up to burst, one per key.
+    Buckets are kept in least-recently-used order: idle buckets that have refilled
+    are dropped as they reach the front, since a new bucket would be identical,
+    and the least recently used bucket is evicted once there are maxsize of them
+    """
+
+    def __init__(self, rate: float, burst: float, maxsize: int):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.seconds_to_refill = burst / rate
+        self._buckets: OrderedDict = OrderedDict()
+
+    def _evict_idle(self, now: float):
+        while self._buckets:
+            oldest = next(iter(self._buckets.values()))
+            if now - oldest.updated_at < self.seconds_to_refill and len(self._buckets) <= self.maxsize:
+                return
+            self._buckets.popitem(last=False)
+
+    def acquire(self, key: Hashable, now: Optional[float] = None)-> float:
+        """Take a token for key. Returns 0 if one was available, else the seconds until one will be"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[key] = bucket
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+        self._evict_idle(now)
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    def refund(self, key: Hashable):
+        """Give back a token taken by acquire, for a request that was not let through after all"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + 1)
+
+    def __len__(self)-> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """Per-route limiters keyed by user (the JWT subject, or the client address when logged out) and by room"""
+
+    def __init__(self, settings: Dict):
+        self.routes = settings["routes"]
+        self.default = settings.get("default") or {}
+        self.max_buckets = settings["max_buckets"]
+        self.trusted_proxies = set(settings.get("trusted_proxies", []))
+        self._limiters: Dict = {}
+
+    def limits(self, route: str)-> Dict:
+        return self.routes.get(route, self.default)
+
+    def client_address(self, remote: Optional[str], forwarded_for: Optional[str])-> Optional[str]:
+        """
+        The address of the client: when the request comes from a trusted proxy, the nearest
+        address in X-Forwarded-For that is not also a trusted proxy, as the addresses before it
+        are set by the client; otherwise the peer address
+        """
+        if remote not in self.trusted_proxies or not forwarded_for:
+            return remote
+        for address in reversed(forwarded_for.split(",")):
+            address = address.strip()
+            if address and address not in self.trusted_proxies:
+                return address
+        return remote
+
+    def _limiter(self, route: str, scope: str, limit: Dict)-> TokenBucketLimiter:
+        limiter = self._limiters.get((route, scope))
+        if limiter is None:
+            limiter = TokenBucketLimiter(limit["rate"], limit["burst"], self.max_buckets)
+            self._limiters[(route, scope)] = limiter
+        return limiter
+
+    def check(self, route: str, user_key: Hashable, room_id: Optional[str])-> float:
+        """
+        Returns 0 if the request may proceed, else the seconds to wait before retrying. A token is
+        only taken from each bucket when both allow the request, so a busy room does not use up
+        the limits of its members
+        """
+        limits = self.limits(route)
+        user_limiter = self._limiter(route, "user", limits["user"]) if "user" in limits else None
+        if user_limiter is not None:
+            retry_after = user_limiter.acquire(user_key)
+            if retry_after:
+                return retry_after
+        if "room" in limits and room_id is not None:
+            retry_after = self._limiter(route, "room", limits["room"]).acquire(room_id)
+            if retry_after:
+                if user_limiter is not None:
+                    user_limiter.refund(user_key)
+                return retry_after
+        return 0.0
+
+    def stats(self)-> Dict:
+        return {f"{route} {scope}": len(limiter) for (route, scope), limiter in self._limiters.items()}
+
+
+def _claims_from_request(request: Request, config: Config)-> Optional[Dict]:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        return None
+    try:
+        return jwt.get_claims_from_jwt(auth_header.split(" ")[1], config.jwt_key(), jwt.Aud.AUTH)
+    except Exception:
+        return None
+
+
+def too_many_requests(retry_after: float)-> web.Response:
+    return json_response({
+        "error": True,
+        "status": 429,
+        "message": "Too many requests; please try again in a little while"
+    }, status=429, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}, dumps=json_dumps_with_default)
+
+
+def rate_limit_middleware(config: Config):
+    """
+    Middleware applying the per-route limits from Config. On limited routes, a valid login
+    token is verified once here and stored on the request, so login_required does not verify
+    it again
+    """
+    rate_limiter = RateLimiter(config.rate_limit_settings())
+    metrics.register_gauge("rate_limit_buckets", rate_limiter.stats)
+
+    @web.middleware
+    async def middleware(request: Request, handler):
+        resource = request.match_info.route.resource
+        if resource is None:
+            return await handler(request)
+        route = resource.canonical
+        if not rate_limiter.limits(route):
+            return await handler(request)
+
+        claims = _claims_from_request(request, config)
+        if claims is not None:
+            request[CLAIMS_KEY] = claims
+            user_key = ("user", claims["sub"])
+        else:
+            user_key = ("address", rate_limiter.client_address(request.remote, request.headers.get("X-Forwarded-For")))
+
+        retry_after = rate_limiter.check(route, user_key, request.match_info.get("room_id"))
+        if retry_after:
+            metrics.increment(f"rate_limited {route}")
+            logger.debug("Rate limited %s on %s for %.2fs", user_key, route, retry_after)
+            return too_many_requests(retry_after)
+        return await handler(request)
+
+    return middleware
@@ -2,7 +2,10 @@ def cast_key(key, cast):
     def wrapper(f):
         async def inner(*a, **k):
             result = await f(*a, **k)
-            if isinstance(result, dict) and key in result:
+            if not isinstance(result, dict):
+                # e.g. a sqlite3.Row returned without copying it into a dict, which cannot be cast
+                raise TypeError(f"{f.__name__} returned {type(result).__name__}; cast_key({key!r}) needs a dict")
+            if key in result:
                 result[key] = cast(result[key])
             return result
         return inner
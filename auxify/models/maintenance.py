@@ -0,0 +1,64 @@
+from aiosqlite import Connection
+from typing import Dict, Optional
+
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class MaintenancePersistence:
+    def __init__(self, db: Connection):
+        self.db = db
+
+    async def _pragma_value(self, pragma: str):
+        cursor = await self.db.execute(f"PRAGMA {pragma}")
+        result = await cursor.fetchone()
+        return result[0] if result else None
+
+    async def page_stats(self)-> Dict:
+        """Get the size of the database file in pages, and how many of those pages are free"""
+        return {
+            "page_count": await self._pragma_value("page_count"),
+            "freelist_count": await self._pragma_value("freelist_count"),
+            "page_size": await self._pragma_value("page_size")
+        }
+
+    async def journal_mode(self)-> str:
+        return str(await self._pragma_value("journal_mode")).lower()
+
+    async def auto_vacuum_mode(self)-> int:
+        return int(await self._pragma_value("auto_vacuum"))
+
+    async def optimize(self, analysis_limit: Optional[int] = None):
+        """Run PRAGMA optimize, which runs ANALYZE on any tables whose statistics look stale;
+        analysis_limit bounds the number of rows ANALYZE looks at per index"""
+        if analysis_limit is not None:
+            await self.db.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+        await self.db.execute("PRAGMA optimize")
+
+    async def analyze(self):
+        await self.db.execute("ANALYZE")
+        await self.db.commit()
+
+    async def wal_checkpoint(self, mode: str = "PASSIVE")-> Dict:
+        """Checkpoint the write-ahead log into the database file.
+        Returns a dict with keys busy, log_pages and checkpointed_pages"""
+        if mode.upper() not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise Exception(f"Unknown WAL checkpoint mode {mode}")
+        cursor = await self.db.execute(f"PRAGMA wal_checkpoint({mode.upper()})")
+        result = await cursor.fetchone()
+        return {
+            "busy": bool(result[0]),
+            "log_pages": result[1],
+            "checkpointed_pages": result[2]
+        }
+
+    async def incremental_vacuum(self, max_pages: int)-> int:
+        """Return up to max_pages free pages to the filesystem.
+        Only has an effect on databases created with auto_vacuum = INCREMENTAL.
+        Returns the number of pages freed"""
+        before = await self._pragma_value("freelist_count")
+        # the pragma frees one page per step; executescript steps it to completion,
+        # where execute would stop after the first page
+        await self.db.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        after = await self._pragma_value("freelist_count")
+        return before - after
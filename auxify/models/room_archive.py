@@ -0,0 +1,74 @@
+from aiosqlite import Connection
+from typing import List
+
+
+class RoomArchivePersistence:
+    def __init__(self, db: Connection):
+        self.db = db
+
+    async def get_archivable_room_ids(self, inactive_days: float, limit: int)-> List[int]:
+        """
+        Get ids of rooms that were deactivated more than inactive_days ago.
+        The room with the highest id is never archivable: new rooms are given the next
+        id after the highest in room, so removing it would hand its id out again
+        """
+        query = """
+            SELECT room_id
+            FROM room
+            WHERE active = :false
+              AND deactivated_at < datetime('now', :age)
+              AND room_id < (SELECT MAX(room_id) FROM room)
+            LIMIT :limit
+        """
+        params = {
+            "false": False,
+            "age": f"-{float(inactive_days)} days",
+            "limit": limit
+        }
+
+        cursor = await self.db.execute(query, params)
+        return [row[0] for row in await cursor.fetchall()]
+
+    async def archive_rooms(self, room_ids: List[int])-> int:
+        """Move the given inactive rooms and their members into the archive tables
+        in a single transaction. Returns the number of rooms archived"""
+        if not room_ids:
+            return 0
+
+        placeholders = ", ".join(f":room_{i}" for i in range(len(room_ids)))
+        params = {f"room_{i}": room_id for i, room_id in enumerate(room_ids)}
+        params["false"] = False
+
+        archive_rooms = f"""
+            INSERT OR IGNORE INTO room_archive (room_id, owner_id, active, created_at, deactivated_at, room_code, room_name)
+            SELECT room_id, owner_id, active, created_at, deactivated_at, room_code, room_name
+            FROM room
+            WHERE room_id IN ({placeholders})
+              AND active = :false
+        """
+        archive_members = f"""
+            INSERT OR IGNORE INTO room_member_archive (room_id, user_id)
+            SELECT room_member.room_id, room_member.user_id
+            FROM room_member
+            INNER JOIN room_archive ON room_archive.room_id = room_member.room_id
+            WHERE room_member.room_id IN ({placeholders})
+        """
+        delete_members = f"""
+            DELETE FROM room_member
+            WHERE room_id IN ({placeholders})
+              AND EXISTS (SELECT 1 FROM room_archive WHERE room_archive.room_id = room_member.room_id)
+        """
+        delete_rooms = f"""
+            DELETE FROM room
+            WHERE room_id IN ({placeholders})
+              AND EXISTS (SELECT 1 FROM room_archive WHERE room_archive.room_id = room.room_id)
+        """
+
+        async with self.db.cursor() as cur:
+            await cur.execute(archive_rooms, params)
+            await cur.execute(archive_members, params)
+            await cur.execute(delete_members, params)
+            await cur.execute(delete_rooms, params)
+            archived = cur.rowcount
+            await self.db.commit()
+            return archived
@@ -1,40 +1,75 @@
 from aiosqlite import Connection
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List, Set, TypeVar
 from datetime import datetime
+import asyncio
 
 from . import cast_key
+from .shards import RoomDatabase, ShardConnections
+
+T = TypeVar("T")
 
 
 class RoomPersistence:
-    def __init__(self, db: Connection):
-        self.db = db
+    """
+    Rooms and their members, in the main database or split across room shards. Queries
+    about one room go to its shard, queries about many rooms to each of their shards,
+    and queries about a user, who may have joined rooms in any shard, to every shard
+    """
+
+    def __init__(self, db: RoomDatabase):
+        self.shards = db if isinstance(db, ShardConnections) else ShardConnections.single(db)
+
+    async def _on_shard(self, shard: int, query: Callable[[Connection], Awaitable[T]])-> T:
+        return await query(await self.shards.get(shard))
+
+    async def _on_shards(self, shards: List[int], query: Callable[[int, Connection], Awaitable[T]])-> List[T]:
+        """Run query against each of shards at once, each on its shard's connection"""
+        if len(shards) == 1:
+            return [await query(shards[0], await self.shards.get(shards[0]))]
+        return await asyncio.gather(*[self._on_shard(shard, lambda db, shard=shard: query(shard, db)) for shard in shards])
+
+    def _by_shard(self, room_ids: List[int])-> Dict[int, List[int]]:
+        by_shard: Dict[int, List[int]] = {}
+        for room_id in room_ids:
+            by_shard.setdefault(self.shards.of_room(room_id), []).append(room_id)
+        return by_shard
 
     async def create_room(self, owner: int, room_code: Optional[str], room_name: str)-> int:
         deactivate_old_rooms = """
             UPDATE room
-            SET active = :false
+            SET active = :false, deactivated_at = CURRENT_TIMESTAMP
             WHERE owner_id = :owner
+              AND active = :true
         """
         deactivate_old_room_params = {
             "false": False,
+            "true": True,
             "owner": owner
         }
 
+        # ids in a shard are congruent to the shard modulo the number of shards; with one
+        # database this is the id SQLite would have given, one more than the highest.
+        # last_active_at is set explicitly, as it has no default in migrated databases
         create_room = """
-            INSERT INTO room (owner_id, active, room_code, room_name)
-            VALUES (:owner, :true, :room_code, :room_name)
+            INSERT INTO room (room_id, owner_id, active, last_active_at, room_code, room_name)
+            SELECT COALESCE(MAX(room_id), :shard) + :shard_count, :owner, :true, CURRENT_TIMESTAMP, :room_code, :room_name
+            FROM room
         """
+        shard = self.shards.of_owner(owner)
         create_room_params = {
+            "shard": shard,
+            "shard_count": self.shards.count,
             "owner": owner,
             "true": True,
             "room_code": room_code,
             "room_name": room_name
         }
 
-        async with self.db.cursor() as cur: # treats the block as a transaction
+        db = await self.shards.get(shard)
+        async with db.cursor() as cur: # treats the block as a transaction
             await cur.execute(deactivate_old_rooms, deactivate_old_room_params)
             await cur.execute(create_room, create_room_params)
-            await self.db.commit()
+            await db.commit()
             return cur.lastrowid
 
 
@@ -50,8 +85,43 @@ class RoomPersistence:
             "user_id": user_id
         }
 
-        await self.db.execute(insert, params)
-        await self.db.commit()
+        db = await self.shards.for_room(room_id)
+        await db.execute(insert, params)
+        await db.commit()
+
+    async def add_user_to_active_room(self, room_id: int, user_id: int)-> bool:
+        """
+        Add the user to the room only if it exists and is active. Returns whether the
+        room is active, i.e. whether the user is now a member
+        """
+        insert = """
+            INSERT INTO room_member (room_id, user_id)
+            SELECT :room_id, :user_id
+            WHERE EXISTS (SELECT 1 FROM room WHERE room_id = :room_id AND active = :true)
+            ON CONFLICT DO NOTHING
+        """
+        # the insert does nothing both for a member and for a room that is not active
+        check_active = """
+            SELECT 1
+            FROM room
+            WHERE room_id = :room_id
+              AND active = :true
+        """
+
+        params = {
+            "room_id": room_id,
+            "user_id": user_id,
+            "true": True
+        }
+
+        db = await self.shards.for_room(room_id)
+        cursor = await db.execute(insert, params)
+        active = cursor.rowcount > 0
+        if not active:
+            cursor = await db.execute(check_active, params)
+            active = await cursor.fetchone() is not None
+        await db.commit()
+        return active
 
     async def remove_user_from_room(self, room_id: int, user_id: int):
         delete_user = """
@@ -64,16 +134,91 @@ class RoomPersistence:
             "room_id": room_id
         }
 
-        await self.db.execute(delete_user, params)
-        await self.db.commit()
+        db = await self.shards.for_room(room_id)
+        await db.execute(delete_user, params)
+        await db.commit()
+
+
+    async def get_rooms(self, room_ids: List[int])-> List[Dict]:
+        """Get many rooms by id in one query; ids with no room are left out"""
+        if not room_ids:
+            return []
+
+        by_shard = self._by_shard(room_ids)
+
+        async def get_shard_rooms(shard: int, db: Connection)-> List[Dict]:
+            shard_room_ids = by_shard[shard]
+            placeholders = ", ".join(f":room_{i}" for i in range(len(shard_room_ids)))
+            query = f"""
+                SELECT room_id, owner_id, active, created_at, room_code, room_name
+                FROM room
+                WHERE room_id IN ({placeholders})
+                UNION ALL
+                SELECT room_id, owner_id, active, created_at, room_code, room_name
+                FROM room_archive
+                WHERE room_id IN ({placeholders})
+            """
+            params = {f"room_{i}": room_id for i, room_id in enumerate(shard_room_ids)}
+
+            cursor = await db.execute(query, params)
+            return [dict(row) for row in await cursor.fetchall()]
+
+        rooms = [room for shard_rooms in await self._on_shards(list(by_shard), get_shard_rooms) for room in shard_rooms]
+        for room in rooms:
+            room["active"] = bool(room["active"])
+        return rooms
+
+    async def get_joined_room_ids(self, user_id: int, room_ids: List[int])-> Set[int]:
+        """Which of room_ids the user is a member of, in one query; ownership is not included"""
+        if not room_ids:
+            return set()
+
+        by_shard = self._by_shard(room_ids)
+
+        async def get_shard_joined_room_ids(shard: int, db: Connection)-> Set[int]:
+            shard_room_ids = by_shard[shard]
+            placeholders = ", ".join(f":room_{i}" for i in range(len(shard_room_ids)))
+            query = f"""
+                SELECT room_id
+                FROM room_member
+                WHERE user_id = :user_id
+                  AND room_id IN ({placeholders})
+            """
+            params: Dict = {f"room_{i}": room_id for i, room_id in enumerate(shard_room_ids)}
+            params["user_id"] = user_id
+
+            cursor = await db.execute(query, params)
+            return {row[0] for row in await cursor.fetchall()}
+
+        return set().union(*await self._on_shards(list(by_shard), get_shard_joined_room_ids))
+
+    async def get_member_ids(self, room_id: int)-> List[int]:
+        """Ids of the users who have joined the room, not including its owner"""
+        query = """
+            SELECT user_id
+            FROM room_member
+            WHERE room_id = :room_id
+        """
+        params = {
+            "room_id": room_id
+        }
 
+        db = await self.shards.for_room(room_id)
+        cursor = await db.execute(query, params)
+        return [row[0] for row in await cursor.fetchall()]
 
     async def check_user_in_room(self, user_id: int, room_id: int)-> bool:
+        # memberships of archived rooms are moved to room_member_archive
         query = """
             SELECT user_id
             FROM room_member
             WHERE   room_member.user_id = :user_id
                 AND room_member.room_id = :room_id 
+            UNION ALL
+            SELECT user_id
+            FROM room_member_archive
+            WHERE   room_member_archive.user_id = :user_id
+                AND room_member_archive.room_id = :room_id
             LIMIT 1
         """
         params = {
@@ -81,23 +226,30 @@ class RoomPersistence:
             "room_id": room_id
         }
 
-        cursor = await self.db.execute(query, params)
+        db = await self.shards.for_room(room_id)
+        cursor = await db.execute(query, params)
         result = await cursor.fetchone()
         return bool(result)
 
     @cast_key("active", bool)
     async def get_room(self, room_id: int)-> Dict:
+        # long-inactive rooms are moved to room_archive, but should still be found by id
         query = """
             SELECT room_id, owner_id, active, created_at, room_code, room_name
             FROM room
             WHERE room_id = :room_id
+            UNION ALL
+            SELECT room_id, owner_id, active, created_at, room_code, room_name
+            FROM room_archive
+            WHERE room_id = :room_id
             LIMIT 1
         """
         params = {
             "room_id": room_id
         }
 
-        cursor = await self.db.execute(query, params)
+        db = await self.shards.for_room(room_id)
+        cursor = await db.execute(query, params)
         result = await cursor.fetchone()
         return dict(result) if result else {}
     
@@ -116,7 +268,8 @@ class RoomPersistence:
             "true": True
         }
 
-        cursor = await self.db.execute(query, params)
+        db = await self.shards.get(self.shards.of_owner(owner_id))
+        cursor = await db.execute(query, params)
         result = await cursor.fetchone()
         return dict(result) if result else {}
 
@@ -142,16 +295,101 @@ class RoomPersistence:
             "true": True
         }
 
-        cursor = await self.db.execute(query, params)
-        return [dict(row) for row in await cursor.fetchall()]
+        async def get_shard_joined_rooms(_shard: int, db: Connection)-> List[Dict]:
+            cursor = await db.execute(query, params)
+            return [dict(row) for row in await cursor.fetchall()]
+
+        per_shard = await self._on_shards(self.shards.shards(), get_shard_joined_rooms)
+        if len(per_shard) == 1:
+            return per_shard[0]
+        return sorted((room for rooms in per_shard for room in rooms), key=lambda room: room["created_at"], reverse=True)
 
     async def deactivate_room(self, room_id: int):
-        deactivate_query = """UPDATE room SET active = :false WHERE room_id = :room_id"""
+        deactivate_query = """
+            UPDATE room
+            SET active = :false, deactivated_at = CURRENT_TIMESTAMP
+            WHERE room_id = :room_id
+              AND active = :true
+        """
 
         params = {
             "false": False,
+            "true": True,
             "room_id": room_id
         }
 
-        await self.db.execute(deactivate_query, params)
-        await self.db.commit()
\ No newline at end of file
+        db = await self.shards.for_room(room_id)
+        await db.execute(deactivate_query, params)
+        await db.commit()
+
+    async def touch_rooms(self, last_active: Dict[int, float]):
+        """Record the last activity in active rooms; last_active maps room_id to a unix timestamp"""
+        touch_query = """
+            UPDATE room
+            SET last_active_at = datetime(:last_active, 'unixepoch')
+            WHERE room_id = :room_id
+              AND active = :true
+              AND last_active_at < datetime(:last_active, 'unixepoch')
+        """
+
+        by_shard = self._by_shard(list(last_active))
+
+        async def touch_shard_rooms(shard: int, db: Connection):
+            params = [{
+                "room_id": room_id,
+                "last_active": last_active[room_id],
+                "true": True
+            } for room_id in by_shard[shard]]
+
+            await db.executemany(touch_query, params)
+            await db.commit()
+
+        await self._on_shards(list(by_shard), touch_shard_rooms)
+
+    async def get_stale_room_ids(self, ttl_seconds: float, limit: int)-> List[int]:
+        """Get ids of active rooms with no recorded activity in the last ttl_seconds"""
+        query = """
+            SELECT room_id
+            FROM room
+            WHERE active = :true
+              AND last_active_at < datetime('now', :age)
+            LIMIT :limit
+        """
+        params = {
+            "true": True,
+            "age": f"-{float(ttl_seconds)} seconds",
+            "limit": limit
+        }
+
+        async def get_shard_stale_room_ids(_shard: int, db: Connection)-> List[int]:
+            cursor = await db.execute(query, params)
+            return [row[0] for row in await cursor.fetchall()]
+
+        per_shard = await self._on_shards(self.shards.shards(), get_shard_stale_room_ids)
+        return [room_id for room_ids in per_shard for room_id in room_ids][:limit]
+
+    async def deactivate_rooms(self, room_ids: List[int])-> int:
+        """Deactivate many rooms in one statement. Returns the number of rooms deactivated"""
+        if not room_ids:
+            return 0
+
+        by_shard = self._by_shard(room_ids)
+
+        async def deactivate_shard_rooms(shard: int, db: Connection)-> int:
+            shard_room_ids = by_shard[shard]
+            placeholders = ", ".join(f":room_{i}" for i in range(len(shard_room_ids)))
+            deactivate_query = f"""
+                UPDATE room
+                SET active = :false, deactivated_at = CURRENT_TIMESTAMP
+                WHERE room_id IN ({placeholders})
+                  AND active = :true
+            """
+            params: Dict = {f"room_{i}": room_id for i, room_id in enumerate(shard_room_ids)}
+            params["false"] = False
+            params["true"] = True
+
+            cursor = await db.execute(deactivate_query, params)
+            await db.commit()
+            return cursor.rowcount
+
+        return sum(await self._on_shards(list(by_shard), deactivate_shard_rooms))
@@ -0,0 +1,93 @@
+from aiosqlite import Connection, connect, Row
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+
+
+T = TypeVar("T")
+
+
+class RoomShards:
+    """
+    The database files room and room_member rows are split across. A room is stored in
+    shard room_id % count. Rooms are created in their owner's shard, owner_id % count,
+    with ids from that shard, so all of an owner's rooms are in one shard. Users, tokens
+    and tracks stay in the main database
+    """
+
+    def __init__(self, locations: List[str]):
+        self.locations = locations
+        self.count = len(locations)
+
+    def of_room(self, room_id: int)-> int:
+        return room_id % self.count
+
+    def of_owner(self, owner_id: int)-> int:
+        return owner_id % self.count
+
+    async def _open(self, shard: int)-> Connection:
+        db = await connect(self.locations[shard])
+        db.row_factory = Row
+        return db
+
+    def connect(self)-> "ShardConnections":
+        return ShardConnections(self.count, {}, self._open)
+
+
+class ShardConnections:
+    """
+    Connections to room shards for a unit of work, opened as they are first used and
+    closed together on leaving the async with block. A connection given on its own,
+    e.g. to the main database, is every room's shard: the one shard of one
+    """
+
+    def __init__(self, count: int, connections: Dict[int, Connection],
+                 open_shard: Optional[Callable[[int], Awaitable[Connection]]] = None):
+        self.count = count
+        self.connections = connections
+        self._open_shard = open_shard
+        self._opened: List[Connection] = []
+
+    @classmethod
+    def single(cls, db: Connection, shard: int = 0, count: int = 1)-> "ShardConnections":
+        """Only the given shard, e.g. for a write op run against one shard's database"""
+        return cls(count, {shard: db})
+
+    def of_room(self, room_id: int)-> int:
+        return room_id % self.count
+
+    def of_owner(self, owner_id: int)-> int:
+        return owner_id % self.count
+
+    def shards(self)-> List[int]:
+        """The shards that can be reached: every shard, or those given connections to"""
+        return list(range(self.count)) if self._open_shard is not None else sorted(self.connections)
+
+    async def get(self, shard: int)-> Connection:
+        db = self.connections.get(shard)
+        if db is None:
+            if self._open_shard is None:
+                raise Exception(f"Room shard {shard} is not available here")
+            db = await self._open_shard(shard)
+            self.connections[shard] = db
+            self._opened.append(db)
+        return db
+
+    async def for_room(self, room_id: int)-> Connection:
+        return await self.get(self.of_room(room_id))
+
+    async def close(self):
+        for db in self._opened:
+            await db.close()
+        self._opened.clear()
+        self.connections.clear()
+
+    async def __aenter__(self)-> "ShardConnections":
+        return self
+
+    async def __aexit__(self, *a):
+        await self.close()
+
+
+RoomDatabase = Union[Connection, ShardConnections]
+# a write op run against the shard of one room, e.g.
+#   lambda db: RoomPersistence(db).add_user_to_room(room_id, user_id)
+RoomWriteOp = Callable[[RoomDatabase], Awaitable[T]]
@@ -0,0 +1,78 @@
+from aiosqlite import Connection
+from typing import Dict, Iterable, List
+import rapidjson
+
+
+# stays well below SQLite's limit on the number of bound parameters
+MAX_URIS_PER_QUERY = 500
+
+
+def _chunks(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TrackPersistence:
+    def __init__(self, db: Connection):
+        self.db = db
+
+    async def upsert_tracks(self, tracks: Iterable[Dict]):
+        """Insert or update many tracks in a single transaction"""
+        upsert_query = """
+            INSERT INTO track (uri, name, artists, images, updated_at)
+            VALUES (:uri, :name, :artists, :images, CURRENT_TIMESTAMP)
+            ON CONFLICT (uri) DO UPDATE SET
+                name = excluded.name,
+                artists = excluded.artists,
+                images = excluded.images,
+                updated_at = excluded.updated_at
+        """
+
+        params = [{
+            "uri": track["uri"],
+            "name": track.get("name") or "",
+            "artists": rapidjson.dumps(track.get("artists") or []),
+            "images": rapidjson.dumps(track.get("images") or [])
+        } for track in tracks]
+
+        await self.db.executemany(upsert_query, params)
+        await self.db.commit()
+
+    async def get_tracks_by_uri(self, uris: List[str])-> Dict[str, Dict]:
+        """Get stored tracks by URI; URIs with no stored track are left out"""
+        tracks = {}
+        for chunk in _chunks(list(dict.fromkeys(uris)), MAX_URIS_PER_QUERY):
+            placeholders = ", ".join(f":uri_{i}" for i in range(len(chunk)))
+            query = f"""
+                SELECT uri, name, artists, images
+                FROM track
+                WHERE uri IN ({placeholders})
+            """
+            params = {f"uri_{i}": uri for i, uri in enumerate(chunk)}
+
+            cursor = await self.db.execute(query, params)
+            for row in await cursor.fetchall():
+                tracks[row[0]] = {
+                    "uri": row[0],
+                    "name": row[1],
+                    "artists": rapidjson.loads(row[2]),
+                    "images": rapidjson.loads(row[3])
+                }
+        return tracks
+
+    async def get_missing_uris(self, uris: List[str])-> List[str]:
+        """Get the URIs which have no stored track"""
+        known = set()
+        unique_uris = list(dict.fromkeys(uris))
+        for chunk in _chunks(unique_uris, MAX_URIS_PER_QUERY):
+            placeholders = ", ".join(f":uri_{i}" for i in range(len(chunk)))
+            query = f"""
+                SELECT uri
+                FROM track
+                WHERE uri IN ({placeholders})
+            """
+            params = {f"uri_{i}": uri for i, uri in enumerate(chunk)}
+
+            cursor = await self.db.execute(query, params)
+            known.update(row[0] for row in await cursor.fetchall())
+        return [uri for uri in unique_uris if uri not in known]
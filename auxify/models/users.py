@@ -1,5 +1,7 @@
 from aiosqlite import Connection
 from typing import Dict
+from datetime import datetime
+from auxify.models import cast_key
 
 
 class UsersPersistence:
@@ -64,3 +66,30 @@ class UsersPersistence:
         cursor = await self.db.execute(get_user_by_email, params)
         result = await cursor.fetchone()
         return dict(result) if result else {}
+
+    @cast_key("token_created_at", lambda created_at: created_at and datetime.fromisoformat(created_at))
+    async def get_user_with_token_state(self, user_id: int)-> Dict:
+        """The user, with whether they have a Spotify token and when it expires, but not the token itself"""
+        get_user = """
+            SELECT user.user_id, first_name, last_name, email,
+                   spotify_token.token_id IS NOT NULL AS has_token,
+                   spotify_token.access_token IS NOT NULL AND spotify_token.access_token != '' AS has_access_token,
+                   spotify_token.refresh_token IS NOT NULL AND spotify_token.refresh_token != '' AS has_refresh_token,
+                   spotify_token.created_at AS token_created_at,
+                   spotify_token.duration_seconds AS token_duration_seconds
+            FROM user
+            LEFT JOIN spotify_token ON spotify_token.user_id = user.user_id
+            WHERE user.user_id = :user_id
+            LIMIT 1
+        """
+
+        if user_id is None or user_id < 0:
+            raise Exception(f"parameter user_id must be a positive integer")
+
+        params = {
+            "user_id": user_id
+        }
+
+        cursor = await self.db.execute(get_user, params)
+        result = await cursor.fetchone()
+        return dict(result) if result else {}
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from aiosqlite import Connection, connect, Row
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+# a write op runs persistence methods against the connection it is given, e.g.
+#   lambda db: RoomPersistence(db).add_user_to_room(room_id, user_id)
+WriteOp = Callable[[Connection], Awaitable[T]]
+
+
+class _BatchConnection:
+    """The writer's connection as a write op sees it: the batch commits, so the op's own commit does nothing"""
+
+    def __init__(self, db: Connection):
+        self._db = db
+
+    def __getattr__(self, name: str):
+        return getattr(self._db, name)
+
+    async def commit(self):
+        pass
+
+
+class WriteCoalescer:
+    """
+    Runs write ops from every request on a single writer connection, committing them
+    in batches: the writer takes the ops that arrive within max_delay_seconds of the
+    first (at most max_batch of them) and runs them in one transaction, each under its
+    own savepoint so that a failing op is rolled back without affecting the others.
+    Each caller gets the result or error of its own op once the batch has committed
+    """
+
+    def __init__(self, database: str, max_batch: int, max_delay_seconds: float):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay_seconds = max_delay_seconds
+        # created on first use, so that they belong to the loop serving requests
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._db: Optional[Connection] = None
+        self.batches = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.failed_batches = 0
+        self.largest_batch = 0
+
+    async def write(self, op: WriteOp[T])-> T:
+        if self._writer is None:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future)) # type: ignore
+        return await future
+
+    async def _connection(self)-> Connection:
+        if self._db is None:
+            # transactions are begun and committed explicitly
+            self._db = await connect(self.database, isolation_level=None)
+            self._db.row_factory = Row
+        return self._db
+
+    async def _run(self):
+        queue: asyncio.Queue = self._queue # type: ignore
+        while True:
+            batch = [await queue.get()]
+            if self.max_delay_seconds:
+                await asyncio.sleep(self.max_delay_seconds)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._execute(batch)
+            except Exception as e:
+                logger.exception("Unexpected error running a batch of %s writes: %s", len(batch), e)
+                # no caller may be left waiting
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _execute(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        # callers that gave up before their op ran are skipped
+        batch = [(op, future) for op, future in batch if not future.done()]
+        if not batch:
+            return
+
+        db: Optional[Connection] = None
+        outcomes: List[Tuple[asyncio.Future, Optional[BaseException], Any]] = []
+        try:
+            # opened here, so that the batch fails rather than waits if it cannot be opened;
+            # the next batch tries again
+            db = await self._connection()
+            await db.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                await db.execute("SAVEPOINT write_op")
+                try:
+                    result = await op(_BatchConnection(db)) # type: ignore
+                except Exception as e:
+                    await db.execute("ROLLBACK TO write_op")
+                    outcomes.append((future, e, None))
+                else:
+                    outcomes.append((future, None, result))
+                await db.execute("RELEASE write_op")
+            await db.execute("COMMIT")
+        except Exception as e:
+            logger.exception("Failed to commit a batch of %s writes: %s", len(batch), e)
+            if db is not None and db.in_transaction:
+                await db.execute("ROLLBACK")
+            self.failed_batches += 1
+            self.failed_writes += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, error, result in outcomes:
+            if error is not None:
+                self.failed_writes += 1
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Finish the queued writes, then stop the writer and close its connection"""
+        if self._writer is not None:
+            await self._queue.join() # type: ignore
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def stats(self)-> Dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "writes": self.writes,
+            "failed_writes": self.failed_writes,
+            "failed_batches": self.failed_batches,
+            "largest_batch": self.largest_batch
+        }
@@ -1,18 +1,23 @@
 from aiohttp import web
 from aiohttp.web import Request, Response, json_response
 from typing import Mapping, Any
+import hmac
 import logging
 import jsonschema
 
 from auxify.controllers import err
 from auxify import config
 from auxify.utils import jwt, json_dumps_with_default
+from auxify.middlewares.rate_limit import CLAIMS_KEY
 
 
 logger = logging.getLogger(__name__)
 
 routes_tab = web.RouteTableDef()
 
+# sent with the admin key to profile a request
+PROFILE_HEADER = "X-Profile"
+
 
 def error(message: str, status: int) -> Response:
     return json_response({
@@ -27,8 +32,7 @@ def json_router(verb: str):
 
     def json_endpoint(url_pattern: str, url_variable_types: Mapping[str, type] = {}, accepts_body: bool = False, body_schema: Mapping[Any, Any] = None):
         def wrapper(f):
-            @register_route(url_pattern)
-            async def inner(request: Request):
+            async def handle(request: Request):
                 kwargs = {}
                 for var, cast_type in url_variable_types.items():
                     try:
@@ -52,6 +56,18 @@ def json_router(verb: str):
                 if isinstance(response, dict):
                     return json_response(response, status=200, dumps=json_dumps_with_default)
                 return response
+
+            @register_route(url_pattern)
+            async def inner(request: Request):
+                profiler = config.Config.get_config().request_profiler()
+                if profiler is None or not profiler.should_profile(
+                        url_pattern, PROFILE_HEADER in request.headers and has_admin_key(request)):
+                    return await handle(request)
+                profile = profiler.start(request.method, url_pattern)
+                try:
+                    return await handle(request)
+                finally:
+                    profiler.finish(profile, f"{request.method} {request.path_qs}")
             return inner
         return wrapper
     return json_endpoint
@@ -63,15 +79,18 @@ def login_required(f):
     _unauthorized = err.unauthorized("A valid login token is required in order to access this resource")
     
     def handler_wrapper(request: Request, *a, **k):
-        auth_header = request.headers.get("Authorization")
-        if not auth_header:
-            raise _unauthorized
-        try:
-            token = auth_header.split(" ")[1]
-            claims = jwt.get_claims_from_jwt(token, config.Config.get_config().jwt_key(), jwt.Aud.AUTH)
-        except Exception as e:
-            logger.exception(e)
-            raise _unauthorized
+        # the rate limit middleware may already have verified the token
+        claims = request.get(CLAIMS_KEY)
+        if claims is None:
+            auth_header = request.headers.get("Authorization")
+            if not auth_header:
+                raise _unauthorized
+            try:
+                token = auth_header.split(" ")[1]
+                claims = jwt.get_claims_from_jwt(token, config.Config.get_config().jwt_key(), jwt.Aud.AUTH)
+            except Exception as e:
+                logger.info("Rejected an invalid login token: %s", e)
+                raise _unauthorized
         
         k["claims"] = claims
         
@@ -80,6 +99,26 @@ def login_required(f):
     return handler_wrapper
 
 
+def has_admin_key(request: Request)-> bool:
+    """Whether the request carries the admin API key from config in the X-Admin-Key header"""
+    admin_key = config.Config.get_config().admin_api_key()
+    provided_key = request.headers.get("X-Admin-Key")
+    return bool(admin_key and provided_key and hmac.compare_digest(admin_key, provided_key))
+
+
+def admin_required(f):
+    """ Decorator to check for the admin API key from config in the X-Admin-Key header """
+
+    _forbidden = err.forbidden("A valid admin key is required in order to access this resource")
+
+    def handler_wrapper(request: Request, *a, **k):
+        if not has_admin_key(request):
+            raise _forbidden
+        return f(request, *a, **k)
+
+    return handler_wrapper
+
+
 get = json_router("get")
 post = json_router("post")
 put = json_router("put")
@@ -87,4 +126,4 @@ delete = json_router("delete")
 patch = json_router("patch")
 
 
-from auxify.routes import auth, rooms, user
+from auxify.routes import auth, rooms, user, tracks, admin
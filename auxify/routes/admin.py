@@ -0,0 +1,33 @@
+from aiohttp.web import FileResponse, Request
+from typing import Dict, Union
+
+from auxify import config
+from auxify.controllers import err
+from auxify.routes import get, admin_required
+from auxify.utils import metrics
+
+
+@get("/admin/metrics")
+@admin_required
+async def get_metrics(request: Request)-> Dict:
+    return metrics.snapshot()
+
+
+@get("/admin/profiles")
+@admin_required
+async def get_profiles(request: Request)-> Dict:
+    profiler = config.Config.get_config().request_profiler()
+    return {"profiles": profiler.list_profiles() if profiler is not None else []}
+
+
+@get("/admin/profiles/{file}")
+@admin_required
+async def get_profile_file(request: Request)-> Union[Dict, FileResponse]:
+    profiler = config.Config.get_config().request_profiler()
+    path = profiler.profile_path(request.match_info["file"]) if profiler is not None else None
+    if path is None:
+        raise err.not_found(f"No profile file {request.match_info['file']}")
+    return FileResponse(path, headers={
+        "Content-Type": "application/octet-stream",
+        "Content-Disposition": f"attachment; filename=\"{request.match_info['file']}\""
+    })
@@ -1,10 +1,10 @@
 from aiohttp.web import Request, Response
-from typing import Dict
+from typing import Dict, Union
 
 from auxify.controllers import rooms
 from auxify.config import Config
 from auxify.routes import get, post, put, login_required
-from auxify.schema.rooms import create_room_schema, enqueue_song_schema, join_room_schema
+from auxify.schema.rooms import create_room_schema, enqueue_song_schema, join_room_schema, get_rooms_minimal_schema
 
 
 @post("/rooms", accepts_body=True, body_schema=create_room_schema)
@@ -23,7 +23,8 @@ async def get_owned_room(request: Request, claims: Dict)-> dict:
      accepts_body=True, body_schema=enqueue_song_schema)
 @login_required
 async def enqueue_song(request: Request, room_id: int, body: Dict, claims: Dict) -> Dict:
-    return await rooms.enqueue_song(int(claims["sub"]), room_id, body["uri"], Config.get_config())
+    return await rooms.enqueue_song(int(claims["sub"]), room_id, body["uri"], Config.get_config(),
+                                    idempotency_key=request.headers.get("Idempotency-Key"))
 
 @get("/rooms")
 @login_required
@@ -38,10 +39,20 @@ async def search(request: Request, room_id: int, claims: Dict)-> Dict:
     return await rooms.search(int(claims["sub"]), room_id, query, Config.get_config())
 
 
+@get("/rooms/{room_id:\d+}/now-playing", url_variable_types={"room_id": int})
+@login_required
+async def now_playing(request: Request, room_id: int, claims: Dict)-> Dict:
+    return await rooms.now_playing(int(claims["sub"]), room_id, Config.get_config())
+
+
 @get("/rooms/{room_id:\d+}", url_variable_types={"room_id": int})
 @login_required
-async def get_room_by_id(request: Request, room_id: int, claims: Dict)-> Dict:
-    return await rooms.get_room_by_id(room_id, int(claims["sub"]), Config.get_config())
+async def get_room_by_id(request: Request, room_id: int, claims: Dict)-> Union[Dict, Response]:
+    room = await rooms.get_room_by_id(room_id, int(claims["sub"]), Config.get_config())
+    if isinstance(room, bytes):
+        # already serialized from the room's snapshot
+        return Response(body=room, content_type="application/json")
+    return room
 
 
 @get("/rooms/{room_id:\d+}/minimal", url_variable_types={"room_id": int})
@@ -51,13 +62,29 @@ async def get_room_by_id_minimal(request: Request, room_id: int, claims: Dict)->
     return await rooms.get_room_by_id_minimal(room_id, int(claims["sub"]), Config.get_config())
 
 
+@post("/rooms/minimal", accepts_body=True, body_schema=get_rooms_minimal_schema)
+@login_required
+async def get_rooms_minimal(request: Request, body: Dict, claims: Dict)-> Dict:
+    """Like /rooms/{room_id}/minimal, for up to 100 rooms at once"""
+    return await rooms.get_rooms_minimal(body["room_ids"], int(claims["sub"]), Config.get_config())
+
+
 @put("/rooms/{room_id:\d+}/join", url_variable_types={"room_id": int}, accepts_body=True, body_schema=join_room_schema)
 @login_required
 async def join_room(request: Request, room_id: int, body: Dict, claims: Dict)-> Dict:
     room_code = None
+    invite = None
     if body:
         room_code = body.get("room_code")
-    return await rooms.join_room(int(claims["sub"]), room_id, room_code, Config.get_config()) 
+        invite = body.get("invite")
+    return await rooms.join_room(int(claims["sub"]), room_id, room_code, Config.get_config(), invite=invite)
+
+
+@post("/rooms/{room_id:\d+}/invite", url_variable_types={"room_id": int})
+@login_required
+async def create_invite(request: Request, room_id: int, claims: Dict)-> Dict:
+    """Create a signed invite link to the room, e.g. for sharing as a QR code"""
+    return await rooms.create_invite(int(claims["sub"]), room_id, Config.get_config())
 
 
 @post("/rooms/{room_id:\d+}/deactivate", url_variable_types={"room_id": int})
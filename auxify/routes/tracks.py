@@ -0,0 +1,14 @@
+from aiohttp.web import Request
+from typing import Dict
+
+from auxify.controllers import tracks
+from auxify.config import Config
+from auxify.routes import get, login_required
+
+
+@get("/tracks")
+@login_required
+async def get_tracks(request: Request, claims: Dict)-> Dict:
+    """Stored metadata for a comma-separated list of track URIs, e.g. for rendering a queue"""
+    uris = [uri for uri in request.query.get("uris", "").split(",") if uri]
+    return await tracks.get_tracks(uris, Config.get_config())
@@ -26,6 +26,22 @@ join_room_schema = {
     "properties": {
         "room_code": {
             "type": "string"
+        },
+        "invite": {
+            "type": "string"
         }
     }
 }
+
+get_rooms_minimal_schema = {
+    "type": "object",
+    "properties": {
+        "room_ids": {
+            "type": "array",
+            "items": {"type": "integer"},
+            "minItems": 1,
+            "maxItems": 100
+        }
+    },
+    "required": ["room_ids"]
+}
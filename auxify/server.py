@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+from aiohttp import web
+from typing import Awaitable, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# set in each worker process; background jobs that must only run once per host check it
+ENV_WORKER_ID = "AUXIFY_WORKER_ID"
+RESTART_BACKOFF_SECONDS = 1.0
+
+
+def is_primary_worker()-> bool:
+    """True in the first worker, and when not running under the supervisor at all"""
+    return os.getenv(ENV_WORKER_ID, "0") == "0"
+
+
+def bind_socket(host: str, port: int, backlog: int)-> socket.socket:
+    """A listening socket opened before the workers start, for them to share"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def install_uvloop()-> bool:
+    try:
+        import uvloop # type: ignore
+    except ImportError:
+        return False
+    uvloop.install()
+    return True
+
+
+async def _serve(app_factory: Callable[[], Awaitable[web.Application]], settings: Dict, sock: Optional[socket.socket],
+                 uvloop_installed: bool):
+    # logging is configured by the app factory
+    app = await app_factory()
+    if settings["uvloop"] and not uvloop_installed:
+        logger.warning("uvloop was requested but is not installed; using the default event loop")
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    # recycle the worker after max_requests, staggered by the jitter so workers do not all restart at once
+    max_requests = settings["max_requests"]
+    if max_requests:
+        max_requests += random.randint(0, settings["max_requests_jitter"])
+    served = 0
+
+    async def count_request(_request, _response):
+        nonlocal served
+        served += 1
+        if max_requests and served >= max_requests and not stopping.is_set():
+            logger.info("Worker %s served %s requests; recycling", os.getpid(), served)
+            stopping.set()
+
+    app.on_response_prepare.append(count_request)
+
+    runner = web.AppRunner(app, keepalive_timeout=settings["keepalive_timeout_seconds"])
+    await runner.setup()
+    if sock is not None:
+        site: web.BaseSite = web.SockSite(runner, sock, shutdown_timeout=settings["graceful_timeout_seconds"])
+    else:
+        site = web.TCPSite(
+            runner, settings["host"], settings["port"],
+            backlog=settings["backlog"],
+            reuse_port=True,
+            shutdown_timeout=settings["graceful_timeout_seconds"])
+    await site.start()
+    logger.info("Worker %s serving on %s:%s", os.getpid(), settings["host"], settings["port"])
+
+    await stopping.wait()
+    # stops accepting, waits up to graceful_timeout_seconds for open requests, then runs cleanup contexts
+    await runner.cleanup()
+
+
+def run_worker(worker_id: int, app_factory: Callable[[], Awaitable[web.Application]], settings: Dict,
+               sock: Optional[socket.socket]):
+    os.environ[ENV_WORKER_ID] = str(worker_id)
+    uvloop_installed = settings["uvloop"] and install_uvloop()
+    asyncio.run(_serve(app_factory, settings, sock, uvloop_installed))
+
+
+class Supervisor:
+    """
+    Keeps settings["workers"] worker processes running, replacing any that exit
+    (including those recycled after max_requests). On SIGTERM or SIGINT the workers
+    are asked to stop, and killed if they have not within graceful_timeout_seconds
+    """
+
+    def __init__(self, app_factory: Callable[[], Awaitable[web.Application]], settings: Dict):
+        self.app_factory = app_factory
+        self.settings = settings
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.stopping = False
+        self.sock: Optional[socket.socket] = None
+        self._context = multiprocessing.get_context("fork")
+
+    def _spawn(self, worker_id: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker_id, self.app_factory, self.settings, self.sock),
+            name=f"auxify-worker-{worker_id}")
+        process.start()
+        self.workers[worker_id] = process
+
+    def _stop(self, signum, _frame):
+        logger.info("Received signal %s; stopping workers", signum)
+        self.stopping = True
+
+    def run(self):
+        if not self.settings["reuse_port"]:
+            self.sock = bind_socket(self.settings["host"], self.settings["port"], self.settings["backlog"])
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for worker_id in range(self.settings["workers"]):
+            self._spawn(worker_id)
+        logger.info("Started %s workers", len(self.workers))
+
+        while not self.stopping:
+            time.sleep(0.5)
+            for worker_id, process in list(self.workers.items()):
+                if process.is_alive() or self.stopping:
+                    continue
+                if process.exitcode:
+                    logger.warning("Worker %s (pid %s) exited with %s; restarting", worker_id, process.pid, process.exitcode)
+                    time.sleep(RESTART_BACKOFF_SECONDS)
+                self._spawn(worker_id)
+
+        self.shutdown()
+
+    def shutdown(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM) # type: ignore
+        deadline = time.monotonic() + self.settings["graceful_timeout_seconds"] + 5
+        for process in self.workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time; killing it", process.pid)
+                process.kill()
+                process.join()
+        if self.sock is not None:
+            self.sock.close()
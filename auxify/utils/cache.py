@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import time
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A bounded, least-recently-used in-memory cache. Entries expire ttl_seconds
+    after they are set; with no ttl_seconds they live until evicted
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _expires_at(self, ttl_seconds: Optional[float])-> Optional[float]:
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        return None if ttl_seconds is None else time.monotonic() + ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None)-> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __contains__(self, key: Hashable)-> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        self._data[key] = (self._expires_at(ttl_seconds), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None)-> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def peek(self, key: Hashable, default: Any = None)-> Any:
+        """The unexpired value for key, without counting a hit or miss or changing its order"""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or (entry[0] is not None and entry[0] <= time.monotonic()):
+            return default
+        return entry[1]
+
+    def items(self)-> List[Tuple[Hashable, Any]]:
+        """The unexpired entries, without counting hits or changing their order"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at is None or expires_at > now]
+
+    def resize(self, maxsize: int, ttl_seconds: Optional[float] = None):
+        """Change the bounds of the cache, dropping its entries. With maxsize 0 nothing is kept"""
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data.clear()
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self)-> int:
+        return len(self._data)
+
+    def stats(self)-> Dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses
+        }
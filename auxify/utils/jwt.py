@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from enum import Enum
 
 TOKEN_DURATION: timedelta = timedelta(hours=24)
+INVITE_DURATION: timedelta = timedelta(hours=12)
 
 
 def key_from_secret(secret: str) -> jwk.JWK:
@@ -17,13 +18,14 @@ def key_from_secret(secret: str) -> jwk.JWK:
 class Aud(Enum):
     AUTH: str = "auth"
     API: str = "api"
+    INVITE: str = "invite"
 
 
-def generate_jwt(user_id: int, aud: Aud, key: jwk.JWK) -> str:
+def generate_jwt(user_id: int, aud: Aud, key: jwk.JWK, duration: timedelta = TOKEN_DURATION) -> str:
     claims= {
         'sub': str(user_id),
         'nbf': datetime.utcnow().timestamp(),
-        'exp': (datetime.utcnow() + TOKEN_DURATION).timestamp(),
+        'exp': (datetime.utcnow() + duration).timestamp(),
         'aud': aud.value
     }
 
@@ -35,6 +37,11 @@ def generate_jwt(user_id: int, aud: Aud, key: jwk.JWK) -> str:
     return token.serialize()
 
 
+def generate_invite_jwt(room_id: int, key: jwk.JWK, duration: timedelta = INVITE_DURATION) -> str:
+    """ An HMAC-signed token allowing its holder to join the room, without the room code, until it expires """
+    return generate_jwt(room_id, Aud.INVITE, key, duration)
+
+
 def get_claims_from_jwt(token: str, key: jwk.JWK, expected_aud: Aud) -> Dict:
     """ raises Exception if JWT missing """
     claims = rapidjson.loads(jwt.JWT(
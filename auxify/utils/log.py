@@ -0,0 +1,157 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from rapidjson import dumps
+
+from auxify.utils import metrics
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord)-> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed # type: ignore
+        return dumps(entry, default=str)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets through at most burst records with the same logger, level and message template
+    per window_seconds. Suppressed records are counted, and the count is attached to
+    the next record let through. Records from the excluded loggers always pass
+    """
+
+    def __init__(self, window_seconds: float, burst: int, max_keys: int = 10_000, exclude: Iterable[str] = ()):
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.burst = burst
+        self.max_keys = max_keys
+        self.exclude = frozenset(exclude)
+        self._windows: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord)-> bool:
+        if record.name in self.exclude:
+            return True
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                    record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue with their message resolved, but any traceback still unformatted.
+    The standard QueueHandler also formats the traceback before enqueueing, which is the
+    expensive part of logging; here that happens on the listener thread instead. Once the
+    queue is full, records are dropped and counted as log.dropped
+    """
+
+    def prepare(self, record: logging.LogRecord)-> logging.LogRecord:
+        record = copy.copy(record)
+        # the arguments may be changed once the caller carries on, e.g. a dict, so the message is
+        # resolved now rather than on the listener thread
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log.dropped")
+
+
+# access log lines are unique per request, so they would never repeat
+UNLIMITED_LOGGERS = ("aiohttp.access",)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_queue_logging(level: int, json_format: bool, repeat_window_seconds: float, repeat_burst: int,
+                            max_queued: int):
+    """
+    Route all logging through a queue of at most max_queued records, so that callers only pay
+    for putting a record on the queue, while formatting and stream I/O happen on a listener thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = _stream_handler(json_format)
+    log_queue: queue.Queue = queue.Queue(max_queued)
+    queue_handler = DeferredFormatQueueHandler(log_queue)
+    if repeat_burst > 0:
+        queue_handler.addFilter(RepeatFilter(repeat_window_seconds, repeat_burst, exclude=UNLIMITED_LOGGERS))
+
+    _set_root_handler(queue_handler, level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_stream_logging(level: int, json_format: bool):
+    """
+    Log straight to the stream, formatting on the calling thread. For processes that fork
+    workers, which must not inherit the listener thread or its queue, and log little themselves
+    """
+    stop_queue_logging()
+    _set_root_handler(_stream_handler(json_format), level)
+
+
+def _stream_handler(json_format: bool)-> logging.Handler:
+    stream_handler = logging.StreamHandler()
+    if json_format:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    return stream_handler
+
+
+def _set_root_handler(handler: logging.Handler, level: int):
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def stop_queue_logging():
+    """Flush and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_queue_logging)
@@ -0,0 +1,32 @@
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+
+_counters: Dict[str, int] = defaultdict(int)
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+
+def increment(name: str, amount: int = 1):
+    _counters[name] += amount
+
+
+def register_gauge(name: str, read: Callable[[], Any]):
+    """Register a function reporting the current value of something, e.g. the size of a cache"""
+    _gauges[name] = read
+
+
+def snapshot()-> Dict:
+    gauges = {}
+    for name, read in _gauges.items():
+        try:
+            gauges[name] = read()
+        except Exception as e:
+            gauges[name] = f"error: {e}"
+    return {
+        "counters": dict(_counters),
+        "gauges": gauges
+    }
+
+
+def reset():
+    _counters.clear()
@@ -0,0 +1,160 @@
+from collections import Counter
+from typing import Dict, List, Optional
+import asyncio
+import cProfile
+import logging
+import marshal
+import os
+import random
+import re
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME = re.compile(r"^[\w.-]+$")
+
+
+def await_stack(task: asyncio.Task)-> List[str]:
+    """
+    The coroutines a suspended task is awaiting through, outermost first. Task.get_stack
+    only returns the outermost frame of a suspended coroutine, so the chain is followed
+    through cr_await, down to e.g. the future of an aiosqlite call or a Spotify request
+    """
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            stack.append(type(awaitable).__name__)
+            break
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return stack
+
+
+class RequestProfile:
+    """
+    A profile of one request: cProfile for the time spent running Python, and samples
+    of what the request's task is awaiting every sample_interval_seconds for the time
+    spent waiting on the database and Spotify, which cProfile does not attribute to
+    the coroutines awaiting. cProfile sees the whole thread, so requests handled
+    concurrently with a profiled one show up in its profile too
+    """
+
+    def __init__(self, name: str, sample_interval_seconds: float):
+        self.name = name
+        self.sample_interval_seconds = sample_interval_seconds
+        self.profile = cProfile.Profile()
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self._task = asyncio.current_task()
+        self._loop = asyncio.get_event_loop()
+        self._sampler: Optional[asyncio.TimerHandle] = None
+
+    def _sample(self):
+        if self._task is not None and not self._task.done():
+            self.samples[";".join(await_stack(self._task))] += 1
+        self._sampler = self._loop.call_later(self.sample_interval_seconds, self._sample)
+
+    def start(self):
+        self._sampler = self._loop.call_later(self.sample_interval_seconds, self._sample)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self.started
+        if self._sampler is not None:
+            self._sampler.cancel()
+
+
+class RequestProfiler:
+    """
+    Profiles requests that ask to be profiled and a sample_rate fraction of the others, one
+    at a time. Each profile is written to directory as <name>.prof, readable with pstats or
+    e.g. snakeviz, and <name>.awaits, the await samples as folded stacks for flame graph
+    tools. Only the max_profiles most recent profiles are kept, across every worker
+    """
+
+    def __init__(self, directory: str, max_profiles: int, sample_rate: float, routes: List[str],
+                 sample_interval_seconds: float):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sample_rate = sample_rate
+        self.routes = set(routes)
+        self.sample_interval_seconds = sample_interval_seconds
+        self.active: Optional[RequestProfile] = None
+        self.written = 0
+
+    def should_profile(self, route: str, requested: bool)-> bool:
+        if self.active is not None:
+            return False
+        if requested:
+            return True
+        return (not self.routes or route in self.routes) and random.random() < self.sample_rate
+
+    def start(self, method: str, route: str)-> RequestProfile:
+        slug = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+        name = f"{time.time():.3f}-{os.getpid()}-{method}-{slug}"
+        self.active = RequestProfile(name, self.sample_interval_seconds)
+        self.active.start()
+        return self.active
+
+    def finish(self, profile: RequestProfile, description: str):
+        profile.stop()
+        self.active = None
+        # the profile is written and the ring trimmed off the event loop
+        asyncio.get_event_loop().run_in_executor(None, self._write, profile, description)
+
+    def _write(self, profile: RequestProfile, description: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.profile.create_stats()
+            with open(os.path.join(self.directory, f"{profile.name}.prof"), "wb") as prof:
+                marshal.dump(profile.profile.stats, prof) # type: ignore
+            with open(os.path.join(self.directory, f"{profile.name}.awaits"), "w") as awaits:
+                awaits.write(f"# {description} in {profile.seconds * 1000:.1f}ms, "
+                             f"sampled every {profile.sample_interval_seconds * 1000:g}ms\n")
+                for stack, count in profile.samples.most_common():
+                    awaits.write(f"{stack} {count}\n")
+            self.written += 1
+            self._trim()
+        except Exception as e:
+            logger.exception("Failed to write profile %s: %s", profile.name, e)
+
+    def _trim(self):
+        for profile in self.list_profiles()[self.max_profiles:]:
+            for file in profile["files"]:
+                try:
+                    os.remove(os.path.join(self.directory, file))
+                except FileNotFoundError:
+                    pass # removed by another worker
+
+    def list_profiles(self)-> List[Dict]:
+        """The profiles on disk, most recent first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles: Dict[str, Dict] = {}
+        for file in os.listdir(self.directory):
+            name, extension = os.path.splitext(file)
+            try:
+                created_at, pid, method, route = name.split("-", 3)
+                profile = profiles.setdefault(name, {
+                    "name": name, "created_at": float(created_at), "pid": int(pid),
+                    "method": method, "route": route, "files": {}})
+            except ValueError:
+                continue
+            profile["files"][file] = os.path.getsize(os.path.join(self.directory, file))
+        return sorted(profiles.values(), key=lambda profile: profile["created_at"], reverse=True)
+
+    def profile_path(self, file: str)-> Optional[str]:
+        """The path of a profile file, if file names one"""
+        if not PROFILE_NAME.match(file) or not file.endswith((".prof", ".awaits")):
+            return None
+        path = os.path.join(self.directory, file)
+        return path if os.path.isfile(path) else None
+
+    def stats(self)-> Dict:
+        return {"active": self.active is not None, "written": self.written}
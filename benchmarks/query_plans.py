@@ -0,0 +1,140 @@
+"""
+Check and time the query plan of every SQL statement in auxify/models against a
+populated database, e.g. one filled by schema/recreate_db.py:
+
+    python schema/recreate_db.py load.db --users 1000000 --rooms 200000 --seed 1
+    python -m benchmarks.query_plans load.db
+
+Statements are extracted from the source, so new queries are covered without being
+listed here. A statement fails when it scans one of SCAN_CHECKED_TABLES without an index.
+Each statement is also run with parameters sampled from the database, writes inside
+a transaction that is rolled back, and its mean time is reported.
+"""
+import ast
+import glob
+import random
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+MODELS = "auxify/models/*.py"
+SCAN_CHECKED_TABLES = ("room", "room_member", "user", "spotify_token")
+# statements allowed to scan a checked table, by "<file>:<line>", with the reason
+ALLOWED_SCANS: Dict[str, str] = {}
+SQL_START = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b")
+PARAMETER = re.compile(r"(?<!:):(\w+)")
+# e.g. "SCAN room", "SCAN spotify_token LEFT-JOIN"; scans "USING INDEX" or "USING COVERING INDEX" are allowed
+TABLE_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+class Statement(NamedTuple):
+    location: str
+    sql: str
+
+
+def _render(node: ast.AST)-> Optional[str]:
+    """The SQL in a string or f-string node; interpolated values, e.g. lists of placeholders, become one parameter"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for i, value in enumerate(node.values):
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                parts.append(f":interpolated_{i}")
+        return "".join(parts)
+    return None
+
+
+def extract_statements(pattern: str = MODELS)-> List[Statement]:
+    statements = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as source:
+            tree = ast.parse(source.read(), path)
+        nodes = list(ast.walk(tree))
+        # the literal parts of f-strings are rendered with the f-string
+        parts = {id(part) for node in nodes if isinstance(node, ast.JoinedStr) for part in node.values}
+        for node in nodes:
+            if id(node) in parts:
+                continue
+            sql = _render(node)
+            if sql is not None and SQL_START.match(sql):
+                statements.append(Statement(f"{path}:{node.lineno}", sql)) # type: ignore
+    return statements
+
+
+def query_plan(db: sqlite3.Connection, sql: str)-> List[str]:
+    params = {name: None for name in PARAMETER.findall(sql)}
+    return [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def unindexed_scans(plan: List[str], tables=SCAN_CHECKED_TABLES)-> List[str]:
+    """Steps of the plan reading every row of one of tables"""
+    return [step for step in plan
+            if (match := TABLE_SCAN.match(step)) and match.group(1) in tables and " USING " not in step]
+
+
+def sample_params(sql: str, max_user_id: int, max_room_id: int)-> Dict:
+    """Plausible values for a statement's parameters, guessed from their names"""
+    params: Dict = {}
+    for name in PARAMETER.findall(sql):
+        if name in ("true", "false"):
+            params[name] = name == "true"
+        elif "user" in name or "owner" in name:
+            params[name] = random.randint(1, max_user_id)
+        elif "room" in name:
+            params[name] = random.randint(1, max_room_id)
+        elif name == "limit":
+            params[name] = 100
+        elif name == "age":
+            params[name] = "-3600 seconds"
+        else:
+            params[name] = None
+    return params
+
+
+def time_statement(db: sqlite3.Connection, sql: str, repeat: int)-> float:
+    """Mean seconds per run, with parameters sampled afresh for each run"""
+    max_user_id, max_room_id = db.execute(
+        "SELECT (SELECT COALESCE(MAX(user_id), 1) FROM user), (SELECT COALESCE(MAX(room_id), 1) FROM room)").fetchone()
+    elapsed = 0.0
+    for _ in range(repeat):
+        params = sample_params(sql, max_user_id, max_room_id)
+        start = time.perf_counter()
+        db.execute("BEGIN")
+        try:
+            db.execute(sql, params).fetchall()
+        except sqlite3.IntegrityError:
+            pass
+        finally:
+            db.execute("ROLLBACK")
+        elapsed += time.perf_counter() - start
+    return elapsed / repeat
+
+
+def main(db_name: str, repeat: int = 20):
+    random.seed(0)
+    db = sqlite3.connect(db_name, isolation_level=None)
+    failures = 0
+    for statement in extract_statements():
+        plan = query_plan(db, statement.sql)
+        scans = unindexed_scans(plan)
+        failed = scans and statement.location not in ALLOWED_SCANS
+        failures += bool(failed)
+        seconds = time_statement(db, statement.sql, repeat)
+        print(f"{'FAIL' if failed else 'ok':<5} {seconds * 1000:9.3f}ms  {statement.location}")
+        for step in plan:
+            print(f"{'':<18}{step}")
+    db.close()
+    print(f"{failures} statements scan {', '.join(SCAN_CHECKED_TABLES)} without an index")
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(1 if main(sys.argv[1], *[int(arg) for arg in sys.argv[2:3]]) else 0)
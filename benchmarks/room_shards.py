@@ -0,0 +1,111 @@
+"""
+Compare write throughput with rooms in one database against rooms split across room
+shards, from several worker processes as in production. Each worker writes through a
+write coalescer per shard, as Config gives it; workers still contend with each other for
+the write lock of each database file, which is what sharding relieves.
+
+Each run has workers with concurrent requests join users to rooms spread across every
+shard, on fresh databases built from schema/schema.sql. Run from the repository root:
+
+    python -m benchmarks.room_shards [writes] [workers] [shard counts ...]
+"""
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+import aiosqlite
+
+from auxify.models import rooms
+from auxify.models.shards import RoomShards, RoomWriteOp, ShardConnections
+from auxify.models.write_coalescer import WriteCoalescer
+
+
+SCHEMA = "schema/schema.sql"
+ROOMS = 64
+
+
+def create_shards(directory: str, count: int)-> RoomShards:
+    with open(SCHEMA) as schema:
+        contents = schema.read()
+    locations = [os.path.join(directory, f"rooms_{count}_{shard}.db") for shard in range(count)]
+    for location in locations:
+        with sqlite3.connect(location) as db:
+            db.executescript(contents)
+    return RoomShards(locations)
+
+
+async def create_rooms(shards: RoomShards)-> List[int]:
+    async with shards.connect() as db:
+        room_model = rooms.RoomPersistence(db)
+        return [await room_model.create_room(owner_id, None, f"room {owner_id}") for owner_id in range(1, ROOMS + 1)]
+
+
+async def run(writes: int, concurrency: int, room_ids: List[int], write: Callable[[int, RoomWriteOp], Awaitable],
+              first_user_id: int = 0)-> float:
+    """Seconds taken for concurrency tasks to make writes joins between them"""
+    pending = iter(range(first_user_id + 1, first_user_id + writes + 1))
+
+    async def request_loop():
+        for user_id in pending:
+            room_id = room_ids[user_id % len(room_ids)]
+            await write(room_id, lambda db, room_id=room_id, user_id=user_id: rooms.RoomPersistence(db).add_user_to_room(room_id, user_id))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request_loop() for _ in range(concurrency)])
+    return time.perf_counter() - start
+
+
+async def worker_writes(shards: RoomShards, room_ids: List[int], first_user_id: int, writes: int, concurrency: int):
+    coalescers = [WriteCoalescer(location, max_batch=200, max_delay_seconds=0.002) for location in shards.locations]
+
+    async def write(room_id: int, op: RoomWriteOp):
+        shard = shards.of_room(room_id)
+        return await coalescers[shard].write(lambda db: op(ShardConnections.single(db, shard, shards.count)))
+
+    # user ids are offset per worker, so that workers make distinct joins
+    await run(writes, concurrency, room_ids, write, first_user_id)
+    for coalescer in coalescers:
+        await coalescer.close()
+
+
+def worker(shards: RoomShards, room_ids: List[int], first_user_id: int, writes: int, concurrency: int, barrier):
+    barrier.wait()
+    asyncio.run(worker_writes(shards, room_ids, first_user_id, writes, concurrency))
+
+
+def measure(directory: str, count: int, writes: int, workers: int, concurrency: int)-> float:
+    """Seconds taken for workers processes to make writes joins between them"""
+    shards = create_shards(directory, count)
+    room_ids = asyncio.run(create_rooms(shards))
+    barrier = multiprocessing.Barrier(workers + 1)
+    processes = [
+        multiprocessing.Process(target=worker, args=(shards, room_ids, i * writes, writes // workers + (i < writes % workers), concurrency, barrier))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start
+
+
+def main(writes: int, workers: int, shard_counts: List[int], concurrency: int = 64):
+    print(f"{writes} joins to {ROOMS} rooms from {workers} workers of {concurrency} concurrent requests")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in shard_counts:
+            seconds = measure(directory, count, writes, workers, concurrency)
+            print(f"  {count} shards {writes / seconds:10.0f} writes/s")
+
+
+if __name__ == "__main__":
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    shard_counts = [int(arg) for arg in sys.argv[3:]] or [1, 2, 4, 8]
+    main(writes, workers, shard_counts)
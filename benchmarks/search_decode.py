@@ -0,0 +1,98 @@
+"""
+Compare decoding Spotify track search responses in full and then extracting results,
+against decoding them through the projection in auxify.external.projection.
+
+Run from the repository root, with recorded responses or a synthetic one:
+
+    python -m benchmarks.search_decode [response.json ...]
+"""
+import random
+import string
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List
+
+import rapidjson
+
+from auxify.controllers.rooms import extract_relevant_data_from_search_results
+from auxify.external.projection import project_search_response
+
+
+# the markets included in responses to searches without a market
+MARKETS = ["AD", "AE", "AR", "AT", "AU", "BE", "BG", "BO", "BR", "CA", "CH", "CL", "CO", "CR", "CY", "CZ",
+           "DE", "DK", "DO", "EC", "EE", "ES", "FI", "FR", "GB", "GR", "GT", "HK", "HN", "HU", "ID", "IE",
+           "IL", "IN", "IS", "IT", "JP", "LI", "LT", "LU", "LV", "MC", "MT", "MX", "MY", "NI", "NL", "NO",
+           "NZ", "PA", "PE", "PH", "PL", "PT", "PY", "RO", "SA", "SE", "SG", "SK", "SV", "TH", "TR", "TW",
+           "US", "UY", "VN", "ZA"] * 2
+
+
+def _spotify_id()-> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=22))
+
+
+def _object(object_type: str, **fields)-> Dict:
+    spotify_id = _spotify_id()
+    return {
+        "external_urls": {"spotify": f"https://open.spotify.com/{object_type}/{spotify_id}"},
+        "href": f"https://api.spotify.com/v1/{object_type}s/{spotify_id}",
+        "id": spotify_id,
+        "type": object_type,
+        "uri": f"spotify:{object_type}:{spotify_id}",
+        **fields
+    }
+
+
+def synthetic_response(tracks: int, with_markets: bool)-> bytes:
+    """A search response shaped like Spotify's, with the fields of the full track objects"""
+    markets = {"available_markets": MARKETS} if with_markets else {}
+    items = []
+    for _ in range(tracks):
+        artists = [_object("artist", name=f"Artist {_spotify_id()[:8]}") for _ in range(random.randint(1, 3))]
+        album = _object(
+            "album", album_type="album", artists=artists, name=f"Album {_spotify_id()}",
+            images=[{"height": size, "width": size, "url": f"https://i.scdn.co/image/{_spotify_id()}"} for size in (640, 300, 64)],
+            release_date="2013-05-20", release_date_precision="day", total_tracks=13, **markets)
+        items.append(_object(
+            "track", album=album, artists=artists, name=f"Track {_spotify_id()}", disc_number=1,
+            duration_ms=random.randint(100_000, 400_000), explicit=False, external_ids={"isrc": "USQX91300108"},
+            is_local=False, is_playable=random.random() > 0.1, popularity=random.randint(0, 100),
+            preview_url=f"https://p.scdn.co/mp3-preview/{_spotify_id()}", track_number=3, **markets))
+    return rapidjson.dumps({
+        "tracks": {"href": "https://api.spotify.com/v1/search", "items": items, "limit": tracks,
+                   "next": None, "offset": 0, "previous": None, "total": 1000}
+    }).encode()
+
+
+def full_decode(body: bytes)-> List[Dict]:
+    return extract_relevant_data_from_search_results(rapidjson.loads(body))
+
+
+def measure(name: str, decode: Callable[[bytes], List[Dict]], body: bytes):
+    seconds = min(timeit.repeat(lambda: decode(body), number=200, repeat=5)) / 200
+    tracemalloc.start()
+    decode(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<12} {seconds * 1000:8.3f}ms  peak {peak // 1024:6d}KiB")
+
+
+def main(paths: List[str]):
+    if paths:
+        payloads = {path: open(path, "rb").read() for path in paths}
+    else:
+        random.seed(0)
+        payloads = {
+            "synthetic, 50 tracks, market=from_token": synthetic_response(50, with_markets=False),
+            "synthetic, 50 tracks, with available_markets": synthetic_response(50, with_markets=True)
+        }
+
+    for name, body in payloads.items():
+        assert project_search_response(body) == full_decode(body), f"projection differs for {name}"
+        print(f"{name} ({len(body) // 1024}KiB)")
+        measure("full", full_decode, body)
+        measure("projection", project_search_response, body)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
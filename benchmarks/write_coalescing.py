@@ -0,0 +1,76 @@
+"""
+Compare write throughput with a connection and commit per write, as before write
+coalescing, against the same writes committed in batches by auxify.models.write_coalescer.
+
+Each run has concurrent requests join users to rooms on a fresh database built from
+schema/schema.sql. Run from the repository root:
+
+    python -m benchmarks.write_coalescing [writes] [concurrency]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from auxify.models import rooms
+from auxify.models.write_coalescer import WriteCoalescer, WriteOp
+
+
+SCHEMA = "schema/schema.sql"
+
+
+def create_database(path: str, users: int):
+    with open(SCHEMA) as schema, sqlite3.connect(path) as db:
+        db.executescript(schema.read())
+        db.executemany(
+            "INSERT INTO user (first_name, last_name, email, password_hash) VALUES (?, ?, ?, ?)",
+            [("First", "Last", f"user{i}@example.com", "pwhash") for i in range(users)])
+        db.execute("INSERT INTO room (owner_id, active, room_name) VALUES (1, 1, 'benchmark')")
+        db.commit()
+
+
+async def run(writes: int, concurrency: int, write: Callable[[WriteOp], Awaitable])-> float:
+    """Seconds taken for concurrency tasks to add writes users to the room between them"""
+    pending = iter(range(1, writes + 1))
+
+    async def request_loop():
+        for user_id in pending:
+            await write(lambda db, user_id=user_id: rooms.RoomPersistence(db).add_user_to_room(1, user_id))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request_loop() for _ in range(concurrency)])
+    return time.perf_counter() - start
+
+
+async def main(writes: int, concurrency: int):
+    print(f"{writes} writes from {concurrency} concurrent requests")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "commit_per_write.db")
+        create_database(path, writes)
+
+        async def commit_per_write(op: WriteOp):
+            async with aiosqlite.connect(path) as db:
+                return await op(db)
+
+        seconds = await run(writes, concurrency, commit_per_write)
+        print(f"  {'commit per write':<18} {writes / seconds:10.0f} writes/s")
+
+        path = os.path.join(directory, "coalesced.db")
+        create_database(path, writes)
+        coalescer = WriteCoalescer(path, max_batch=200, max_delay_seconds=0.002)
+        seconds = await run(writes, concurrency, coalescer.write)
+        await coalescer.close()
+        stats = coalescer.stats()
+        print(f"  {'coalesced':<18} {writes / seconds:10.0f} writes/s"
+              f"  ({stats['batches']} batches, largest {stats['largest_batch']})")
+
+
+if __name__ == "__main__":
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    asyncio.run(main(writes, concurrency))
@@ -1,24 +1,75 @@
+import argparse
 import logging
 from aiohttp import web
 import aiohttp_middlewares
 import aiohttp.web_exceptions as exc
 
 from auxify.config import Config
-from auxify import routes
+from auxify import routes, server
+from auxify.jobs import maintenance, archival, room_expiry, track_store
+from auxify.middlewares.activity import activity_middleware
+from auxify.middlewares.rate_limit import rate_limit_middleware
+from auxify.middlewares.admission import admission_middleware
+from auxify.middlewares.loop_monitor import loop_monitor
+from auxify.controllers import room_cache, spotify
+from auxify.controllers.playback import playback_poller_cleanup
 
 def get_app():
     Config.configure()
     Config.configure_logging()
-    app = web.Application(middlewares=[
-        aiohttp_middlewares.cors_middleware(allow_all=True),
-        aiohttp_middlewares.error_middleware(ignore_exceptions=exc.HTTPRedirection)
-    ])
+    config = Config.get_config()
+    room_cache.configure(config.room_cache_settings())
+    spotify.configure_unauthed_users(config.room_cache_settings())
+    monitor = loop_monitor(config)
+    middlewares = [
+        activity_middleware,
+        aiohttp_middlewares.cors_middleware(allow_all=True)
+    ]
+    if monitor is not None:
+        middlewares.extend(monitor.middlewares())
+    if config.rate_limit_settings()["enabled"]:
+        # inside CORS so 429s carry CORS headers; outside the error middleware, which would drop Retry-After
+        middlewares.append(rate_limit_middleware(config))
+    if config.admission_settings()["enabled"]:
+        # after rate limiting, so limited requests do not take up the queue
+        middlewares.append(admission_middleware(config))
+    middlewares.append(aiohttp_middlewares.error_middleware(ignore_exceptions=exc.HTTPRedirection))
+    app = web.Application(middlewares=middlewares)
     app.add_routes(routes.routes_tab)
-    app.cleanup_ctx.append(Config.get_config().deferred_cleanup)
+    app.cleanup_ctx.append(config.deferred_cleanup)
+    if server.is_primary_worker():
+        # these work on the database as a whole, so only one worker runs them
+        app.cleanup_ctx.append(maintenance.maintenance_job(config))
+        app.cleanup_ctx.append(archival.archival_job(config))
+    app.cleanup_ctx.append(room_expiry.room_expiry_job(config))
+    app.cleanup_ctx.append(track_store.track_store_job(config))
+    app.cleanup_ctx.append(playback_poller_cleanup)
+    if monitor is not None:
+        app.cleanup_ctx.append(monitor.cleanup_ctx)
     return app
 
 async def get_app_async():
     return get_app()
 
+def serve_production(args):
+    Config.configure()
+    # each worker starts its own queue listener in get_app; one running here would be forked mid-use
+    Config.configure_logging(queued=False)
+    settings = Config.get_config().server_settings()
+    for key in ("host", "port", "workers"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    server.Supervisor(get_app_async, settings).run()
+
 if __name__ == '__main__':
-    web.run_app(get_app())
+    parser = argparse.ArgumentParser(description="Run the Auxify server")
+    parser.add_argument("--production", action="store_true",
+                        help="run the worker processes configured in the server section of Config.json")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    if args.production:
+        serve_production(args)
+    else:
+        web.run_app(get_app(), host=args.host, port=args.port)
@@ -1,29 +1,238 @@
-import sqlite3
-from sys import argv, exit
+"""
+Create the database from schema/schema.sql, optionally filling it with synthetic data
+for reproducing production-scale query behaviour locally, e.g.
+
+    python schema/recreate_db.py load.db --users 1000000 --rooms 200000 --seed 1
+
+Run from the project root. Generated users can log in with GENERATED_PASSWORD.
+"""
+import argparse
 import os
+import random
+import sqlite3
+import time
+from sys import exit
+from typing import Iterable, Iterator, List, Tuple
+
+import bcrypt
 
 DEFAULT_DB_NAME = "auxify.db"
 SCHEMA_LOCATION = "schema/schema.sql"
+GENERATED_PASSWORD = "auxify-load-test!1"
+# rooms are expired after 12 hours without activity, so active rooms were active more recently than that
+ACTIVE_ROOM_MAX_IDLE_SECONDS = 12 * 60 * 60
+HOUR_SECONDS = 60 * 60
+# columns added to tables after they were first created, as (table, column, definition, backfill).
+# The schema's CREATE TABLE IF NOT EXISTS leaves existing tables as they are, so these are added
+# to existing databases before the schema creates indexes on them. ALTER TABLE can only add a
+# column with a constant default, so columns defaulting to e.g. CURRENT_TIMESTAMP are added as
+# nullable and backfilled
+ADDED_COLUMNS = [
+    ("room", "deactivated_at", "TEXT NULL DEFAULT NULL", None),
+    ("room", "last_active_at", "TEXT NULL DEFAULT NULL",
+     "UPDATE room SET last_active_at = created_at WHERE last_active_at IS NULL"),
+]
+
+
+def migrate_schema(db: sqlite3.Connection):
+    """Add any of ADDED_COLUMNS missing from existing tables"""
+    for table, column, definition, backfill in ADDED_COLUMNS:
+        columns = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+        if not columns or column in columns:
+            continue # the schema creates the table with the column, or it is already there
+        print("Adding column %s.%s" % (table, column))
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        if backfill:
+            db.execute(backfill)
+    db.commit()
+
+
+def create_schema(db_name: str):
+    if os.path.exists(db_name):
+        print("Warning: %s already exists. Existing tables will not be dropped; missing columns are added." % db_name)
+        print("To completely recreate the DB, delete that file first")
+
+    print("Running %s on DB '%s'" % (SCHEMA_LOCATION, db_name))
+    with open(SCHEMA_LOCATION) as sql_schema:
+        contents = sql_schema.read()
+        with sqlite3.connect(db_name) as db:
+            migrate_schema(db)
+            db.executescript(contents)
+            db.commit()
+
+
+def _next_id(db: sqlite3.Connection, table: str, column: str)-> int:
+    return db.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}").fetchone()[0]
+
+
+def _bulk_insert(db: sqlite3.Connection, table: str, statement: str, rows: Iterable[Tuple], batch_size: int):
+    """Insert rows batch_size at a time, each batch in one transaction"""
+    start = time.perf_counter()
+    inserted = 0
+    batch: List[Tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            inserted += _insert_batch(db, statement, batch)
+            batch = []
+    inserted += _insert_batch(db, statement, batch)
+    print("  %-12s %10d rows in %.1fs" % (table, inserted, time.perf_counter() - start))
+
+
+def _random_token(bits: int)-> str:
+    # from random rather than secrets, so that --seed reproduces the data
+    return "%x" % random.getrandbits(bits)
+
+
+def _insert_batch(db: sqlite3.Connection, statement: str, batch: List[Tuple])-> int:
+    if not batch:
+        return 0
+    with db:
+        db.executemany(statement, batch)
+    return len(batch)
+
 
-if not os.path.exists(SCHEMA_LOCATION):
-    print("No schema file found at %s" % SCHEMA_LOCATION)
-    print("Ensure you are running this from the project root (python schema/recreate_db.py)")
-    exit(1)
+def generate_users(first_id: int, count: int)-> Iterator[Tuple]:
+    password_hash = bcrypt.hashpw(GENERATED_PASSWORD.encode(), bcrypt.gensalt())
+    for user_id in range(first_id, first_id + count):
+        yield (user_id, f"user{user_id}@example.com", f"First{user_id}", f"Last{user_id}", password_hash)
 
-if len(argv) >= 2:
-    db_name = argv[1]
-else:
-    print("No DB name supplied; using default")
-    db_name = DEFAULT_DB_NAME
 
-if os.path.exists(db_name):
-    print("Warning: %s already exists. Existing tables will not be modified or dropped." % db_name)
-    print("To completely recreate the DB, delete that file first")
+def generate_rooms(first_id: int, count: int, user_ids: range, active_ratio: float, history_days: float,
+                   code_ratio: float, now: float)-> Iterator[Tuple]:
+    """
+    Rooms created over the last history_days. Each owner has at most one active room,
+    which has been active recently; the other rooms were deactivated some hours after creation.
+    Times are unix timestamps
+    """
+    active_count = min(int(count * active_ratio), len(user_ids))
+    active_owners = random.sample(user_ids, active_count)
+    history_seconds = history_days * 24 * 60 * 60
 
-print("Running %s on DB '%s'" % (SCHEMA_LOCATION, db_name))
+    for i, room_id in enumerate(range(first_id, first_id + count)):
+        room_code = _random_token(24) if random.random() < code_ratio else None
+        if i < active_count:
+            last_active_at = now - random.uniform(0, ACTIVE_ROOM_MAX_IDLE_SECONDS)
+            created_at = last_active_at - random.expovariate(1 / 3) * HOUR_SECONDS
+            yield (room_id, active_owners[i], 1, created_at, None, last_active_at, room_code, f"Room {room_id}")
+        else:
+            created_at = now - random.uniform(0, history_seconds)
+            deactivated_at = min(created_at + random.expovariate(1 / 4) * HOUR_SECONDS, now)
+            yield (room_id, random.choice(user_ids), 0, created_at, deactivated_at, deactivated_at, room_code,
+                   f"Room {room_id}")
 
-with open(SCHEMA_LOCATION) as sql_schema:
-    contents = sql_schema.read()
-    with sqlite3.connect(db_name) as db:
-        db.executescript(contents)
+
+def generate_memberships(room_ids: range, user_ids: range, size_alpha: float, max_room_size: int)-> Iterator[Tuple]:
+    """Members of each room, with room sizes following a power law: most rooms are small, a few are huge"""
+    max_room_size = min(max_room_size, len(user_ids))
+    for room_id in room_ids:
+        size = min(int(random.paretovariate(size_alpha)), max_room_size)
+        for user_id in random.sample(user_ids, size):
+            yield (room_id, user_id)
+
+
+def generate_tokens(user_ids: range, token_ratio: float, refresh_ratio: float, duration_seconds: int,
+                    now: float)-> Iterator[Tuple]:
+    """
+    Spotify tokens for a share of users, created over the last two token lifetimes so
+    that about half have expired and their expiries are spread out
+    """
+    for user_id in user_ids:
+        if random.random() >= token_ratio:
+            continue
+        created_at = now - random.uniform(0, 2 * duration_seconds)
+        refresh_token = _random_token(256) if random.random() < refresh_ratio else None
+        yield (f"spotify-{user_id}", user_id, _random_token(256), refresh_token, created_at, duration_seconds)
+
+
+def load_data(db: sqlite3.Connection, args: argparse.Namespace):
+    now = time.time()
+    first_user_id = _next_id(db, "user", "user_id")
+    _bulk_insert(db, "user", """
+        INSERT INTO user (user_id, email, first_name, last_name, password_hash)
+        VALUES (?, ?, ?, ?, ?)
+    """, generate_users(first_user_id, args.users), args.batch_size)
+    user_ids = range(first_user_id, first_user_id + args.users)
+
+    first_room_id = _next_id(db, "room", "room_id")
+    _bulk_insert(db, "room", """
+        INSERT INTO room (room_id, owner_id, active, created_at, deactivated_at, last_active_at, room_code, room_name)
+        VALUES (?, ?, ?, datetime(?, 'unixepoch'), datetime(?, 'unixepoch'), datetime(?, 'unixepoch'), ?, ?)
+    """, generate_rooms(first_room_id, args.rooms, user_ids, args.active_ratio, args.history_days,
+                        args.code_ratio, now), args.batch_size)
+    room_ids = range(first_room_id, first_room_id + args.rooms)
+
+    _bulk_insert(db, "room_member", """
+        INSERT INTO room_member (room_id, user_id) VALUES (?, ?)
+    """, generate_memberships(room_ids, user_ids, args.room_size_alpha, args.max_room_size), args.batch_size)
+
+    _bulk_insert(db, "spotify_token", """
+        INSERT INTO spotify_token (spotify_user_id, user_id, access_token, refresh_token, created_at, duration_seconds)
+        VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'), ?)
+    """, generate_tokens(user_ids, args.token_ratio, args.refresh_ratio, args.token_duration_seconds, now),
+        args.batch_size)
+
+
+def generate_data(db_name: str, args: argparse.Namespace):
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print("Generating data in '%s'" % db_name)
+    db = sqlite3.connect(db_name)
+    # the data is disposable, so trade durability for load speed
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA cache_size = -262144") # 256MiB
+    # secondary indexes are quicker to build once over the loaded rows than to update row by row;
+    # the schema recreates them afterwards
+    secondary_indexes = [row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for index in secondary_indexes:
+        db.execute(f"DROP INDEX {index}")
+    try:
+        load_data(db, args)
+    finally:
+        start = time.perf_counter()
+        with open(SCHEMA_LOCATION) as sql_schema:
+            db.executescript(sql_schema.read())
+        db.execute("ANALYZE")
         db.commit()
+        db.close()
+        print("  %-12s %10d rebuilt in %.1fs" % ("indexes", len(secondary_indexes), time.perf_counter() - start))
+
+
+def parse_args()-> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create the Auxify database, optionally with synthetic data")
+    parser.add_argument("db_name", nargs="?", default=DEFAULT_DB_NAME)
+    parser.add_argument("--users", type=int, default=0, help="number of users to generate")
+    parser.add_argument("--rooms", type=int, default=0, help="number of rooms to generate")
+    parser.add_argument("--active-ratio", type=float, default=0.05, help="share of generated rooms still active")
+    parser.add_argument("--code-ratio", type=float, default=0.5, help="share of generated rooms with a room code")
+    parser.add_argument("--history-days", type=float, default=90, help="inactive rooms are created over this many days")
+    parser.add_argument("--room-size-alpha", type=float, default=1.5,
+                        help="Pareto shape of room sizes; lower values give more very large rooms")
+    parser.add_argument("--max-room-size", type=int, default=1000)
+    parser.add_argument("--token-ratio", type=float, default=0.6, help="share of users with a Spotify token")
+    parser.add_argument("--refresh-ratio", type=float, default=0.95, help="share of tokens with a refresh token")
+    parser.add_argument("--token-duration-seconds", type=int, default=3600)
+    parser.add_argument("--batch-size", type=int, default=100_000, help="rows inserted per transaction")
+    parser.add_argument("--seed", type=int, help="seed for reproducible data")
+    return parser.parse_args()
+
+
+def main():
+    if not os.path.exists(SCHEMA_LOCATION):
+        print("No schema file found at %s" % SCHEMA_LOCATION)
+        print("Ensure you are running this from the project root (python schema/recreate_db.py)")
+        exit(1)
+
+    args = parse_args()
+    create_schema(args.db_name)
+    if args.users:
+        generate_data(args.db_name, args)
+        print("Generated users can log in with the password '%s'" % GENERATED_PASSWORD)
+    elif args.rooms:
+        print("Rooms need owners; pass --users as well")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
 PRAGMA foreign_keys = ON;
+-- both of these must be set before any table is created to take effect;
+-- they allow the maintenance job to checkpoint the WAL and incrementally vacuum free pages
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
 
 CREATE TABLE IF NOT EXISTS user (
     user_id INTEGER PRIMARY KEY,
@@ -21,18 +25,23 @@ CREATE TABLE IF NOT EXISTS spotify_token (
     UNIQUE (spotify_user_id)
 );
 CREATE INDEX IF NOT EXISTS idx_spotify_token_created_at ON spotify_token(created_at);
+CREATE INDEX IF NOT EXISTS idx_spotify_token_user ON spotify_token (user_id);
 
 CREATE TABLE IF NOT EXISTS room (
     room_id INTEGER PRIMARY KEY,
     owner_id INTEGER NOT NULL, -- id of user that owns this room
     active INTEGER NOT NULL DEFAULT 1 CHECK (active IN (0,1)), -- "boolean; is this room still active?"
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    deactivated_at TEXT NULL DEFAULT NULL, -- when the room stopped being active
+    last_active_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP, -- last join/search/enqueue, flushed periodically
     room_code TEXT NULL DEFAULT NULL, -- passcode used to join a room; null for open joining
     room_name TEXT NOT NULL, -- the user-defined name for a room
     FOREIGN KEY (owner_id) REFERENCES user (user_id)
 );
 CREATE INDEX IF NOT EXISTS idx_room_owner_active ON room (owner_id, active);
 CREATE INDEX IF NOT EXISTS idx_room_created_at ON room (created_at);
+CREATE INDEX IF NOT EXISTS idx_room_active_deactivated_at ON room (active, deactivated_at);
+CREATE INDEX IF NOT EXISTS idx_room_active_last_active_at ON room (active, last_active_at);
 
 CREATE TABLE IF NOT EXISTS room_member (
     room_id INTEGER NOT NULL,
@@ -41,3 +50,34 @@ CREATE TABLE IF NOT EXISTS room_member (
     FOREIGN KEY (room_id) REFERENCES room (room_id),
     FOREIGN KEY (user_id) REFERENCES user (user_id)
 );
+-- the rooms a user has joined
+CREATE INDEX IF NOT EXISTS idx_room_member_user ON room_member (user_id);
+
+-- rooms that have been inactive for a long time, and their members, are moved
+-- out of room and room_member into these tables by the archival job
+CREATE TABLE IF NOT EXISTS room_archive (
+    room_id INTEGER PRIMARY KEY,
+    owner_id INTEGER NOT NULL,
+    active INTEGER NOT NULL DEFAULT 0 CHECK (active IN (0,1)),
+    created_at TEXT NOT NULL,
+    deactivated_at TEXT NULL DEFAULT NULL,
+    archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    room_code TEXT NULL DEFAULT NULL,
+    room_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS room_member_archive (
+    room_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (room_id, user_id)
+);
+
+-- metadata for tracks seen in search results or enqueued, so that queue and history
+-- views can be rendered without calling Spotify
+CREATE TABLE IF NOT EXISTS track (
+    uri TEXT PRIMARY KEY, -- the Spotify track URI
+    name TEXT NOT NULL,
+    artists TEXT NOT NULL, -- JSON array of {"name": ...}
+    images TEXT NOT NULL, -- JSON array of album images
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
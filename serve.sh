@@ -1 +1 @@
-gunicorn main:get_app_async --bind localhost:8080 --worker-class aiohttp.GunicornWebWorker
\ No newline at end of file
+python main.py --production --host localhost --port 8080
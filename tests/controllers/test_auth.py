@@ -0,0 +1,47 @@
+from unittest.async_case import IsolatedAsyncioTestCase
+import os
+import rapidjson
+import sqlite3
+
+from auxify.config import Config
+from auxify.controllers import auth, profile_cache
+from auxify.models import rooms
+
+CONFIG_FILE = "test_auth_config.json"
+DB_FILE = "test_auth.db"
+
+
+class TestGetProfile(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._remove()
+        with open("schema/schema.sql") as schema, sqlite3.connect(DB_FILE) as db:
+            db.executescript(schema.read())
+            db.execute("INSERT INTO user (user_id, email, first_name, last_name, password_hash) VALUES (1, 'a@example.com', 'A', 'B', 'pwhash')")
+        with open(CONFIG_FILE, "w") as config_file:
+            config_file.write(rapidjson.dumps({
+                "spotify": {"client_id": "id", "secret": "secret", "redirect_url": "http://localhost/callback"},
+                "jwt": {"secret": "secret"},
+                "db": {"location": DB_FILE}
+            }))
+        self.config = Config(CONFIG_FILE)
+        profile_cache._profile_cache = None
+
+    async def asyncTearDown(self):
+        profile_cache._profile_cache = None
+        self._remove()
+
+    def _remove(self):
+        for name in (CONFIG_FILE, DB_FILE, DB_FILE + "-wal", DB_FILE + "-shm"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    async def test_profile_reads_rooms_from_the_main_database(self):
+        """test that rooms are read over the user's connection when rooms are not sharded"""
+        self.assertIsNone(self.config.room_shards())
+        async with self.config.get_database_connection() as db:
+            room_id = await rooms.RoomPersistence(db).create_room(1, None, "room")
+
+        profile = await auth.get_profile(1, self.config)
+        self.assertEqual("a@example.com", profile["user"]["email"])
+        self.assertEqual([room_id], [room["room_id"] for room in profile["rooms"]])
@@ -0,0 +1,68 @@
+import asyncio
+from unittest.async_case import IsolatedAsyncioTestCase
+
+from auxify.controllers.enqueue_dedup import EnqueueDeduplicator
+from auxify.utils import metrics
+
+
+class TestEnqueueDeduplicator(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.calls = 0
+
+    async def enqueue(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"success": True}
+
+    async def test_idempotency_key_replays_response(self):
+        """test that a retry with the same Idempotency-Key is answered without enqueueing again"""
+        dedup = EnqueueDeduplicator(maxsize=10, idempotency_ttl_seconds=60, duplicate_window_seconds=0)
+        first = await dedup.run(1, 1, "spotify:track:a", "key-1", self.enqueue)
+        retry = await dedup.run(1, 1, "spotify:track:a", "key-1", self.enqueue)
+        self.assertEqual(first, retry)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(metrics.snapshot()["counters"]["enqueue.idempotent_replays"], 1)
+
+    async def test_double_tap_suppressed(self):
+        """test that concurrent and recent duplicates of a uri in a room only enqueue once"""
+        dedup = EnqueueDeduplicator(maxsize=10, idempotency_ttl_seconds=60, duplicate_window_seconds=60)
+        responses = await asyncio.gather(*[dedup.run(i, 1, "spotify:track:a", None, self.enqueue) for i in range(3)])
+        later = await dedup.run(4, 1, "spotify:track:a", None, self.enqueue)
+        other_room = await dedup.run(4, 2, "spotify:track:a", None, self.enqueue)
+
+        self.assertEqual(self.calls, 2)
+        self.assertTrue(all(response["success"] for response in responses))
+        self.assertTrue(later["duplicate"])
+        self.assertNotIn("duplicate", other_room)
+        self.assertEqual(metrics.snapshot()["counters"]["enqueue.duplicates_suppressed"], 3)
+
+    async def test_failures_are_not_remembered(self):
+        """test that a failed enqueue can be retried"""
+        dedup = EnqueueDeduplicator(maxsize=10, idempotency_ttl_seconds=60, duplicate_window_seconds=60)
+
+        async def fail():
+            raise RuntimeError("Spotify is down")
+
+        with self.assertRaises(RuntimeError):
+            await dedup.run(1, 1, "spotify:track:a", "key-1", fail)
+        self.assertEqual(await dedup.run(1, 1, "spotify:track:a", "key-1", self.enqueue), {"success": True})
+
+    async def test_failures_are_not_shared_with_other_users(self):
+        """test that a concurrent request from another user enqueues on its own when the first one fails"""
+        dedup = EnqueueDeduplicator(maxsize=10, idempotency_ttl_seconds=60, duplicate_window_seconds=60)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Forbidden")
+
+        first, same_user, other_user = await asyncio.gather(
+            dedup.run(1, 1, "spotify:track:a", None, fail),
+            dedup.run(1, 1, "spotify:track:a", None, self.enqueue),
+            dedup.run(2, 1, "spotify:track:a", None, self.enqueue),
+            return_exceptions=True)
+        self.assertIsInstance(first, RuntimeError)
+        self.assertIsInstance(same_user, RuntimeError)
+        self.assertEqual(other_user, {"success": True})
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,70 @@
+import asyncio
+from unittest import TestCase
+from unittest.async_case import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from auxify.config import NOW_PLAYING_DEFAULTS
+from auxify.controllers import playback
+
+
+def _state(is_playing=True, progress_ms=1000, duration_ms=200000):
+    return {
+        "is_playing": is_playing,
+        "progress_ms": progress_ms,
+        "item": {"name": "Track", "uri": "spotify:track:a", "artists": [], "album": {"images": []},
+                 "duration_ms": duration_ms}
+    }
+
+
+class FakeSpotifyApi:
+    def __init__(self, state):
+        self.state = state
+        self.calls = 0
+
+    async def playback_state(self, token):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.state
+
+
+class FakeConfig:
+    def __init__(self, api):
+        self.api = api
+
+    def now_playing_settings(self):
+        return NOW_PLAYING_DEFAULTS
+
+    def get_spotify_api(self):
+        return self.api
+
+
+class TestPollInterval(TestCase):
+    settings = NOW_PLAYING_DEFAULTS
+
+    def test_polls_just_after_track_end(self):
+        snapshot = playback.snapshot_from_playback_state(_state(progress_ms=197000, duration_ms=200000))
+        self.assertAlmostEqual(playback.next_poll_interval(snapshot, self.settings), 3.5)
+
+    def test_slower_when_paused_or_idle(self):
+        paused = playback.snapshot_from_playback_state(_state(is_playing=False))
+        idle = playback.snapshot_from_playback_state(None)
+        self.assertEqual(playback.next_poll_interval(paused, self.settings), self.settings["paused_interval_seconds"])
+        self.assertEqual(playback.next_poll_interval(idle, self.settings), self.settings["idle_interval_seconds"])
+
+
+class TestPlaybackPoller(IsolatedAsyncioTestCase):
+
+    async def test_readers_share_one_poll(self):
+        """test that many members reading at once cause a single Spotify call"""
+        api = FakeSpotifyApi(_state())
+        poller = playback.PlaybackPoller(FakeConfig(api))
+
+        async def token(*a, **k):
+            return "token"
+
+        with patch.object(playback.spotify, "get_valid_token_for_user", token):
+            snapshots = await asyncio.gather(*[poller.get_snapshot(1) for _ in range(50)])
+            await poller.stop_all()
+
+        self.assertEqual(api.calls, 1)
+        self.assertTrue(all(snapshot["track"]["uri"] == "spotify:track:a" for snapshot in snapshots))
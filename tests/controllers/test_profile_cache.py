@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from auxify.controllers.profile_cache import ProfileCache
+
+
+def profile(*rooms):
+    return {"user": {}, "rooms": [{"room_id": room_id, "owner_id": owner_id} for room_id, owner_id in rooms], "token_state": {}}
+
+
+class TestProfileCache(TestCase):
+
+    def test_room_changes_invalidate_members(self):
+        """test that invalidating a room drops the snapshot of every member, and only theirs"""
+        cache = ProfileCache(maxsize=10, ttl_seconds=60)
+        cache.set(1, profile((10, 1)))
+        cache.set(2, profile((10, 1), (20, 3)))
+        cache.set(3, profile((20, 3)))
+
+        cache.invalidate_rooms([10])
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+    def test_new_room_invalidates_members_of_owners_rooms(self):
+        """test that an owner creating a room invalidates the members of the room it replaces"""
+        cache = ProfileCache(maxsize=10, ttl_seconds=60)
+        cache.set(1, profile())
+        cache.set(2, profile((10, 1)))
+        cache.set(3, profile((20, 3)))
+
+        cache.invalidate_owned_rooms(1)
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+    def test_index_is_rebuilt_from_live_snapshots(self):
+        """test that rooms of evicted snapshots do not stay in the index"""
+        cache = ProfileCache(maxsize=2, ttl_seconds=60)
+        for user_id in range(5):
+            cache.set(user_id, profile((100 + user_id, user_id)))
+        self.assertLessEqual(cache.stats()["indexed_rooms"], 3)
+        self.assertIsNotNone(cache.get(4))
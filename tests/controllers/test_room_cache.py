@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from auxify.config import ROOM_CACHE_DEFAULTS
+from auxify.controllers import room_cache
+
+
+class TestRoomCache(TestCase):
+
+    def setUp(self):
+        room_cache.configure(ROOM_CACHE_DEFAULTS)
+
+    def tearDown(self):
+        room_cache.configure(ROOM_CACHE_DEFAULTS)
+
+    def test_observed_rooms_are_remembered(self):
+        """test that missing and inactive rooms are remembered, and active rooms are not"""
+        room_cache.observe_room({}, 1)
+        room_cache.observe_room({"room_id": 2, "active": False})
+        room_cache.observe_room({"room_id": 3, "active": True})
+        self.assertTrue(room_cache.is_known_missing(1))
+        self.assertTrue(room_cache.is_known_unavailable(2))
+        self.assertFalse(room_cache.is_known_missing(2))
+        self.assertFalse(room_cache.is_known_unavailable(3))
+
+    def test_created_room_is_no_longer_unavailable(self):
+        """test that creating a room forgets that its id was missing and its owner had no room"""
+        room_cache.observe_room({}, 5)
+        room_cache.observe_owned_room({}, 10)
+        self.assertTrue(room_cache.is_known_without_room(10))
+
+        room_cache.room_created(5, 10)
+        self.assertFalse(room_cache.is_known_missing(5))
+        self.assertFalse(room_cache.is_known_without_room(10))
+
+    def test_configured_from_settings(self):
+        """test that the caches are sized from the settings, and remember nothing when disabled"""
+        room_cache.configure({**ROOM_CACHE_DEFAULTS, "negative_maxsize": 2, "negative_ttl_seconds": 5})
+        self.assertEqual((room_cache.missing_rooms.maxsize, room_cache.missing_rooms.ttl_seconds), (2, 5))
+        for room_id in range(5):
+            room_cache.observe_room({}, room_id)
+        self.assertEqual(len(room_cache.missing_rooms), 2)
+
+        room_cache.configure({**ROOM_CACHE_DEFAULTS, "enabled": False})
+        room_cache.observe_room({}, 1)
+        room_cache.observe_room({"room_id": 2, "active": False})
+        room_cache.observe_owned_room({}, 10)
+        self.assertFalse(room_cache.is_known_unavailable(1))
+        self.assertFalse(room_cache.is_known_unavailable(2))
+        self.assertFalse(room_cache.is_known_without_room(10))
@@ -0,0 +1,47 @@
+from unittest import TestCase
+import rapidjson
+
+from auxify.controllers.room_snapshots import RoomSnapshotStore, room_document
+
+
+def room(room_id, owner_id):
+    return {"room_id": room_id, "owner_id": owner_id, "active": True, "created_at": "2021-01-01 00:00:00",
+            "room_code": None, "room_name": "room"}
+
+
+class TestRoomSnapshots(TestCase):
+
+    def test_snapshot_body(self):
+        store = RoomSnapshotStore(maxsize=10, ttl_seconds=60)
+        snapshot = store.load(room(10, 1), [2, 3])
+        body = rapidjson.loads(store.get(10).body())
+        self.assertEqual(10, body["room_id"])
+        self.assertEqual(3, body["member_count"])
+        self.assertIs(snapshot.body(), snapshot.body())
+        # the same document as is served without snapshots
+        self.assertEqual(room_document(room(10, 1), [2, 3]), body)
+
+    def test_joins_are_applied_in_place(self):
+        """test that joins update the snapshot rather than dropping it"""
+        store = RoomSnapshotStore(maxsize=10, ttl_seconds=60)
+        snapshot = store.load(room(10, 1), [2])
+        self.assertFalse(snapshot.has_member(4))
+        self.assertEqual(2, rapidjson.loads(snapshot.body())["member_count"])
+
+        store.member_joined(10, 4)
+        self.assertIs(snapshot, store.get(10))
+        self.assertTrue(snapshot.has_member(4))
+        self.assertEqual(3, rapidjson.loads(snapshot.body())["member_count"])
+
+    def test_deactivation_drops_snapshots(self):
+        store = RoomSnapshotStore(maxsize=10, ttl_seconds=60)
+        store.load(room(10, 1), [])
+        store.load(room(20, 2), [])
+        store.load(room(30, 3), [])
+
+        store.deactivated([10])
+        # creating a room deactivates the owner's previous one
+        store.owner_rooms_deactivated(2)
+        self.assertIsNone(store.get(10))
+        self.assertIsNone(store.get(20))
+        self.assertIsNotNone(store.get(30))
@@ -0,0 +1,72 @@
+from unittest.async_case import IsolatedAsyncioTestCase
+from aiohttp import web
+import os
+import rapidjson
+import sqlite3
+
+from auxify.config import Config, ROOM_CACHE_DEFAULTS
+from auxify.controllers import rooms, room_cache, room_snapshots
+from auxify.models.rooms import RoomPersistence
+
+CONFIG_FILE = "test_rooms_config.json"
+DB_FILE = "test_rooms.db"
+OWNER_ID, MEMBER_ID = 1, 2
+
+
+class TestRoomsController(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._remove()
+        with open("schema/schema.sql") as schema, sqlite3.connect(DB_FILE) as db:
+            db.executescript(schema.read())
+            for user_id in (OWNER_ID, MEMBER_ID):
+                db.execute("INSERT INTO user (user_id, email, first_name, last_name, password_hash) VALUES (?, ?, 'A', 'B', 'pwhash')",
+                           (user_id, f"{user_id}@example.com"))
+        with open(CONFIG_FILE, "w") as config_file:
+            config_file.write(rapidjson.dumps({
+                "spotify": {"client_id": "id", "secret": "secret", "redirect_url": "http://localhost/callback"},
+                "jwt": {"secret": "secret"},
+                "db": {"location": DB_FILE}
+            }))
+        self.config = Config(CONFIG_FILE)
+        room_snapshots._room_snapshots = None
+        room_cache.configure(ROOM_CACHE_DEFAULTS)
+
+        async with self.config.get_database_connection() as db:
+            room_model = RoomPersistence(db)
+            self.room_id = await room_model.create_room(OWNER_ID, None, "room")
+            await room_model.add_user_to_room(self.room_id, MEMBER_ID)
+
+    async def asyncTearDown(self):
+        room_snapshots._room_snapshots = None
+        room_cache.configure(ROOM_CACHE_DEFAULTS)
+        self._remove()
+
+    def _remove(self):
+        for name in (CONFIG_FILE, DB_FILE, DB_FILE + "-wal", DB_FILE + "-shm"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def _deactivate_elsewhere(self):
+        """deactivate the room as another worker would, leaving this worker's snapshot in place"""
+        with sqlite3.connect(DB_FILE) as db:
+            db.execute("UPDATE room SET active = 0, deactivated_at = CURRENT_TIMESTAMP WHERE room_id = ?", (self.room_id,))
+
+    async def test_enqueue_checks_room_is_still_active(self):
+        """test that a member found in the room's snapshot cannot use a room deactivated through another worker"""
+        await rooms.get_room_by_id(self.room_id, MEMBER_ID, self.config)
+        self.assertEqual(self.room_id, (await rooms.get_room_for_member(self.room_id, MEMBER_ID, self.config))["room_id"])
+
+        self._deactivate_elsewhere()
+        with self.assertRaises(web.HTTPNotFound):
+            await rooms.get_room_for_member(self.room_id, MEMBER_ID, self.config)
+
+    async def test_snapshot_not_served_for_room_deactivated_elsewhere(self):
+        """test that a room deactivated through another worker is not found, though this worker has its snapshot"""
+        await rooms.get_room_by_id(self.room_id, MEMBER_ID, self.config)
+        self.assertIsNotNone(room_snapshots.get_room_snapshots(self.config).get(self.room_id))
+
+        self._deactivate_elsewhere()
+        with self.assertRaises(web.HTTPNotFound):
+            await rooms.get_room_by_id(self.room_id, MEMBER_ID, self.config)
+        self.assertIsNone(room_snapshots.get_room_snapshots(self.config).get(self.room_id))
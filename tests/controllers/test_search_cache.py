@@ -0,0 +1,90 @@
+import asyncio
+from unittest import TestCase
+from unittest.async_case import IsolatedAsyncioTestCase
+
+from auxify.controllers.search_cache import PrefixSearchCache, SearchDebouncer, Superseded
+
+
+def _track(name, artist):
+    return {"name": name, "artists": [{"name": artist}], "uri": f"spotify:track:{name}", "images": []}
+
+
+RESULTS = [
+    _track("One More Time", "Daft Punk"),
+    _track("Around the World", "Daft Punk"),
+    _track("Harder, Better, Faster, Stronger", "Daft Punk"),
+    _track("Dancing Queen", "ABBA"),
+]
+
+
+class TestPrefixSearchCache(TestCase):
+
+    def test_refinement_served_from_broader_query(self):
+        """test that a longer query is answered by filtering the cached results of its prefix"""
+        cache = PrefixSearchCache(maxsize=10, ttl_seconds=60, min_results=2)
+        cache.store(1, "da", RESULTS)
+        refined = cache.lookup(1, "Daft  P")
+        self.assertEqual(len(refined), 3)
+        self.assertTrue(all(track["artists"][0]["name"] == "Daft Punk" for track in refined))
+
+    def test_too_few_matches_is_a_miss(self):
+        """test that Spotify is asked when the broader results don't contain enough matches"""
+        cache = PrefixSearchCache(maxsize=10, ttl_seconds=60, min_results=2)
+        cache.store(1, "da", RESULTS)
+        self.assertIsNone(cache.lookup(1, "dancing"))
+
+    def test_scopes_are_separate(self):
+        cache = PrefixSearchCache(maxsize=10, ttl_seconds=60, min_results=1)
+        cache.store(1, "daft", RESULTS)
+        self.assertIsNone(cache.lookup(2, "daft"))
+
+    def test_stale_entries_only_served_when_allowed(self):
+        cache = PrefixSearchCache(maxsize=10, ttl_seconds=0, min_results=1)
+        cache.store(1, "daft", RESULTS)
+        self.assertIsNone(cache.lookup(1, "daft"))
+        self.assertEqual(cache.lookup(1, "daft", allow_stale=True), RESULTS)
+
+    def test_stale_results_counted_apart_from_hits(self):
+        """test that results served only because stale ones were allowed do not count as hits"""
+        cache = PrefixSearchCache(maxsize=10, ttl_seconds=0, min_results=1)
+        cache.store(1, "daft", RESULTS)
+        cache.lookup(1, "daft", allow_stale=True)
+        cache.lookup(1, "daft punk", allow_stale=True)
+        cache.lookup(1, "daft")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["stale_hits"], stats["prefix_hits"], stats["misses"]), (0, 2, 0, 1))
+
+    def test_least_recently_used_queries_are_evicted(self):
+        cache = PrefixSearchCache(maxsize=2, ttl_seconds=60, min_results=1)
+        cache.store(1, "daft", RESULTS)
+        cache.store(1, "abba", RESULTS)
+        cache.lookup(1, "daft")
+        cache.store(1, "queen", RESULTS)
+        self.assertIsNone(cache.lookup(1, "abba"))
+        self.assertIsNotNone(cache.lookup(1, "daft punk"))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["prefix_hits"]), (2, 1, 1, 1))
+
+
+class TestSearchDebouncer(IsolatedAsyncioTestCase):
+
+    async def test_newer_search_supersedes_older(self):
+        """test that a second search for the same key cancels the first"""
+        debouncer = SearchDebouncer()
+        calls = []
+
+        def search(query):
+            async def run():
+                calls.append(query)
+                return query
+            return run
+
+        first = asyncio.ensure_future(debouncer.run("user", search("daf"), delay_seconds=0.05))
+        await asyncio.sleep(0)
+        second = await debouncer.run("user", search("daft"), delay_seconds=0.05)
+
+        with self.assertRaises(Superseded):
+            await first
+        self.assertEqual(second, "daft")
+        self.assertEqual(calls, ["daft"])
+        self.assertEqual(debouncer.in_flight(), 0)
@@ -0,0 +1,43 @@
+from unittest.async_case import IsolatedAsyncioTestCase
+from aiohttp import web
+
+from auxify.controllers import spotify
+from auxify.external.circuit_breaker import CircuitOpen
+from auxify.utils import jwt
+
+
+class OpenCircuitApi:
+    async def request_tokens(self, _request):
+        raise CircuitOpen("accounts", 10)
+
+
+class FakeConfig:
+    key = jwt.key_from_secret("secret")
+
+    def jwt_key(self):
+        return self.key
+
+    def spotify_redirect(self):
+        return "http://localhost/callback"
+
+    def spotify_client_id(self):
+        return "id"
+
+    def spotify_secret(self):
+        return "secret"
+
+    def get_session(self):
+        return None
+
+    def get_spotify_api(self):
+        return OpenCircuitApi()
+
+
+class TestSpotifyCallback(IsolatedAsyncioTestCase):
+
+    async def test_open_circuit_is_a_failed_dependency(self):
+        """test that the callback reports Spotify as unavailable, not an internal error, while its circuit is open"""
+        config = FakeConfig()
+        state = jwt.generate_jwt(1, jwt.Aud.API, config.key)
+        with self.assertRaises(web.HTTPFailedDependency):
+            await spotify.handle_spotify_callback({"state": state, "code": "code"}, config)
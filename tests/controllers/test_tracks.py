@@ -0,0 +1,80 @@
+from contextlib import asynccontextmanager
+from unittest.async_case import IsolatedAsyncioTestCase
+import aiosqlite
+
+from auxify.config import TRACK_STORE_DEFAULTS
+from auxify.controllers import tracks
+
+
+def _track(uri, name="Track"):
+    return {"uri": uri, "name": name, "artists": [{"name": "Artist"}], "images": []}
+
+
+class FakeConfig:
+    def __init__(self, with_schema):
+        self.with_schema = with_schema
+        self.connections = 0
+
+    def track_store_settings(self):
+        return {**TRACK_STORE_DEFAULTS, "batch_size": 2}
+
+    @asynccontextmanager
+    async def get_database_connection(self):
+        self.connections += 1
+        async with aiosqlite.connect(":memory:") as db:
+            if self.with_schema:
+                with open("schema/schema.sql") as schema:
+                    await db.executescript(schema.read())
+            yield db
+
+
+class TestFlushTracks(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        tracks._track_buffer = None
+
+    def tearDown(self):
+        tracks._track_buffer = None
+
+    async def test_failed_writes_are_put_back(self):
+        """test that tracks are kept for the next flush when they cannot be written"""
+        config = FakeConfig(with_schema=False)
+        buffer = tracks.get_track_buffer(config)
+        buffer.add_tracks([_track("spotify:track:a"), _track("spotify:track:b"), _track("spotify:track:c")])
+
+        with self.assertRaises(Exception):
+            await tracks.flush_tracks(config)
+        self.assertEqual({"spotify:track:a", "spotify:track:b", "spotify:track:c"}, set(buffer.pending))
+
+    async def test_newer_tracks_are_not_replaced(self):
+        """test that putting tracks back keeps copies buffered since they were drained"""
+        buffer = tracks.TrackWriteBuffer(max_pending=10)
+        buffer.add_tracks([_track("spotify:track:a", "Old")])
+        drained = buffer.drain_tracks()
+        buffer.add_tracks([_track("spotify:track:a", "New")])
+        buffer.restore_tracks(drained)
+        self.assertEqual("New", buffer.pending["spotify:track:a"]["name"])
+
+    async def test_written_tracks_are_drained(self):
+        config = FakeConfig(with_schema=True)
+        buffer = tracks.get_track_buffer(config)
+        buffer.add_tracks([_track("spotify:track:a"), _track("spotify:track:b"), _track("spotify:track:c")])
+        self.assertEqual(3, await tracks.flush_tracks(config))
+        self.assertEqual({}, buffer.pending)
+
+    async def test_empty_buffer_opens_no_connection(self):
+        config = FakeConfig(with_schema=True)
+        self.assertEqual(0, await tracks.flush_tracks(config))
+        self.assertEqual(0, config.connections)
+
+    async def test_backfill_is_bounded(self):
+        """test that URIs to look up stop being queued once max_pending are waiting"""
+        buffer = tracks.TrackWriteBuffer(max_pending=3)
+        buffer.request_backfill(1, ["spotify:track:a", "spotify:track:b", "spotify:track:a"])
+        buffer.request_backfill(2, ["spotify:track:c", "spotify:track:d", "spotify:episode:e"])
+        self.assertEqual({1: {"spotify:track:a", "spotify:track:b"}, 2: {"spotify:track:c"}}, buffer.backfill)
+        self.assertEqual(1, buffer.dropped)
+
+        buffer.drain_backfill()
+        buffer.request_backfill(2, ["spotify:track:d"])
+        self.assertEqual({2: {"spotify:track:d"}}, buffer.backfill)
@@ -0,0 +1,56 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from aiohttp import ClientConnectionError, ClientResponseError
+
+from auxify.external.circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED, OPEN
+
+
+async def succeed():
+    return "ok"
+
+
+async def fail():
+    raise ClientConnectionError("connection reset")
+
+
+async def not_found():
+    raise ClientResponseError(None, (), status=404)
+
+
+class TestCircuitBreaker(IsolatedAsyncioTestCase):
+
+    async def test_opens_then_probes(self):
+        """test that the circuit opens after consecutive failures, then closes after a successful probe"""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout_seconds=30)
+        with patch("auxify.external.circuit_breaker.time.monotonic", return_value=100.0):
+            for _ in range(2):
+                with self.assertRaises(ClientConnectionError):
+                    await breaker.call(fail)
+            self.assertEqual(breaker.state, OPEN)
+            with self.assertRaises(CircuitOpen) as raised:
+                await breaker.call(succeed)
+            self.assertEqual(raised.exception.retry_after, 30)
+
+        with patch("auxify.external.circuit_breaker.time.monotonic", return_value=131.0):
+            self.assertEqual(await breaker.call(succeed), "ok")
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    async def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_seconds=30)
+        with patch("auxify.external.circuit_breaker.time.monotonic", return_value=100.0):
+            with self.assertRaises(ClientConnectionError):
+                await breaker.call(fail)
+        with patch("auxify.external.circuit_breaker.time.monotonic", return_value=131.0):
+            with self.assertRaises(ClientConnectionError):
+                await breaker.call(fail)
+            self.assertEqual(breaker.state, OPEN)
+            with self.assertRaises(CircuitOpen):
+                await breaker.call(succeed)
+
+    async def test_client_errors_do_not_count(self):
+        """test that Spotify rejecting a request is not treated as Spotify failing"""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_seconds=30)
+        with self.assertRaises(ClientResponseError):
+            await breaker.call(not_found)
+        self.assertEqual(breaker.state, CLOSED)
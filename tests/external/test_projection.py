@@ -0,0 +1,30 @@
+from unittest import TestCase
+import rapidjson
+
+from auxify.controllers.rooms import extract_relevant_data_from_search_results
+from auxify.external.projection import project_search_response
+
+
+class TestProjectSearchResponse(TestCase):
+
+    def test_matches_full_decode(self):
+        """test that projecting a response gives the same results as decoding it in full"""
+        artist = {"type": "artist", "name": "Daft Punk", "id": "a1", "uri": "spotify:artist:a1", "external_urls": {}}
+        response = rapidjson.dumps({"tracks": {"total": 3, "items": [
+            {
+                "type": "track", "name": "One More Time", "uri": "spotify:track:1", "is_playable": True,
+                "artists": [artist], "available_markets": ["GB", "US"],
+                "album": {"type": "album", "name": "Discovery", "artists": [artist], "images": [{"url": "x", "height": 64}]},
+                "linked_from": {"type": "track", "uri": "spotify:track:0", "id": "0"}
+            },
+            {"type": "track", "name": "Unplayable", "uri": "spotify:track:2", "is_playable": False, "artists": [artist]},
+            {"type": "track", "name": "No album", "uri": "spotify:track:3", "is_playable": True, "artists": []}
+        ]}}).encode()
+
+        projected = project_search_response(response)
+        self.assertEqual(projected, extract_relevant_data_from_search_results(rapidjson.loads(response)))
+        self.assertEqual([track["uri"] for track in projected], ["spotify:track:1", "spotify:track:3"])
+        self.assertEqual(projected[0]["images"], [{"url": "x", "height": 64}])
+
+    def test_empty_response(self):
+        self.assertEqual(project_search_response(b"{}"), [])
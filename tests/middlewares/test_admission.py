@@ -0,0 +1,50 @@
+from unittest import IsolatedAsyncioTestCase
+import asyncio
+
+from auxify.middlewares.admission import AdmissionController
+
+
+class TestAdmissionController(IsolatedAsyncioTestCase):
+
+    async def test_queues_then_sheds(self):
+        """test that requests beyond the concurrency limit wait, and those beyond the queue are shed"""
+        controller = AdmissionController(concurrency=1, max_queue=1, queue_timeout_seconds=1)
+        self.assertTrue(await controller.acquire())
+
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(controller.stats()["queued"], 1)
+        self.assertFalse(await controller.acquire())
+        self.assertEqual(controller.stats()["shed"], 1)
+
+        controller.release()
+        self.assertTrue(await queued)
+        self.assertEqual(controller.stats(), {"in_flight": 1, "queued": 0, "shed": 1, "timed_out": 0})
+
+    async def test_queued_requests_time_out(self):
+        """test that a request waiting longer than the queue timeout is refused"""
+        controller = AdmissionController(concurrency=1, max_queue=5, queue_timeout_seconds=0.01)
+        self.assertTrue(await controller.acquire())
+        self.assertFalse(await controller.acquire())
+        self.assertEqual(controller.stats()["timed_out"], 1)
+        self.assertEqual(controller.stats()["queued"], 0)
+
+        controller.release()
+        self.assertTrue(await controller.acquire())
+
+    async def test_cancelled_request_does_not_keep_a_slot(self):
+        """test that a slot handed to a queued request as it is cancelled is released"""
+        controller = AdmissionController(concurrency=1, max_queue=5, queue_timeout_seconds=1)
+        self.assertTrue(await controller.acquire())
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        controller.release()
+        # the slot is acquired for the queued request, which is cancelled before it resumes
+        await asyncio.sleep(0)
+        queued.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await queued
+
+        self.assertEqual(controller.stats()["in_flight"], 0)
+        self.assertTrue(await asyncio.wait_for(controller.acquire(), 0.1))
@@ -0,0 +1,40 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+import asyncio
+import time
+
+from auxify.middlewares.loop_monitor import BlockingCallDetector, LoopLagSampler
+
+
+class TestLoopLagSampler(TestCase):
+
+    def test_reports_percentiles(self):
+        """test that lag percentiles are taken over the retained window of samples"""
+        sampler = LoopLagSampler(interval_seconds=0.1, window=100)
+        self.assertIsNone(sampler.stats())
+        for lag_ms in range(1, 201):
+            sampler.record(lag_ms / 1000)
+
+        stats = sampler.stats()
+        self.assertEqual(stats["samples"], 100)
+        self.assertEqual(stats["p50_ms"], 150)
+        self.assertEqual(stats["p99_ms"], 199)
+        self.assertEqual(stats["max_ms"], 200)
+
+
+class TestBlockingCallDetector(IsolatedAsyncioTestCase):
+
+    async def test_reports_blocking_call_with_route(self):
+        """test that a callback blocking the loop is reported once, with the route of the request running it"""
+        detector = BlockingCallDetector(threshold_seconds=0.05, check_interval_seconds=0.01)
+        detector.start(asyncio.get_running_loop())
+        try:
+            detector.routes[asyncio.current_task()] = "PUT /rooms/{room_id}/queue"
+            with self.assertLogs("auxify.middlewares.loop_monitor", "WARNING") as logs:
+                time.sleep(0.2)
+                await asyncio.sleep(0.05)
+        finally:
+            detector.stop()
+
+        self.assertEqual(detector.reported, 1)
+        self.assertIn("PUT /rooms/{room_id}/queue", logs.output[0])
+        self.assertIn("time.sleep(0.2)", logs.output[0])
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from auxify.middlewares.rate_limit import TokenBucketLimiter, RateLimiter
+
+
+class TestTokenBucketLimiter(TestCase):
+
+    def test_burst_then_refill(self):
+        """test that a key may spend its burst at once, then must wait for tokens to refill"""
+        limiter = TokenBucketLimiter(rate=2, burst=3, maxsize=10)
+        self.assertEqual([limiter.acquire("a", now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("a", now=0), 0.5)
+        self.assertEqual(limiter.acquire("a", now=0.5), 0)
+
+    def test_keys_are_independent(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1, maxsize=10)
+        self.assertEqual(limiter.acquire("a", now=0), 0)
+        self.assertEqual(limiter.acquire("b", now=0), 0)
+        self.assertGreater(limiter.acquire("a", now=0), 0)
+
+    def test_idle_and_excess_buckets_evicted(self):
+        """test that refilled buckets are dropped and the number of buckets stays bounded"""
+        limiter = TokenBucketLimiter(rate=1, burst=2, maxsize=100)
+        for key in range(50):
+            limiter.acquire(key, now=0)
+        limiter.acquire("late", now=10)
+        self.assertEqual(len(limiter), 1)
+
+        bounded = TokenBucketLimiter(rate=1, burst=2, maxsize=10)
+        for key in range(50):
+            bounded.acquire(key, now=0)
+        self.assertEqual(len(bounded), 10)
+
+
+class TestRateLimiter(TestCase):
+
+    def test_room_limit_shared_between_users(self):
+        """test that the room limit applies across users, and unlisted routes are not limited"""
+        rate_limiter = RateLimiter({
+            "max_buckets": 100,
+            "routes": {"/rooms/{room_id}/search": {"user": {"rate": 1, "burst": 5}, "room": {"rate": 1, "burst": 2}}}
+        })
+        route = "/rooms/{room_id}/search"
+        self.assertEqual(rate_limiter.check(route, "user-1", "7"), 0)
+        self.assertEqual(rate_limiter.check(route, "user-2", "7"), 0)
+        self.assertGreater(rate_limiter.check(route, "user-3", "7"), 0)
+        self.assertEqual(rate_limiter.check(route, "user-3", "8"), 0)
+        self.assertEqual(rate_limiter.check("/me", "user-1", None), 0)
+
+    def test_room_rejections_do_not_cost_the_user(self):
+        """test that requests rejected by the room limit leave the user's tokens for other rooms"""
+        rate_limiter = RateLimiter({
+            "max_buckets": 100,
+            "routes": {"/rooms/{room_id}/search": {"user": {"rate": 0.01, "burst": 2}, "room": {"rate": 0.01, "burst": 1}}}
+        })
+        route = "/rooms/{room_id}/search"
+        self.assertEqual(rate_limiter.check(route, "user-1", "7"), 0)
+        for _ in range(5):
+            self.assertGreater(rate_limiter.check(route, "user-1", "7"), 0)
+        self.assertEqual(rate_limiter.check(route, "user-1", "8"), 0)
+
+    def test_client_address_from_trusted_proxies_only(self):
+        """test that X-Forwarded-For gives the client address only when a trusted proxy sent it"""
+        rate_limiter = RateLimiter({"max_buckets": 100, "routes": {}, "trusted_proxies": ["127.0.0.1", "10.0.0.2"]})
+        self.assertEqual(rate_limiter.client_address("127.0.0.1", "203.0.113.7"), "203.0.113.7")
+        # the client may send its own header, which the proxies append to
+        self.assertEqual(rate_limiter.client_address("127.0.0.1", "1.2.3.4, 203.0.113.7, 10.0.0.2"), "203.0.113.7")
+        self.assertEqual(rate_limiter.client_address("127.0.0.1", None), "127.0.0.1")
+        self.assertEqual(rate_limiter.client_address("198.51.100.1", "203.0.113.7"), "198.51.100.1")
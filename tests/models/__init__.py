@@ -29,6 +29,9 @@ class ModelTest:
     @classmethod
     def tearDownClass(cls):
         os.remove(cls.db_name)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(cls.db_name + suffix):
+                os.remove(cls.db_name + suffix)
         cls.test_user = None
 
     async def get_or_create_user(self):
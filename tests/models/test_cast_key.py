@@ -0,0 +1,27 @@
+from unittest.async_case import IsolatedAsyncioTestCase
+import sqlite3
+
+from auxify.models import cast_key
+
+
+class TestCastKey(IsolatedAsyncioTestCase):
+
+    async def test_casts_dicts(self):
+        @cast_key("active", bool)
+        async def get_room():
+            return {"room_id": 1, "active": 1}
+
+        self.assertIs(True, (await get_room())["active"])
+
+    async def test_rows_not_copied_into_dicts_raise(self):
+        """test that a sqlite3.Row is not returned as if it had been cast"""
+        db = sqlite3.connect(":memory:")
+        db.row_factory = sqlite3.Row
+
+        @cast_key("active", bool)
+        async def get_room():
+            return db.execute("SELECT 1 AS room_id, 1 AS active").fetchone()
+
+        with self.assertRaises(TypeError):
+            await get_room()
+        db.close()
@@ -0,0 +1,44 @@
+from . import ModelTest
+from auxify.models import maintenance, rooms
+import aiosqlite
+from unittest.async_case import IsolatedAsyncioTestCase
+
+class TestMaintenance(ModelTest, IsolatedAsyncioTestCase):
+
+    async def test_schema_enables_wal_and_incremental_vacuum(self):
+        """test that databases created from the schema support checkpoints and incremental vacuum"""
+        async with aiosqlite.connect(self.db_name) as db:
+            model = maintenance.MaintenancePersistence(db)
+            self.assertEqual(await model.journal_mode(), "wal")
+            self.assertEqual(await model.auto_vacuum_mode(), maintenance.AUTO_VACUUM_INCREMENTAL)
+
+    async def test_incremental_vacuum_reclaims_free_pages(self):
+        """test that pages freed by deleting rows are returned by incremental vacuum"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            model = maintenance.MaintenancePersistence(db)
+            for i in range(200):
+                await room_model.create_room(user_id, "code" * 50, f"room {i}" * 20)
+            await db.execute("DELETE FROM room WHERE room_name LIKE 'room%'")
+            await db.commit()
+            await model.wal_checkpoint("TRUNCATE")
+
+            before = await model.page_stats()
+            self.assertGreater(before["freelist_count"], 0)
+
+            freed = await model.incremental_vacuum(before["freelist_count"])
+            after = await model.page_stats()
+            self.assertEqual(freed, before["freelist_count"])
+            self.assertEqual(after["freelist_count"], 0)
+
+    async def test_optimize_and_checkpoint(self):
+        """test that optimize and checkpoints run against a live database"""
+        async with aiosqlite.connect(self.db_name) as db:
+            model = maintenance.MaintenancePersistence(db)
+            await model.optimize(analysis_limit=100)
+            result = await model.wal_checkpoint()
+            self.assertFalse(result["busy"])
+            with self.assertRaises(Exception):
+                await model.wal_checkpoint("NOT_A_MODE")
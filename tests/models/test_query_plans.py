@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import unittest
+
+from benchmarks.query_plans import ALLOWED_SCANS, extract_statements, query_plan, unindexed_scans
+
+class TestQueryPlans(unittest.TestCase):
+    """Every statement in auxify/models must use an index on room, room_member, user and spotify_token"""
+    db_name = "test_query_plans.db"
+
+    @classmethod
+    def setUpClass(cls):
+        if os.path.exists(cls.db_name):
+            os.remove(cls.db_name)
+        # populated and analyzed, so the planner chooses as it would in production
+        subprocess.run(
+            [sys.executable, "schema/recreate_db.py", cls.db_name, "--users", "2000", "--rooms", "500", "--seed", "1"],
+            check=True, stdout=subprocess.DEVNULL)
+        cls.db = sqlite3.connect(cls.db_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.db_name + suffix):
+                os.remove(cls.db_name + suffix)
+
+    def test_statements_are_extracted(self):
+        locations = [statement.location for statement in extract_statements()]
+        self.assertTrue(any(location.startswith("auxify/models/rooms.py") for location in locations))
+        # f-strings with interpolated placeholders are included
+        self.assertTrue(any(":interpolated_" in statement.sql for statement in extract_statements()))
+
+    def test_no_unindexed_scans(self):
+        for statement in extract_statements():
+            if statement.location in ALLOWED_SCANS:
+                continue
+            with self.subTest(statement.location):
+                self.assertEqual([], unindexed_scans(query_plan(self.db, statement.sql)))
+
+    def test_detects_unindexed_scans(self):
+        plan = query_plan(self.db, "SELECT user_id FROM user LEFT JOIN room ON room.room_name = user.email WHERE user_id = :user_id")
+        self.assertEqual(1, len(unindexed_scans(plan)))
+        self.assertEqual([], unindexed_scans(query_plan(self.db, "SELECT * FROM user WHERE email = :email")))
@@ -0,0 +1,69 @@
+from . import ModelTest
+from auxify.models import rooms, room_archive
+import aiosqlite
+from unittest.async_case import IsolatedAsyncioTestCase
+
+class TestRoomArchive(ModelTest, IsolatedAsyncioTestCase):
+
+    async def _age_deactivation(self, db, room_id: int, days: int):
+        await db.execute(
+            "UPDATE room SET deactivated_at = datetime('now', :age) WHERE room_id = :room_id",
+            {"age": f"-{days} days", "room_id": room_id})
+        await db.commit()
+
+    async def test_archives_old_inactive_rooms_and_members(self):
+        """test that long-inactive rooms and their members are moved out of the hot tables,
+        while RoomPersistence still finds them"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        other_user = await self.random_new_user()
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            archive_model = room_archive.RoomArchivePersistence(db)
+
+            old_room_id = await room_model.create_room(user_id, "test_room_code", "test_room_name")
+            await room_model.add_user_to_room(old_room_id, other_user["user_id"])
+            new_room_id = await room_model.create_room(user_id, "test_room_code_2", "test_room_name_2")
+            await self._age_deactivation(db, old_room_id, 30)
+
+            room_ids = await archive_model.get_archivable_room_ids(7, 100)
+            self.assertIn(old_room_id, room_ids)
+            self.assertNotIn(new_room_id, room_ids)
+            archived = await archive_model.archive_rooms(room_ids)
+            self.assertEqual(archived, len(room_ids))
+
+            cursor = await db.execute("SELECT COUNT(*) FROM room_member WHERE room_id = ?", (old_room_id,))
+            self.assertEqual((await cursor.fetchone())[0], 0)
+
+            room = await room_model.get_room(old_room_id)
+            self.assertEqual(room["room_id"], old_room_id)
+            self.assertFalse(room["active"])
+            self.assertTrue(await room_model.check_user_in_room(other_user["user_id"], old_room_id))
+
+    async def test_recently_deactivated_rooms_not_archived(self):
+        """test that rooms deactivated within the inactivity window stay in the hot tables"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            archive_model = room_archive.RoomArchivePersistence(db)
+
+            room_id = await room_model.create_room(user_id, "test_room_code", "test_room_name")
+            await room_model.create_room(user_id, "test_room_code_2", "test_room_name_2")
+            await self._age_deactivation(db, room_id, 3)
+
+            self.assertNotIn(room_id, await archive_model.get_archivable_room_ids(7, 100))
+
+    async def test_highest_room_id_never_archived(self):
+        """test that the newest room is kept so its id can not be reused"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            archive_model = room_archive.RoomArchivePersistence(db)
+
+            room_id = await room_model.create_room(user_id, "test_room_code", "test_room_name")
+            await room_model.deactivate_room(room_id)
+            await self._age_deactivation(db, room_id, 30)
+
+            self.assertNotIn(room_id, await archive_model.get_archivable_room_ids(7, 100))
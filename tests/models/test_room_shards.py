@@ -0,0 +1,81 @@
+from auxify.models import rooms
+from auxify.models.shards import RoomShards, ShardConnections
+from auxify.models.write_coalescer import WriteCoalescer
+from unittest.async_case import IsolatedAsyncioTestCase
+import aiosqlite
+import os
+import sqlite3
+
+SHARDS = ["test_shard_0.db", "test_shard_1.db", "test_shard_2.db"]
+
+
+class TestRoomShards(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        with open("schema/schema.sql") as schema:
+            contents = schema.read()
+        for location in SHARDS:
+            if os.path.exists(location):
+                os.remove(location)
+            with sqlite3.connect(location) as db:
+                db.executescript(contents)
+        self.shards = RoomShards(SHARDS)
+
+    def tearDown(self):
+        for location in SHARDS:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(location + suffix):
+                    os.remove(location + suffix)
+
+    def _rooms_in(self, location):
+        with sqlite3.connect(location) as db:
+            return [row[0] for row in db.execute("SELECT room_id FROM room ORDER BY room_id")]
+
+    async def test_rooms_are_created_in_their_owners_shard(self):
+        async with self.shards.connect() as db:
+            room_model = rooms.RoomPersistence(db)
+            created = {owner: await room_model.create_room(owner, None, f"room {owner}") for owner in (3, 4, 5, 7)}
+            # creating another room deactivates the owner's previous one, in the same shard
+            second = await room_model.create_room(4, None, "another room")
+            self.assertFalse((await room_model.get_room(created[4]))["active"])
+            self.assertEqual(second, (await room_model.get_room_by_owner(4))["room_id"])
+
+        for owner, room_id in created.items():
+            self.assertEqual(owner % 3, room_id % 3)
+            self.assertIn(room_id, self._rooms_in(SHARDS[owner % 3]))
+        self.assertEqual(sorted([created[4], created[7], second]), self._rooms_in(SHARDS[1]))
+
+    async def test_user_queries_fan_out(self):
+        user_id = 100
+        async with self.shards.connect() as db:
+            room_model = rooms.RoomPersistence(db)
+            room_ids = [await room_model.create_room(owner, None, f"room {owner}") for owner in (1, 2, 3)]
+            for room_id in room_ids:
+                await room_model.add_user_to_room(room_id, user_id)
+
+            joined = await room_model.get_joined_rooms_by_user(user_id)
+            self.assertEqual(set(room_ids), {room["room_id"] for room in joined})
+            self.assertEqual(set(room_ids), await room_model.get_joined_room_ids(user_id, room_ids + [999]))
+            self.assertEqual(set(room_ids), {room["room_id"] for room in await room_model.get_rooms(room_ids + [999])})
+
+            self.assertEqual(3, await room_model.deactivate_rooms(room_ids))
+            self.assertEqual([], await room_model.get_joined_rooms_by_user(user_id))
+
+    async def test_write_ops_run_against_one_shard(self):
+        async with self.shards.connect() as db:
+            room_id = await rooms.RoomPersistence(db).create_room(2, None, "room")
+
+        shard = self.shards.of_room(room_id)
+        coalescer = WriteCoalescer(SHARDS[shard], max_batch=10, max_delay_seconds=0)
+        try:
+            await coalescer.write(
+                lambda db: rooms.RoomPersistence(ShardConnections.single(db, shard, 3)).add_user_to_room(room_id, 50))
+            with self.assertRaises(Exception):
+                await coalescer.write(
+                    lambda db: rooms.RoomPersistence(ShardConnections.single(db, shard, 3)).add_user_to_room(room_id + 1, 50))
+        finally:
+            await coalescer.close()
+
+        async with aiosqlite.connect(SHARDS[shard]) as db:
+            db.row_factory = aiosqlite.Row
+            self.assertTrue(await rooms.RoomPersistence(ShardConnections.single(db, shard, 3)).check_user_in_room(50, room_id))
@@ -2,6 +2,7 @@ from . import ModelTest
 from auxify.models import rooms, users
 import aiosqlite
 from unittest.async_case import IsolatedAsyncioTestCase
+import time
 
 class TestRooms(ModelTest, IsolatedAsyncioTestCase):
 
@@ -64,6 +65,25 @@ class TestRooms(ModelTest, IsolatedAsyncioTestCase):
             is_user_in_room = await room_model.check_user_in_room(other_user["user_id"], room_id)
             self.assertTrue(is_user_in_room)
 
+    async def test_add_user_to_active_room_only(self):
+        """tests that users are only added to rooms that are still active"""
+        owner = await self.random_new_user()
+        other_user = await self.random_new_user()
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+
+            room_id = await room_model.create_room(owner["user_id"], None, "test_room_name")
+            self.assertTrue(await room_model.add_user_to_active_room(room_id, other_user["user_id"]))
+            # joining again is not an error
+            self.assertTrue(await room_model.add_user_to_active_room(room_id, other_user["user_id"]))
+
+            await room_model.deactivate_room(room_id)
+            late_user = await self.random_new_user()
+            self.assertFalse(await room_model.add_user_to_active_room(room_id, late_user["user_id"]))
+            self.assertFalse(await room_model.check_user_in_room(late_user["user_id"], room_id))
+            self.assertFalse(await room_model.add_user_to_active_room(room_id + 1000, late_user["user_id"]))
+
     async def test_user_not_in_room(self):
         """tests check_user_in_room does not assume new users are in rooms"""
         user_id = (await self.get_or_create_user())["user_id"]
@@ -168,4 +188,49 @@ class TestRooms(ModelTest, IsolatedAsyncioTestCase):
 
             joined_rooms = await room_model.get_joined_rooms_by_user(other_user["user_id"])
             self.assertFalse(any(room["room_id"] == new_room_id for room in joined_rooms))
-            
\ No newline at end of file
+            
+    async def test_stale_rooms_expire(self):
+        """test that active rooms with no activity within the TTL are found and deactivated in bulk"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        other_user = await self.random_new_user()
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+
+            stale_room_id = await room_model.create_room(user_id, "test_room_code", "test_room_name")
+            fresh_room_id = await room_model.create_room(other_user["user_id"], "test_room_code_2", "test_room_name_2")
+            await db.execute(
+                "UPDATE room SET last_active_at = datetime('now', '-2 days') WHERE room_id IN (?, ?)",
+                (stale_room_id, fresh_room_id))
+            await db.commit()
+            await room_model.touch_rooms({fresh_room_id: time.time()})
+
+            stale_room_ids = await room_model.get_stale_room_ids(24 * 60 * 60, 100)
+            self.assertIn(stale_room_id, stale_room_ids)
+            self.assertNotIn(fresh_room_id, stale_room_ids)
+
+            deactivated = await room_model.deactivate_rooms(stale_room_ids)
+            self.assertEqual(deactivated, len(stale_room_ids))
+            self.assertFalse((await room_model.get_room(stale_room_id))["active"])
+            self.assertTrue((await room_model.get_room(fresh_room_id))["active"])
+
+    async def test_get_rooms_and_joined_room_ids(self):
+        """test looking up many rooms, and the user's memberships among them, at once"""
+        user_id = (await self.get_or_create_user())["user_id"]
+        other_user = await self.random_new_user()
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+
+            joined_room_id = await room_model.create_room(user_id, "test_room_code", "test_room_name")
+            other_room_id = await room_model.create_room(other_user["user_id"], None, "test_room_name_2")
+            await room_model.add_user_to_room(joined_room_id, other_user["user_id"])
+            missing_room_id = other_room_id + 1000
+
+            found = await room_model.get_rooms([joined_room_id, other_room_id, missing_room_id])
+            self.assertEqual({joined_room_id, other_room_id}, {room["room_id"] for room in found})
+            self.assertTrue(all(room["active"] is True for room in found))
+
+            joined = await room_model.get_joined_room_ids(other_user["user_id"], [joined_room_id, other_room_id])
+            self.assertEqual({joined_room_id}, joined)
+            self.assertEqual([], await room_model.get_rooms([]))
@@ -0,0 +1,94 @@
+from auxify.models import rooms
+from unittest.async_case import IsolatedAsyncioTestCase
+import aiosqlite
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+# the room table as first created, before any columns were added to it
+ORIGINAL_SCHEMA = """
+CREATE TABLE user (
+    user_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    UNIQUE (email)
+);
+CREATE TABLE room (
+    room_id INTEGER PRIMARY KEY,
+    owner_id INTEGER NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1 CHECK (active IN (0,1)),
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    room_code TEXT NULL DEFAULT NULL,
+    room_name TEXT NOT NULL,
+    FOREIGN KEY (owner_id) REFERENCES user (user_id)
+);
+CREATE TABLE room_member (
+    room_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (room_id, user_id)
+);
+INSERT INTO user (user_id, email, first_name, last_name, password_hash) VALUES (1, 'a@example.com', 'A', 'B', 'pwhash');
+INSERT INTO room (room_id, owner_id, created_at, room_name) VALUES (1, 1, '2020-01-01 00:00:00', 'old room');
+"""
+
+
+class TestSchemaMigration(IsolatedAsyncioTestCase):
+    db_name = "test_schema_migration.db"
+
+    def setUp(self):
+        self._remove()
+        with sqlite3.connect(self.db_name) as db:
+            db.executescript(ORIGINAL_SCHEMA)
+        subprocess.run([sys.executable, "schema/recreate_db.py", self.db_name], check=True, stdout=subprocess.DEVNULL)
+
+    def tearDown(self):
+        self._remove()
+
+    def _remove(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_existing_database_gets_new_columns_and_indexes(self):
+        with sqlite3.connect(self.db_name) as db:
+            columns = {row[1] for row in db.execute("PRAGMA table_info(room)")}
+            indexes = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("deactivated_at", columns)
+        self.assertIn("last_active_at", columns)
+        self.assertIn("idx_room_active_last_active_at", indexes)
+        self.assertIn("idx_room_active_deactivated_at", indexes)
+        self.assertIn("idx_room_member_user", indexes)
+        self.assertIn("idx_spotify_token_user", indexes)
+
+    async def test_rooms_can_be_created_and_deactivated(self):
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            room_id = await room_model.create_room(1, None, "new room")
+            self.assertFalse((await room_model.get_room(1))["active"])
+            await room_model.deactivate_room(room_id)
+            self.assertFalse((await room_model.get_room(room_id))["active"])
+
+    def test_migrating_twice_changes_nothing(self):
+        with sqlite3.connect(self.db_name) as db:
+            before = list(db.execute("PRAGMA table_info(room)"))
+        subprocess.run([sys.executable, "schema/recreate_db.py", self.db_name], check=True, stdout=subprocess.DEVNULL)
+        with sqlite3.connect(self.db_name) as db:
+            self.assertEqual(before, list(db.execute("PRAGMA table_info(room)")))
+
+    async def test_room_activity_is_backfilled_and_recorded(self):
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            # the existing room's activity starts from its creation
+            self.assertEqual([1], await room_model.get_stale_room_ids(60, 10))
+
+            room_id = await room_model.create_room(1, None, "new room")
+            self.assertEqual([], await room_model.get_stale_room_ids(60, 10))
+            await room_model.touch_rooms({room_id: time.time() + 60})
+            cursor = await db.execute("SELECT last_active_at > datetime('now') FROM room WHERE room_id = ?", (room_id,))
+            self.assertTrue((await cursor.fetchone())[0])
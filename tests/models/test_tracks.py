@@ -0,0 +1,53 @@
+from . import ModelTest
+from auxify.models import tracks
+import aiosqlite
+from unittest.async_case import IsolatedAsyncioTestCase
+
+def _track(uri, name="Track"):
+    return {
+        "uri": uri,
+        "name": name,
+        "artists": [{"name": "Artist"}],
+        "images": [{"url": "https://example.com/image.jpg", "height": 64, "width": 64}]
+    }
+
+class TestTracks(ModelTest, IsolatedAsyncioTestCase):
+
+    async def test_upsert_and_get_tracks(self):
+        """test that stored tracks are returned by uri with their artists and images"""
+        async with aiosqlite.connect(self.db_name) as db:
+            model = tracks.TrackPersistence(db)
+            await model.upsert_tracks([_track("spotify:track:a"), _track("spotify:track:b")])
+
+            stored = await model.get_tracks_by_uri(["spotify:track:a", "spotify:track:b", "spotify:track:missing"])
+            self.assertEqual(set(stored), {"spotify:track:a", "spotify:track:b"})
+            self.assertEqual(stored["spotify:track:a"], _track("spotify:track:a"))
+
+    async def test_upsert_updates_existing_track(self):
+        async with aiosqlite.connect(self.db_name) as db:
+            model = tracks.TrackPersistence(db)
+            await model.upsert_tracks([_track("spotify:track:c", "Old name")])
+            await model.upsert_tracks([_track("spotify:track:c", "New name")])
+
+            stored = await model.get_tracks_by_uri(["spotify:track:c"])
+            self.assertEqual(stored["spotify:track:c"]["name"], "New name")
+
+    async def test_get_missing_uris(self):
+        """test that only uris with no stored track are reported missing, in order and without duplicates"""
+        async with aiosqlite.connect(self.db_name) as db:
+            model = tracks.TrackPersistence(db)
+            await model.upsert_tracks([_track("spotify:track:d")])
+
+            missing = await model.get_missing_uris(
+                ["spotify:track:e", "spotify:track:d", "spotify:track:f", "spotify:track:e"])
+            self.assertEqual(missing, ["spotify:track:e", "spotify:track:f"])
+
+    async def test_lookup_many_uris(self):
+        """test lookups of more uris than fit in a single query"""
+        uris = [f"spotify:track:{i}" for i in range(tracks.MAX_URIS_PER_QUERY + 20)]
+        async with aiosqlite.connect(self.db_name) as db:
+            model = tracks.TrackPersistence(db)
+            await model.upsert_tracks([_track(uri) for uri in uris])
+
+            self.assertEqual(len(await model.get_tracks_by_uri(uris)), len(uris))
+            self.assertEqual(await model.get_missing_uris(uris), [])
@@ -1,5 +1,6 @@
 from . import ModelTest
-from auxify.models import users
+from auxify.models import users, spotify_token
+from datetime import datetime
 import aiosqlite
 from sqlite3 import IntegrityError
 from unittest.async_case import IsolatedAsyncioTestCase
@@ -70,4 +71,27 @@ class TestUsers(ModelTest, IsolatedAsyncioTestCase):
             db.row_factory = aiosqlite.Row
             user_model = users.UsersPersistence(db)
             stored_data = await user_model.get_user_by_email("blahblahblahfakeblah")
-            self.assertEqual(stored_data, {})
\ No newline at end of file
+            self.assertEqual(stored_data, {})
+
+    async def test_get_user_with_token_state(self):
+        """test that token presence and expiry are read along with the user, and not the token itself"""
+        user = await self.random_new_user()
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            user_model = users.UsersPersistence(db)
+            stored_data = await user_model.get_user_with_token_state(user["user_id"])
+            self.assertEqual(stored_data["email"], user["email"])
+            self.assertFalse(stored_data["has_token"])
+            self.assertIsNone(stored_data["token_created_at"])
+
+            created_at = datetime.now()
+            await spotify_token.SpotifyTokenPersistence(db).upsert_token(
+                user["user_id"], f"spotify{user['user_id']}", "access", None, created_at, 3600)
+            stored_data = await user_model.get_user_with_token_state(user["user_id"])
+            self.assertTrue(stored_data["has_token"])
+            self.assertTrue(stored_data["has_access_token"])
+            self.assertFalse(stored_data["has_refresh_token"])
+            self.assertEqual(stored_data["token_created_at"], created_at)
+            self.assertEqual(stored_data["token_duration_seconds"], 3600)
+            self.assertNotIn("access_token", stored_data)
+            self.assertNotIn("password_hash", stored_data)
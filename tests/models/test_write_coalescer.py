@@ -0,0 +1,87 @@
+from . import ModelTest
+from auxify.models import rooms, users
+from auxify.models.write_coalescer import WriteCoalescer
+import asyncio
+import aiosqlite
+from sqlite3 import IntegrityError
+from unittest.async_case import IsolatedAsyncioTestCase
+
+class TestWriteCoalescer(ModelTest, IsolatedAsyncioTestCase):
+
+    async def test_concurrent_writes_share_a_batch(self):
+        user_id = (await self.get_or_create_user())["user_id"]
+        members = [await self.random_new_user() for _ in range(5)]
+        async with aiosqlite.connect(self.db_name) as db:
+            room_id = await rooms.RoomPersistence(db).create_room(user_id, None, "coalesced")
+
+        coalescer = WriteCoalescer(self.db_name, max_batch=100, max_delay_seconds=0.01)
+        try:
+            await asyncio.gather(*[
+                coalescer.write(lambda db, member_id=member["user_id"]: rooms.RoomPersistence(db).add_user_to_room(room_id, member_id))
+                for member in members
+            ])
+        finally:
+            await coalescer.close()
+
+        self.assertEqual(1, coalescer.batches)
+        self.assertEqual(5, coalescer.largest_batch)
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            room_model = rooms.RoomPersistence(db)
+            for member in members:
+                self.assertTrue(await room_model.check_user_in_room(member["user_id"], room_id))
+
+    async def test_failed_write_does_not_affect_the_batch(self):
+        new_user = {
+            "first_name": "Batch",
+            "last_name": "User",
+            "email": "batch@example.com",
+            "password_hash": "pwhash"
+        }
+        duplicate = {**new_user, "first_name": "Duplicate"}
+        other_user = {**new_user, "email": "other-batch@example.com"}
+
+        coalescer = WriteCoalescer(self.db_name, max_batch=100, max_delay_seconds=0.01)
+        try:
+            results = await asyncio.gather(
+                coalescer.write(lambda db: users.UsersPersistence(db).create_user(**new_user)),
+                coalescer.write(lambda db: users.UsersPersistence(db).create_user(**duplicate)),
+                coalescer.write(lambda db: users.UsersPersistence(db).create_user(**other_user)),
+                return_exceptions=True
+            )
+        finally:
+            await coalescer.close()
+
+        self.assertEqual(1, coalescer.batches)
+        self.assertIsInstance(results[1], IntegrityError)
+        async with aiosqlite.connect(self.db_name) as db:
+            db.row_factory = aiosqlite.Row
+            user_model = users.UsersPersistence(db)
+            self.assertEqual("Batch", (await user_model.get_user_by_id(results[0]))["first_name"])
+            self.assertEqual(other_user["email"], (await user_model.get_user_by_id(results[2]))["email"])
+
+    async def test_max_batch(self):
+        coalescer = WriteCoalescer(self.db_name, max_batch=2, max_delay_seconds=0)
+        try:
+            await asyncio.gather(*[
+                coalescer.write(lambda db, i=i: db.execute("UPDATE user SET first_name = first_name WHERE user_id = ?", (i,)))
+                for i in range(5)
+            ])
+        finally:
+            await coalescer.close()
+
+        self.assertEqual(3, coalescer.batches)
+        self.assertEqual(2, coalescer.largest_batch)
+
+    async def test_writes_fail_when_the_database_cannot_be_opened(self):
+        coalescer = WriteCoalescer("no_such_directory/test.db", max_batch=10, max_delay_seconds=0)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*[
+                coalescer.write(lambda db: db.execute("SELECT 1")) for _ in range(3)
+            ], return_exceptions=True), 5)
+        finally:
+            await coalescer.close()
+
+        self.assertTrue(all(isinstance(result, Exception) for result in results))
+        self.assertEqual(1, coalescer.failed_batches)
+        self.assertEqual(3, coalescer.failed_writes)
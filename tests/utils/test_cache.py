@@ -0,0 +1,41 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from auxify.utils.cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        """test that the cache never grows past maxsize, evicting the least recently used entry"""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_entries_expire(self):
+        """test that entries are not returned once their ttl has passed"""
+        cache = TTLCache(maxsize=10, ttl_seconds=5)
+        with patch("auxify.utils.cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl_seconds=60)
+        with patch("auxify.utils.cache.time.monotonic", return_value=106.0):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_peek_leaves_order_and_stats(self):
+        """test that peeking does not count as a hit or keep an entry from eviction"""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertIsNone(cache.peek("missing"))
+        cache.set("c", 3)
+        self.assertIsNone(cache.peek("a"))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (0, 0))
@@ -0,0 +1,25 @@
+from unittest import TestCase
+from datetime import timedelta
+
+from auxify.utils import jwt
+
+
+class TestJwt(TestCase):
+    key = jwt.key_from_secret("c2VjcmV0c2VjcmV0c2VjcmV0c2VjcmV0c2VjcmV0MTI")
+
+    def test_invite_round_trip(self):
+        """test that an invite token carries the room id"""
+        invite = jwt.generate_invite_jwt(42, self.key)
+        claims = jwt.get_claims_from_jwt(invite, self.key, jwt.Aud.INVITE)
+        self.assertEqual(claims["sub"], "42")
+
+    def test_invite_is_not_a_login_token(self):
+        """test that an invite can not be used where a login token is expected"""
+        invite = jwt.generate_invite_jwt(42, self.key)
+        with self.assertRaises(Exception):
+            jwt.get_claims_from_jwt(invite, self.key, jwt.Aud.AUTH)
+
+    def test_expired_invite_rejected(self):
+        invite = jwt.generate_invite_jwt(42, self.key, duration=timedelta(minutes=-5))
+        with self.assertRaises(Exception):
+            jwt.get_claims_from_jwt(invite, self.key, jwt.Aud.INVITE)
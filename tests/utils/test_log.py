@@ -0,0 +1,98 @@
+import logging
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+from rapidjson import loads
+
+import queue
+
+from auxify.utils import log, metrics
+from auxify.utils.log import DeferredFormatQueueHandler, JsonFormatter, RepeatFilter
+
+
+def make_record(msg: str, *args, level: int = logging.ERROR, exc_info=None)-> logging.LogRecord:
+    return logging.LogRecord("auxify.test", level, __file__, 1, msg, args, exc_info)
+
+
+class TestRepeatFilter(TestCase):
+
+    def test_repeats_are_limited_per_window(self):
+        """test that only burst identical messages pass per window, and the next window reports how many were dropped"""
+        repeat_filter = RepeatFilter(window_seconds=60, burst=2)
+        with patch("auxify.utils.log.time.monotonic", return_value=100.0):
+            passed = [repeat_filter.filter(make_record("Bad token: %s", i)) for i in range(5)]
+            self.assertEqual(passed, [True, True, False, False, False])
+            self.assertTrue(repeat_filter.filter(make_record("Something else")))
+
+        with patch("auxify.utils.log.time.monotonic", return_value=161.0):
+            record = make_record("Bad token: %s", 5)
+            self.assertTrue(repeat_filter.filter(record))
+            self.assertEqual(record.suppressed, 3)
+            self.assertEqual(record.getMessage(), "Bad token: 5 (suppressed 3 similar messages)")
+
+
+class TestJsonFormatter(TestCase):
+
+    def test_formats_one_object_per_record(self):
+        """test that records are formatted as JSON, including any traceback"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record("Failed for user(id=%s)", 7, exc_info=sys.exc_info())
+
+        entry = loads(JsonFormatter().format(record))
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["logger"], "auxify.test")
+        self.assertEqual(entry["message"], "Failed for user(id=7)")
+        self.assertIn("ValueError: boom", entry["exc_info"])
+        self.assertNotIn("\n", JsonFormatter().format(record))
+
+
+class TestDeferredFormatQueueHandler(TestCase):
+
+    def test_message_resolved_when_enqueued(self):
+        """test that later changes to the arguments do not change the logged message"""
+        log_queue: queue.Queue = queue.Queue()
+        handler = DeferredFormatQueueHandler(log_queue)
+        room = {"active": True}
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            handler.emit(make_record("Room: %s", room, exc_info=sys.exc_info()))
+        room["active"] = False
+
+        record = log_queue.get_nowait()
+        self.assertEqual(record.getMessage(), "Room: {'active': True}")
+        self.assertIsNone(record.exc_text)
+        self.assertIn("ValueError: boom", JsonFormatter().format(record))
+
+    def test_records_dropped_when_queue_full(self):
+        metrics.reset()
+        log_queue: queue.Queue = queue.Queue(1)
+        handler = DeferredFormatQueueHandler(log_queue)
+        for i in range(3):
+            handler.emit(make_record("Message %s", i))
+        self.assertEqual(log_queue.qsize(), 1)
+        self.assertEqual(metrics.snapshot()["counters"]["log.dropped"], 2)
+
+
+class TestConfigureLogging(TestCase):
+
+    def setUp(self):
+        self.root_handlers = logging.getLogger().handlers[:]
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        log.stop_queue_logging()
+        root = logging.getLogger()
+        root.handlers[:] = self.root_handlers
+        root.setLevel(self.root_level)
+
+    def test_stream_logging_runs_no_listener(self):
+        """test that a process about to fork workers can log without a listener thread"""
+        log.configure_queue_logging(logging.INFO, json_format=False, repeat_window_seconds=60, repeat_burst=0, max_queued=10)
+        self.assertIsNotNone(log._listener)
+
+        log.configure_stream_logging(logging.INFO, json_format=True)
+        self.assertIsNone(log._listener)
+        self.assertEqual([logging.StreamHandler], [type(handler) for handler in logging.getLogger().handlers])
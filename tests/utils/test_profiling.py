@@ -0,0 +1,99 @@
+from unittest.async_case import IsolatedAsyncioTestCase
+import asyncio
+import os
+import pstats
+import rapidjson
+import tempfile
+from unittest.mock import patch
+
+from auxify.config import Config
+from auxify.utils.profiling import RequestProfiler
+
+
+async def _query():
+    await asyncio.sleep(0.05)
+
+
+async def _handler():
+    await _query()
+
+
+class TestRequestProfiler(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiler = RequestProfiler(self.directory.name, max_profiles=2, sample_rate=0.0, routes=[],
+                                        sample_interval_seconds=0.005)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def _profile(self, route: str):
+        profile = self.profiler.start("GET", route)
+        try:
+            await _handler()
+        finally:
+            self.profiler.finish(profile, f"GET {route}")
+        # written in the default executor
+        for _ in range(100):
+            if self.profiler.written and not self.profiler.active:
+                break
+            await asyncio.sleep(0.01)
+        return profile
+
+    async def test_profiles_record_awaits(self):
+        profile = await self._profile("/rooms/{room_id}")
+        files = self.profiler.list_profiles()[0]["files"]
+        self.assertEqual({f"{profile.name}.prof", f"{profile.name}.awaits"}, set(files))
+
+        stats = pstats.Stats(self.profiler.profile_path(f"{profile.name}.prof"))
+        self.assertTrue(any(function == "_handler" for _, _, function in stats.stats)) # type: ignore
+        with open(self.profiler.profile_path(f"{profile.name}.awaits")) as awaits: # type: ignore
+            lines = awaits.read().splitlines()
+        self.assertTrue(lines[0].startswith("# GET /rooms/{room_id}"))
+        # the sampled stacks reach the awaited sleep
+        self.assertTrue(any("_handler" in line and "_query" in line for line in lines[1:]))
+
+    async def test_only_the_most_recent_profiles_are_kept(self):
+        for route in ("/a", "/b", "/c"):
+            self.profiler.written = 0
+            await self._profile(route)
+            await asyncio.sleep(0.01)
+        self.assertEqual(["c", "b"], [profile["route"] for profile in self.profiler.list_profiles()])
+        self.assertEqual(4, len(os.listdir(self.directory.name)))
+
+    async def test_one_profile_at_a_time(self):
+        self.assertTrue(self.profiler.should_profile("/rooms", requested=True))
+        self.assertFalse(self.profiler.should_profile("/rooms", requested=False))
+        profile = self.profiler.start("GET", "/rooms")
+        self.assertFalse(self.profiler.should_profile("/rooms", requested=True))
+        self.profiler.finish(profile, "GET /rooms")
+
+    def test_profile_path_rejects_other_files(self):
+        with open(os.path.join(self.directory.name, "notes.txt"), "w"):
+            pass
+        self.assertIsNone(self.profiler.profile_path("notes.txt"))
+        self.assertIsNone(self.profiler.profile_path("../notes.prof"))
+        self.assertIsNone(self.profiler.profile_path("missing.prof"))
+
+
+class TestConfigRequestProfiler(IsolatedAsyncioTestCase):
+
+    def test_profiler_resolved_once(self):
+        """test that routes asking for the profiler on every request do not rebuild the profiling settings"""
+        with tempfile.TemporaryDirectory() as directory:
+            config_file = os.path.join(directory, "Config.json")
+            with open(config_file, "w") as outfile:
+                outfile.write(rapidjson.dumps({
+                    "spotify": {"client_id": "id", "secret": "secret", "redirect_url": "http://localhost/callback"},
+                    "jwt": {"secret": "secret"},
+                    "db": {"location": os.path.join(directory, "auxify.db")},
+                    "profiling": {"enabled": True}
+                }))
+            config = Config(config_file)
+
+        with patch.object(config, "profiling_settings", wraps=config.profiling_settings) as profiling_settings:
+            # no admin key, so no profiler
+            self.assertIsNone(config.request_profiler())
+            self.assertIsNone(config.request_profiler())
+        self.assertEqual(1, profiling_settings.call_count)